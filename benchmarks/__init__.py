@@ -0,0 +1 @@
+# Benchmarks for unifi_respondd
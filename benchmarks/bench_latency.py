@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""End-to-end latency benchmark of the responder on a synthetic fleet.
+
+Runs a ResponddClient on the IPv6 loopback that answers from a generated
+fleet of SITES sites with APS APs, and polls it with COLLECTORS concurrent
+mock collectors sending GET nodeinfo statistics neighbours at RATE polls per
+second each. Reports the request-to-last-packet latency percentiles, packets
+per poll and loss. To poll a responder that is already running, use
+python -m unifi_respondd.mock_collector instead.
+
+Usage: python -m benchmarks.bench_latency [--sites N] [--aps M] [--polls P]
+           [--rate R] [--collectors C] [--asyncio] [--refresh-interval S]
+           [--send-rate PPS] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+
+from benchmarks.bench_pipeline import mocked_controller
+from unifi_respondd import config, mock_collector
+from unifi_respondd.fleet import make_config, make_fleet
+from unifi_respondd.respondd_client import ResponddClient
+
+
+class LoopbackClient(ResponddClient):
+    """This class answers on a free port of the IPv6 loopback instead of the configured interface."""
+
+    def setupSocket(self):
+        self._sock.bind(("::1", 0))
+
+
+def serve_in_thread(client):
+    """Runs the asyncio responder of client in a thread.
+    Returns:
+        A function stopping it."""
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(client.serve())
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=run, name="responder", daemon=True)
+    thread.start()
+
+    def stop():
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+
+    return stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", type=int, default=10)
+    parser.add_argument("--aps", type=int, default=100, help="APs per site")
+    parser.add_argument("--clients", type=int, default=20, help="clients per AP")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--polls", type=int, default=20, help="per collector")
+    parser.add_argument("--rate", type=float, default=2.0, help="polls per second")
+    parser.add_argument("--collectors", type=int, default=1)
+    parser.add_argument("--idle", type=float, default=0.2, help="seconds")
+    parser.add_argument("--asyncio", action="store_true", help="asyncio responder")
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=60,
+        help="0 collects from the in-memory controller on every request",
+    )
+    parser.add_argument("--send-rate", type=int, default=0, help="packets per second")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    fleet = make_fleet(args.sites, args.aps, args.clients, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmpdir, ExitStack() as stack:
+        cfg = make_config(
+            fleet,
+            geocache_file=os.path.join(tmpdir, "geocache.sqlite"),
+            multicast_enabled=True,
+            asyncio_enabled=args.asyncio,
+            refresh_interval=args.refresh_interval,
+            send_rate=args.send_rate,
+        )
+        mocked_controller(stack, fleet, cfg)
+        client = LoopbackClient(config.Config.from_dict(cfg))
+        if args.asyncio:
+            stack.callback(serve_in_thread(client))
+        else:
+            threading.Thread(target=client.start, name="responder", daemon=True).start()
+        client._refresher.refresh()
+        while not client._sock.getsockname()[1]:
+            time.sleep(0.01)
+        results = mock_collector.run(
+            ("::1", client._sock.getsockname()[1]),
+            polls=args.polls,
+            rate=args.rate,
+            collectors=args.collectors,
+            idle=args.idle,
+            expect=fleet.ap_count,
+        )
+    summary = mock_collector.summarize(results, fleet.ap_count)
+    print(mock_collector.format_summary(summary))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"arguments": vars(args), "summary": summary}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Memory benchmark of Accesspoint snapshots.
+
+Builds a snapshot from JSON-parsed controller documents with
+get_site_accesspoints and reports the memory it retains, for the slotted
+Accesspoint with interned strings and for a plain dataclass twin without
+interning, which is how Accesspoint used to be stored.
+
+Usage: python -m benchmarks.bench_memory [SIZE ...]
+"""
+
+import argparse
+import dataclasses
+import gc
+import json
+import tracemalloc
+from unittest.mock import Mock, patch
+
+from unifi_respondd import unifi_client
+from unifi_respondd.nodelist import Nodelist
+
+LegacyAccesspoint = dataclasses.make_dataclass(
+    "Accesspoint",
+    [
+        (field.name, field.type)
+        for field in dataclasses.fields(unifi_client.Accesspoint)
+    ],
+)
+
+
+def make_devices(count):
+    """Returns count distinct stat/device documents, as parsed from JSON."""
+    devices = []
+    for i in range(count):
+        mac = ":".join("%02x" % b for b in i.to_bytes(6, "big"))
+        devices.append(
+            {
+                "name": "AP-%d" % i,
+                "mac": mac,
+                "state": 1,
+                "type": "uap",
+                "model": "U6-Lite",
+                "version": "6.6.55.15189",
+                "uptime": 86400 + i,
+                "snmp_contact": "admin@example.com",
+                "uplink": {"ap_mac": "aa:bb:cc:00:00:%02x" % (i % 256)},
+                "sys_stats": {
+                    "loadavg_1": "0.5",
+                    "mem_used": 50000 + i,
+                    "mem_buffer": 10000,
+                    "mem_total": 100000,
+                },
+                "vap_table": [
+                    {
+                        "essid": "muenchen.freifunk.net",
+                        "channel": 36,
+                        "rx_bytes": 1000 * i,
+                        "tx_bytes": 2000 * i,
+                        "num_sta": i % 30,
+                    },
+                    {
+                        "essid": "muenchen.freifunk.net",
+                        "channel": 6,
+                        "rx_bytes": 500 * i,
+                        "tx_bytes": 600 * i,
+                        "num_sta": i % 20,
+                    },
+                ],
+            }
+        )
+    return json.loads(json.dumps(devices))
+
+
+def build(count):
+    cfg = Mock(offloader_mac={"site": "aa:bb:cc:dd:ee:ff"}, fallback_domain="ffmuc")
+    nodes = Nodelist("http://example.com/nodes.json", 300)
+    nodes.by_mac = {
+        "aa:bb:cc:dd:ee:ff": {
+            "mac": "aa:bb:cc:dd:ee:ff",
+            "gateway": "10.0.0.1",
+            "gateway6": "fe80::1",
+            "domain": "ffmuc",
+        }
+    }
+    site = {"name": "site", "desc": "site"}
+    return unifi_client.get_site_accesspoints(
+        site,
+        make_devices(count),
+        None,
+        cfg,
+        unifi_client.SsidMatcher("freifunk"),
+        nodes,
+        None,
+    )
+
+
+def retained(count):
+    """Returns the bytes retained by a snapshot of count APs and the peak while building it."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    aps = build(count)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(aps) == count
+    return current - before, peak - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sizes", nargs="*", type=int, default=[10000, 50000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with patch.object(unifi_client, "Accesspoint", LegacyAccesspoint), patch.object(
+            unifi_client, "intern_string", lambda value: value
+        ):
+            legacy, legacy_peak = retained(size)
+        compact, compact_peak = retained(size)
+        for name, current, peak in (
+            ("dict", legacy, legacy_peak),
+            ("slots+intern", compact, compact_peak),
+        ):
+            print(
+                "%6d APs  %-12s %8.1f MiB  %6d B/AP  peak %8.1f MiB  x%.2f"
+                % (
+                    size,
+                    name,
+                    current / 2**20,
+                    current / size,
+                    peak / 2**20,
+                    legacy / current,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
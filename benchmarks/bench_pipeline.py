@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Benchmark of the collection and response pipeline on a synthetic fleet.
+
+Times get_infos() against an in-memory controller serving a generated fleet of
+SITES sites with APS APs and CLIENTS clients per AP, or with --http against a
+MockController serving it over HTTP with the given latency, followed by the
+response steps getNodeInfos, getStatistics, getNeighbours, merge_node,
+sendStruct and the cached sendResponse. Results are printed and optionally written as JSON,
+so that runs can be compared.
+
+Usage: python -m benchmarks.bench_pipeline [--sites N] [--aps M] [--clients K]
+           [--repeat R] [--site-workers W] [--http [--latency S] [--jitter S]]
+           [--output FILE]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import socket
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from unifi_respondd import config, config_manager, unifi_client
+from unifi_respondd.fleet import FleetController, make_config, make_fleet
+from unifi_respondd.mock_controller import MockController
+from unifi_respondd.nodelist import Nodelist
+from unifi_respondd.refresher import Snapshot
+from unifi_respondd.respondd_client import ResponddClient
+
+SECTIONS = ["nodeinfo", "statistics", "neighbours"]
+
+
+def timed(func, repeat):
+    """Returns the timings of repeat calls of func in seconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def mocked_controller(stack, fleet, cfg):
+    """Routes get_infos() to an in-memory controller serving fleet, or to the
+    MockController cfg points to if it is served over HTTP."""
+    nodes = Nodelist(cfg["nodelist"], 300)
+    nodes.by_mac = {node["mac"]: node for node in fleet.nodes}
+    stack.enter_context(patch.object(config, "load_config", return_value=cfg))
+    stack.enter_context(patch.object(config_manager, "manager", None))
+    if cfg["controller_url"].startswith("http://"):
+        stack.enter_context(patch.dict(unifi_client.controller_sessions, clear=True))
+    else:
+        stack.enter_context(
+            patch.object(
+                unifi_client,
+                "get_controller_session",
+                return_value=FleetController(fleet),
+            )
+        )
+    stack.enter_context(patch.object(unifi_client, "get_nodelist", return_value=nodes))
+    stack.enter_context(patch.dict(unifi_client.site_accesspoints, clear=True))
+    stack.enter_context(patch.dict(unifi_client.site_inventory, clear=True))
+    stack.enter_context(patch.dict(unifi_client.controller_sites, clear=True))
+
+
+def bench_collection(fleet, cfg, repeat):
+    """Returns the timings of full and stats-only collections."""
+    results = {}
+    for source in ("vap_table", "clients"):
+        full = dict(cfg, client_count_source=source, inventory_interval=0)
+        with ExitStack() as stack:
+            mocked_controller(stack, fleet, full)
+            results["get_infos full (%s)" % source] = timed(
+                unifi_client.get_infos, repeat
+            )
+    light = dict(cfg, inventory_interval=3600)
+    with ExitStack() as stack:
+        mocked_controller(stack, fleet, light)
+        aps = unifi_client.get_infos()
+        results["get_infos stats only"] = timed(unifi_client.get_infos, repeat)
+    return results, aps
+
+
+def bench_response(aps, cfg, repeat):
+    """Returns the timings of the steps answering a request for all APs."""
+    results = {}
+    receiver = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    receiver.bind(("::1", 0))
+    destAddress = receiver.getsockname()[:2]
+    client = ResponddClient(config.Config.from_dict(cfg))
+    client._aps = aps
+    try:
+        results["getNodeInfos"] = timed(client.getNodeInfos, repeat)
+        results["getStatistics"] = timed(client.getStatistics, repeat)
+        results["getNeighbours"] = timed(client.getNeighbours, repeat)
+        responseStruct = {
+            "nodeinfo": client.getNodeInfos(),
+            "statistics": client.getStatistics(),
+            "neighbours": client.getNeighbours(),
+        }
+        results["merge_node"] = timed(lambda: client.merge_node(responseStruct), repeat)
+        results["sendStruct"] = timed(
+            lambda: client.sendStruct(destAddress, responseStruct, True), repeat
+        )
+        snapshot = Snapshot(accesspoints=aps, version=1, created=time.monotonic())
+        client.sendResponse(destAddress, snapshot, SECTIONS, True)
+        results["sendResponse (cached)"] = timed(
+            lambda: client.sendResponse(destAddress, snapshot, SECTIONS, True), repeat
+        )
+    finally:
+        client._sock.close()
+        receiver.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", type=int, default=10)
+    parser.add_argument("--aps", type=int, default=100, help="APs per site")
+    parser.add_argument("--clients", type=int, default=20, help="clients per AP")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--site-workers", type=int, default=1)
+    parser.add_argument(
+        "--http", action="store_true", help="collect over HTTP from a MockController"
+    )
+    parser.add_argument("--latency", type=float, default=0, help="seconds, with --http")
+    parser.add_argument("--jitter", type=float, default=0, help="seconds, with --http")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    fleet = make_fleet(args.sites, args.aps, args.clients, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmpdir, ExitStack() as stack:
+        cfg = make_config(
+            fleet,
+            geocache_file=os.path.join(tmpdir, "geocache.sqlite"),
+            site_workers=args.site_workers,
+        )
+        if args.http:
+            controller = stack.enter_context(
+                MockController(
+                    fleet, latency=args.latency, jitter=args.jitter, seed=args.seed
+                )
+            )
+            cfg.update(controller.config())
+        timings, aps = bench_collection(fleet, cfg, args.repeat)
+        timings.update(bench_response(aps, cfg, args.repeat))
+
+    report = {
+        "fleet": {
+            "sites": args.sites,
+            "aps_per_site": args.aps,
+            "clients_per_ap": args.clients,
+            "aps": fleet.ap_count,
+            "seed": args.seed,
+        },
+        "controller": {
+            "http": args.http,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "site_workers": args.site_workers,
+        },
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "results": {},
+    }
+    for name, runs in timings.items():
+        report["results"][name] = {
+            "best": min(runs),
+            "median": statistics.median(runs),
+            "timings": runs,
+        }
+        print(
+            "%-28s best %9.2f ms  median %9.2f ms  %7.2f us/AP"
+            % (
+                name,
+                min(runs) * 1e3,
+                statistics.median(runs) * 1e3,
+                min(runs) / fleet.ap_count * 1e6,
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the respondd serialization paths.
+
+Compares the dataclasses_json to_dict() path of ResponddClient.sendStruct with
+the dict builders of unifi_respondd.serializer, with json and with orjson if it
+is installed.
+
+Usage: python -m benchmarks.bench_serializer [--repeat N] [SIZE ...]
+"""
+
+import argparse
+import json
+import time
+
+from unifi_respondd import serializer
+from unifi_respondd.respondd_client import ResponddClient
+from unifi_respondd.unifi_client import Accesspoint
+
+SECTIONS = ("nodeinfo", "statistics", "neighbours")
+
+
+def make_aps(count):
+    """Returns count distinct Accesspoints."""
+    aps = []
+    for i in range(count):
+        mac = ":".join("%02x" % b for b in i.to_bytes(6, "big"))
+        aps.append(
+            Accesspoint(
+                name="AP-%d" % i,
+                mac=mac,
+                snmp_location="48.1351, 11.5820",
+                client_count=i % 50,
+                client_count24=i % 20,
+                client_count5=i % 50 - i % 20,
+                channel5=36 + 4 * (i % 8),
+                rx_bytes5=1000 * i,
+                tx_bytes5=2000 * i,
+                channel24=1 + 5 * (i % 3),
+                rx_bytes24=500 * i,
+                tx_bytes24=600 * i,
+                latitude=48.1351 + i / 1e5,
+                longitude=11.5820 + i / 1e5,
+                model="U6-Lite",
+                firmware="6.6.55.15189",
+                uptime=86400 + i,
+                contact="admin@example.com",
+                load_avg=0.5,
+                mem_used=50000 + i,
+                mem_total=100000,
+                mem_buffer=10000,
+                tx_bytes=2600 * i,
+                rx_bytes=1500 * i,
+                gateway="10.0.0.1",
+                gateway6="fe80::1",
+                gateway_nexthop="aabbccddeeff",
+                neighbour_macs=["aa:bb:cc:dd:ee:ff", mac],
+                domain_code="ffmuc",
+            )
+        )
+    return aps
+
+
+def to_dict_path(aps):
+    builders = (
+        ResponddClient.buildNodeInfo,
+        ResponddClient.buildStatistics,
+        ResponddClient.buildNeighbours,
+    )
+    for ap in aps:
+        node = {s: b(ap).to_dict() for s, b in zip(SECTIONS, builders)}
+        bytes(json.dumps(node), "UTF-8")
+
+
+def fast_path(dumps):
+    def run(aps):
+        for ap in aps:
+            dumps({s: serializer.SECTIONS[s](ap) for s in SECTIONS})
+
+    return run
+
+
+def best_of(func, aps, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(aps)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sizes", nargs="*", type=int, default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = [("to_dict+json", to_dict_path), ("fast+json", fast_path(serializer.dumps))]
+    if serializer.orjson is not None:
+        paths.append(("fast+orjson", fast_path(serializer.orjson.dumps)))
+
+    for size in args.sizes:
+        aps = make_aps(size)
+        baseline = None
+        for name, func in paths:
+            elapsed = best_of(func, aps, args.repeat)
+            baseline = baseline or elapsed
+            print(
+                "%6d nodes  %-13s %8.1f ms  %6.2f us/node  x%.1f"
+                % (size, name, elapsed * 1e3, elapsed / size * 1e6, baseline / elapsed)
+            )
+
+
+if __name__ == "__main__":
+    main()
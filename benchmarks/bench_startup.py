@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Import time benchmark of the entry point and the responder modules.
+
+Imports each MODULE in a fresh interpreter with python -X importtime, REPEAT
+times, and reports the best cumulative import time of the module and the
+slowest modules it pulls in. With --budget the exit status is 1 if a module
+takes longer than BUDGET milliseconds.
+
+Usage: python -m benchmarks.bench_startup [MODULE ...] [--repeat N] [--top K]
+           [--budget MS]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# the modules are imported from the checkout the benchmark is part of
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = (
+    "respondd",
+    "unifi_respondd.respondd_client",
+    "unifi_respondd.unifi_client",
+)
+
+
+def import_times(module):
+    """Imports module in a new interpreter with -X importtime.
+    Returns:
+        A dict of the cumulative import time in microseconds per imported module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.split(":", 1)[1].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def best_import_times(module, repeat):
+    """Returns the import_times() of module with the lowest total of repeat runs."""
+    runs = [import_times(module) for _ in range(repeat)]
+    return min(runs, key=lambda times: times.get(module, 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--budget", type=float, help="milliseconds per module")
+    args = parser.parse_args()
+
+    over_budget = False
+    for module in args.modules:
+        times = best_import_times(module, args.repeat)
+        total = times.get(module, 0) / 1000
+        print("%s: %.1f ms" % (module, total))
+        slowest = sorted(
+            (name for name in times if name != module),
+            key=times.get,
+            reverse=True,
+        )
+        for name in slowest[: args.top]:
+            print("    %8.1f ms  %s" % (times[name] / 1000, name))
+        if args.budget is not None and total > args.budget:
+            print("    over the budget of %.0f ms" % args.budget)
+            over_budget = True
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
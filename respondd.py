@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 
-import unifi_respondd.config as config
-from unifi_respondd.respondd_client import ResponddClient
+from unifi_respondd import config_manager, listener
 
 
 def main():
-    cfg = config.Config.from_dict(config.load_config())
-    extResponddClient = ResponddClient(cfg)
+    cfg = config_manager.get_config()
+    # Listen before importing the responder and the controller client, which
+    # pull in asyncio, requests and geopy; the kernel queues requests meanwhile.
+    socks = listener.open_sockets(cfg.get_listeners())
+    from unifi_respondd.respondd_client import ResponddClient
+
+    extResponddClient = ResponddClient(cfg, socks)
     extResponddClient.start()
 
 
@@ -21,9 +21,11 @@ setup(
     long_description_content_type="text/markdown",
     include_package_data=True,
     install_requires=[
-        "pyunifi==2.21",
+        "requests==2.34.2",
         "geopy==2.5.0",
         "pyyaml==6.0.3",
         "dataclasses_json==0.6.7",
+        "ijson==3.6.0",
     ],
+    extras_require={"orjson": ["orjson==3.13.0"]},
 )
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""Fixtures shared by all tests."""
+
+from unittest.mock import patch
+
+import pytest
+
+from unifi_respondd import config_manager
+
+
+@pytest.fixture(autouse=True)
+def fresh_config():
+    """Makes every test read the configuration through its own ConfigManager,
+    so that patched load_config() calls take effect."""
+    with patch.object(config_manager, "manager", None):
+        yield
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Helpers shared by the tests."""
+
+import zlib
+
+from unifi_respondd.refresher import Snapshot
+from unifi_respondd.unifi_client import Accesspoint, Accesspoints
+
+
+def make_ap(**overrides):
+    """Returns an Accesspoint with sensible defaults."""
+    fields = dict(
+        name="TestAP",
+        mac="00:11:22:33:44:55",
+        snmp_location="48.1351, 11.5820",
+        client_count=10,
+        client_count24=5,
+        client_count5=5,
+        channel5=36,
+        rx_bytes5=1000,
+        tx_bytes5=2000,
+        channel24=6,
+        rx_bytes24=500,
+        tx_bytes24=600,
+        latitude=48.1351,
+        longitude=11.5820,
+        model="UAP-AC-PRO",
+        firmware="4.3.20.11298",
+        uptime=86400,
+        contact="admin@example.com",
+        load_avg=0.5,
+        mem_used=50000,
+        mem_total=100000,
+        mem_buffer=10000,
+        tx_bytes=2600,
+        rx_bytes=1500,
+        gateway="10.0.0.1",
+        gateway6="fe80::1",
+        gateway_nexthop="aabbccddeeff",
+        neighbour_macs=["aa:bb:cc:dd:ee:ff", None],
+        domain_code="ffmuc",
+    )
+    fields.update(overrides)
+    return Accesspoint(**fields)
+
+
+def make_snapshot(aps, version=1):
+    """Returns a Snapshot of the Accesspoints aps."""
+    return Snapshot(
+        accesspoints=Accesspoints(accesspoints=aps), version=version, created=0.0
+    )
+
+
+def inflate(data):
+    """Returns the decompressed payload of a compressed response."""
+    return zlib.decompress(data, -15)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/config_manager.py module."""
+
+import os
+from unittest.mock import patch
+
+import pytest
+import yaml
+
+from unifi_respondd import config, config_manager, unifi_client
+from unifi_respondd.config_manager import ConfigManager
+from unifi_respondd.fleet import make_config, make_fleet
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    path = tmp_path / "unifi_respondd.yaml"
+    monkeypatch.setenv(config.UNIFI_RESPONDD_CONFIG_OS_ENV, str(path))
+    cfg = make_config(make_fleet(1, 1, 1))
+
+    def write(**overrides):
+        path.write_text(yaml.safe_dump(dict(cfg, **overrides)))
+        stat = os.stat(path)
+        # make the change visible on file systems with coarse timestamps
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    write()
+    return path, write
+
+
+class TestConfigManager:
+    """Test the ConfigManager class."""
+
+    def test_parses_once(self, config_file):
+        """Test that an unchanged file is not read again."""
+        manager = ConfigManager(check_interval=0)
+        with patch.object(config, "load_config", wraps=config.load_config) as load:
+            first = manager.get()
+            assert manager.get() is first
+            assert manager.get() is first
+
+        assert load.call_count == 1
+        assert manager.reloads == 0
+
+    def test_explicit_path(self, config_file, tmp_path):
+        """Test that the first load reads the given path, not the default one."""
+        other = tmp_path / "other.yaml"
+        other.write_text(
+            yaml.safe_dump(dict(make_config(make_fleet(1, 1, 1)), ssid_regex="other"))
+        )
+        manager = ConfigManager(path=str(other), check_interval=0)
+
+        assert manager.get().ssid_regex == "other"
+
+    def test_reload_on_change(self, config_file):
+        """Test that a modified file replaces the config."""
+        _, write = config_file
+        manager = ConfigManager(check_interval=0)
+        first = manager.get()
+        write(ssid_regex="muenchen", site_workers=4)
+        second = manager.get()
+
+        assert second is not first
+        assert (second.ssid_regex, second.site_workers) == ("muenchen", 4)
+        assert (first.ssid_regex, first.site_workers) == ("freifunk", 1)
+        assert manager.reloads == 1
+
+    def test_reload_applies_logging_config(self, config_file):
+        """Test that a changed logging_config is applied on reload."""
+        _, write = config_file
+        manager = ConfigManager(check_interval=0)
+        logging_cfg = {"version": 1, "root": {"level": "DEBUG"}}
+        with patch.object(config_manager.logger, "configure") as configure:
+            manager.get()
+            write(ssid_regex="muenchen")
+            manager.get()
+            assert configure.call_count == 1
+            write(ssid_regex="muenchen", logging_config=logging_cfg)
+            manager.get()
+
+        configure.assert_called_with(logging_cfg)
+        assert configure.call_count == 2
+        assert manager.reloads == 2
+
+    def test_check_interval(self, config_file):
+        """Test that the file is only checked every check_interval seconds."""
+        _, write = config_file
+        manager = ConfigManager(check_interval=60)
+        first = manager.get()
+        write(ssid_regex="muenchen")
+
+        assert manager.get() is first
+
+    def test_invalid_file_keeps_config(self, config_file):
+        """Test that a broken or incomplete file does not replace the config."""
+        path, write = config_file
+        manager = ConfigManager(check_interval=0)
+        first = manager.get()
+        path.write_text("controller_url: [")
+        assert manager.get() is first
+        path.write_text("controller_url: unifi.lan\n")
+        assert manager.get() is first
+        path.unlink()
+        assert manager.get() is first
+
+        write(ssid_regex="muenchen")
+        assert manager.get().ssid_regex == "muenchen"
+        assert manager.reloads == 1
+
+    def test_shared_manager(self, config_file):
+        """Test that get_config() returns the config of one shared manager."""
+        assert config_manager.get_config() is config_manager.get_config()
+        assert config_manager.get_manager().path == str(config_file[0])
+
+
+class TestGetMatcher:
+    """Test that the SsidMatcher is kept across collections."""
+
+    def test_kept_until_regex_changes(self):
+        """Test that a new matcher is only built for a different ssid_regex."""
+        fleet = make_fleet(1, 1, 1)
+        cfg = config.Config.from_dict(make_config(fleet))
+        changed = config.Config.from_dict(make_config(fleet, ssid_regex="muenchen"))
+        with patch.object(unifi_client, "matcher", None):
+            first = unifi_client.get_matcher(cfg)
+            assert unifi_client.get_matcher(cfg) is first
+            second = unifi_client.get_matcher(changed)
+
+        assert second is not first
+        assert second("muenchen.freifunk.net") and not second("office")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
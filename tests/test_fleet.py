@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/fleet.py module."""
+
+from contextlib import ExitStack
+
+import pytest
+
+from benchmarks.bench_pipeline import mocked_controller
+from unifi_respondd import unifi_client
+from unifi_respondd.fleet import make_config, make_fleet
+
+
+class TestMakeFleet:
+    """Test the make_fleet function."""
+
+    def test_shape(self):
+        """Test that the fleet has the requested number of sites, APs and clients."""
+        fleet = make_fleet(3, 4, 5)
+
+        assert [site["name"] for site in fleet.sites] == ["site0", "site1", "site2"]
+        assert fleet.ap_count == 12
+        assert all(len(clients) == 20 for clients in fleet.clients.values())
+        assert len(fleet.nodes) == len(fleet.offloader_mac) == 3
+
+    def test_reproducible(self):
+        """Test that the same seed yields the same fleet."""
+        assert make_fleet(2, 3, 4, seed=7) == make_fleet(2, 3, 4, seed=7)
+        assert make_fleet(2, 3, 4, seed=7) != make_fleet(2, 3, 4, seed=8)
+
+    def test_distinct_macs(self):
+        """Test that APs and clients have distinct MAC addresses."""
+        fleet = make_fleet(3, 20, 10)
+        macs = [ap["mac"] for aps in fleet.devices.values() for ap in aps]
+        macs += [
+            client["mac"] for clients in fleet.clients.values() for client in clients
+        ]
+
+        assert len(set(macs)) == len(macs)
+
+    def test_num_sta_matches_clients(self):
+        """Test that the vap_table agrees with the client list."""
+        fleet = make_fleet(1, 10, 12)
+        matcher = unifi_client.SsidMatcher("freifunk")
+        by_ap = unifi_client.get_client_counts_by_ap(fleet.clients["site0"], matcher)
+
+        for ap in fleet.devices["site0"]:
+            assert unifi_client.get_client_counts_from_vap_table(
+                ap["vap_table"], matcher
+            ) == by_ap.get(ap["mac"], (0, 0, 0))
+
+
+class TestFleetController:
+    """Test collecting a fleet through the FleetController."""
+
+    def test_get_infos(self, tmp_path):
+        """Test that get_infos() reports every AP of the fleet."""
+        fleet = make_fleet(2, 5, 3)
+        cfg = make_config(fleet, geocache_file=str(tmp_path / "geocache.sqlite"))
+
+        with ExitStack() as stack:
+            mocked_controller(stack, fleet, cfg)
+            controller = unifi_client.get_controller_session.return_value
+            aps = unifi_client.get_infos().accesspoints
+
+        assert len(aps) == fleet.ap_count
+        assert {ap.domain_code for ap in aps} == {"ffmuc_muc_n", "ffmuc_muc_s"}
+        assert {ap.site for ap in aps} == {site["desc"] for site in fleet.sites}
+        assert all(ap.latitude > 48 for ap in aps)
+        assert controller.requests == 1 + len(fleet.sites)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/geocache.py module."""
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from unifi_respondd.geocache import GeoCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = GeoCache(
+        str(tmp_path / "geocache.sqlite"), ttl=3600, negative_ttl=60, max_entries=2
+    )
+    yield cache
+    cache.close()
+
+
+class TestGeoCache:
+    """Test the GeoCache class."""
+
+    def test_miss(self, cache):
+        """Test looking up an unknown address."""
+        assert cache.get("Munich, Germany") == (False, None)
+
+    def test_hit_with_normalized_address(self, cache):
+        """Test that addresses are matched after normalization."""
+        cache.put("Munich, Germany", ("48.1351", "11.5820"))
+
+        assert cache.get("  munich,   GERMANY ") == (True, (48.1351, 11.582))
+
+    def test_negative_result(self, cache):
+        """Test that unresolvable addresses are cached as well."""
+        cache.put("Nowhere", None)
+
+        assert cache.get("Nowhere") == (True, None)
+
+    def test_expiry(self, cache):
+        """Test that positive and negative results expire independently."""
+        with patch("unifi_respondd.geocache.time.time", return_value=1000.0):
+            cache.put("Munich", (48.1, 11.5))
+            cache.put("Nowhere", None)
+        with patch("unifi_respondd.geocache.time.time", return_value=1100.0):
+            assert cache.get("Munich") == (True, (48.1, 11.5))
+            assert cache.get("Nowhere") == (False, None)
+        with patch("unifi_respondd.geocache.time.time", return_value=5000.0):
+            assert cache.get("Munich") == (False, None)
+
+    def test_lru_eviction(self, cache):
+        """Test that the least recently used address is evicted."""
+        with patch("unifi_respondd.geocache.time.time", return_value=1000.0):
+            cache.put("Munich", (48.1, 11.5))
+        with patch("unifi_respondd.geocache.time.time", return_value=1001.0):
+            cache.put("Berlin", (52.5, 13.4))
+        with patch("unifi_respondd.geocache.time.time", return_value=1002.0):
+            assert cache.get("Munich")[0]
+        with patch("unifi_respondd.geocache.time.time", return_value=1003.0):
+            cache.put("Hamburg", (53.5, 10.0))
+
+            assert cache.get("Berlin") == (False, None)
+            assert cache.get("Munich")[0]
+            assert cache.get("Hamburg")[0]
+
+    def test_persistent(self, tmp_path):
+        """Test that entries survive reopening the database."""
+        path = str(tmp_path / "geocache.sqlite")
+        cache = GeoCache(path, ttl=3600, negative_ttl=60, max_entries=10)
+        cache.put("Munich", (48.1, 11.5))
+        cache.close()
+
+        cache = GeoCache(path, ttl=3600, negative_ttl=60, max_entries=10)
+        assert cache.get("Munich") == (True, (48.1, 11.5))
+        cache.close()
+
+    def test_shared_between_processes(self, tmp_path):
+        """Test that a lookup does not keep other connections from writing."""
+        path = str(tmp_path / "geocache.sqlite")
+        with patch("unifi_respondd.geocache.BUSY_TIMEOUT", 0.1):
+            first = GeoCache(path, ttl=60, negative_ttl=10, max_entries=10)
+            second = GeoCache(path, ttl=60, negative_ttl=10, max_entries=10)
+        first.put("x", (1.0, 2.0))
+        assert first.get("x") == (True, (1.0, 2.0))
+        second.put("y", (3.0, 4.0))
+        assert second.get("x") == (True, (1.0, 2.0))
+        assert first.get("y") == (True, (3.0, 4.0))
+        first.close()
+        second.close()
+
+    def test_throttle_between_processes(self, tmp_path):
+        """Test that lookups through caches sharing a file are spaced."""
+        path = str(tmp_path / "geocache.sqlite")
+        first = GeoCache(path, ttl=60, negative_ttl=10, max_entries=10)
+        second = GeoCache(path, ttl=60, negative_ttl=10, max_entries=10)
+        with patch("unifi_respondd.geocache.REQUEST_INTERVAL", 0.2):
+            with first.throttle():
+                pass
+            started = time.monotonic()
+            with second.throttle():
+                assert time.monotonic() - started >= 0.15
+            started = time.monotonic()
+            with first.throttle():
+                assert time.monotonic() - started >= 0.15
+        first.close()
+        second.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/metrics.py module."""
+
+import socket
+import urllib.error
+import urllib.request
+from unittest.mock import Mock, patch
+
+import pytest
+
+from unifi_respondd import metrics
+from unifi_respondd.respondd_client import ResponddClient, ResponseCache
+from unifi_respondd.sender import BatchSender
+
+
+class TestMetrics:
+    """Test the metric types and their text format."""
+
+    def test_counter(self):
+        """Test that a counter adds up per label set."""
+        counter = metrics.Counter("test_total", "Test.", ["result"])
+        counter.inc(result="ok")
+        counter.inc(2, result="ok")
+        counter.inc(result="failed")
+
+        assert counter.value(result="ok") == 3
+        assert counter.render() == (
+            "# HELP test_total Test.\n"
+            "# TYPE test_total counter\n"
+            'test_total{result="failed"} 1\n'
+            'test_total{result="ok"} 3\n'
+        )
+
+    def test_wrong_labels(self):
+        """Test that labels must match the label names."""
+        counter = metrics.Counter("test_total", "Test.", ["result"])
+        with pytest.raises(ValueError):
+            counter.inc(stage="ok")
+
+    def test_gauge_function(self):
+        """Test that a gauge reads its function on render, None becomes NaN."""
+        gauge = metrics.Gauge("test_age", "Test.")
+        values = iter([1.5, None])
+        gauge.set_function(lambda: next(values))
+
+        assert gauge.render().endswith("test_age 1.5\n")
+        assert gauge.render().endswith("test_age NaN\n")
+
+    def test_histogram(self):
+        """Test that histogram buckets are cumulative and end with +Inf."""
+        histogram = metrics.Histogram("test_seconds", "Test.", ["stage"], [0.1, 1])
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value, stage="send")
+
+        assert histogram.count(stage="send") == 4
+        assert histogram.render().splitlines()[2:] == [
+            'test_seconds_bucket{stage="send",le="0.1"} 1',
+            'test_seconds_bucket{stage="send",le="1"} 3',
+            'test_seconds_bucket{stage="send",le="+Inf"} 4',
+            'test_seconds_sum{stage="send"} 6.05',
+            'test_seconds_count{stage="send"} 4',
+        ]
+
+    def test_histogram_time(self):
+        """Test that time() observes the duration of the block, also on errors."""
+        histogram = metrics.Histogram("test_seconds", "Test.", ["stage"])
+        with patch.object(metrics.time, "perf_counter", side_effect=[1.0, 1.25]):
+            with pytest.raises(RuntimeError):
+                with histogram.time(stage="collect"):
+                    raise RuntimeError()
+
+        assert histogram.count(stage="collect") == 1
+        assert 'test_seconds_sum{stage="collect"} 0.25' in histogram.render()
+
+    def test_label_escaping(self):
+        """Test that quotes and backslashes in label values are escaped."""
+        assert metrics.format_labels(["a"], ['x"y\\z']) == '{a="x\\"y\\\\z"}'
+
+
+class TestInstrumentation:
+    """Test the metrics recorded while answering requests."""
+
+    def test_payload_bytes(self):
+        """Test that bytes before and after compression are counted once per payload."""
+        ap = Mock(mac="aa:bb:cc:dd:ee:ff")
+        snapshot = Mock(version=1, accesspoints=Mock(accesspoints=[ap]))
+        cache = ResponseCache(
+            sections={"nodeinfo": lambda ap: {"node_id": "x" * 100}},
+            dumps=lambda node: str(node).encode(),
+        )
+        identity = metrics.PAYLOAD_BYTES.value(encoding="identity")
+        deflate = metrics.PAYLOAD_BYTES.value(encoding="deflate")
+
+        payload = cache.payloads(snapshot, ("nodeinfo",), True)[0]
+        cache.payloads(snapshot, ("nodeinfo",), True)
+
+        raw = len(str({"nodeinfo": {"node_id": "x" * 100}}))
+        assert metrics.PAYLOAD_BYTES.value(encoding="identity") == identity + raw
+        assert metrics.PAYLOAD_BYTES.value(encoding="deflate") == deflate + len(payload)
+        assert len(payload) < raw
+
+    def test_packets(self):
+        """Test that sent datagrams and their bytes are counted."""
+        receiver = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        receiver.bind(("::1", 0))
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        sent = metrics.PACKETS.value(result="sent")
+        sent_bytes = metrics.SENT_BYTES.value()
+        try:
+            BatchSender(sock).send([b"a", b"bc"], receiver.getsockname()[:2])
+        finally:
+            sock.close()
+            receiver.close()
+
+        assert metrics.PACKETS.value(result="sent") == sent + 2
+        assert metrics.SENT_BYTES.value() == sent_bytes + 3
+
+
+class TestServer:
+    """Test the /metrics endpoint."""
+
+    @pytest.fixture
+    def server(self):
+        server = metrics.start_server("127.0.0.1", 0)
+        yield "http://127.0.0.1:%d" % server.server_address[1]
+        server.shutdown()
+        server.server_close()
+
+    def test_metrics(self, server):
+        """Test that /metrics serves the registry in the Prometheus text format."""
+        with urllib.request.urlopen(server + "/metrics") as response:
+            body = response.read().decode()
+            content_type = response.headers["Content-Type"]
+
+        assert content_type == metrics.CONTENT_TYPE
+        assert "# TYPE unifi_respondd_stage_duration_seconds histogram" in body
+        assert "# TYPE unifi_respondd_requests_total counter" in body
+
+    def test_not_found(self, server):
+        """Test that other paths are answered with 404."""
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(server + "/")
+        assert error.value.code == 404
+
+    def test_disabled(self):
+        """Test that no server is started with metrics_port 0."""
+        client = Mock(_config=Mock(metrics_port=0))
+        with patch.object(metrics, "start_server") as mock_start:
+            assert ResponddClient.startMetrics(client) is None
+        mock_start.assert_not_called()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/mock_collector.py module."""
+
+import json
+import time
+from contextlib import ExitStack
+
+import pytest
+
+from benchmarks.bench_latency import LoopbackClient, serve_in_thread
+from benchmarks.bench_pipeline import mocked_controller
+from unifi_respondd import config, mock_collector, unifi_client
+from unifi_respondd.fleet import make_config, make_fleet
+from unifi_respondd.mock_collector import Poll, parse_payload, percentile, summarize
+from unifi_respondd.refresher import SnapshotRefresher
+from unifi_respondd.respondd_client import compress
+
+SECTIONS = ("nodeinfo", "statistics", "neighbours")
+
+
+def make_node(node_id="aabbccddeeff"):
+    return {
+        "nodeinfo": {
+            "node_id": node_id,
+            "hostname": "ap",
+            "network": {},
+            "software": {},
+        },
+        "statistics": {"node_id": node_id, "clients": {}, "uptime": 1},
+        "neighbours": {"node_id": node_id, "batadv": {}},
+    }
+
+
+class TestParsePayload:
+    """Test the validation of response packets."""
+
+    def test_multi(self):
+        """Test that a compressed multi response yields its node_id."""
+        data = compress(json.dumps(make_node()).encode())
+        assert parse_payload(data, SECTIONS) == "aabbccddeeff"
+
+    def test_single(self):
+        """Test that an uncompressed single response yields its node_id."""
+        data = json.dumps(make_node()["statistics"]).encode()
+        assert parse_payload(data, ("statistics",), multi=False) == "aabbccddeeff"
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            b"not deflated",
+            compress(b"{not json"),
+            compress(json.dumps({"nodeinfo": make_node()["nodeinfo"]}).encode()),
+            compress(
+                json.dumps(dict(make_node(), statistics={"node_id": "x"})).encode()
+            ),
+            compress(
+                json.dumps(
+                    dict(make_node(), neighbours=make_node("x")["neighbours"])
+                ).encode()
+            ),
+        ],
+    )
+    def test_invalid(self, data):
+        """Test that broken, incomplete and inconsistent packets are rejected."""
+        with pytest.raises(ValueError):
+            parse_payload(data, SECTIONS)
+
+
+class TestSummarize:
+    """Test the aggregation of polls."""
+
+    def test_percentile(self):
+        """Test the nearest rank percentiles."""
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([3], 95) == 3
+
+    def test_loss(self):
+        """Test that loss counts the missing node answers."""
+        polls = [Poll(0.1, 10, 10, 0), Poll(0.2, 8, 8, 0), Poll(None, 0, 0, 0)]
+        summary = summarize(polls)
+
+        assert summary["nodes"] == 10
+        assert summary["loss"] == pytest.approx(12 / 30)
+        assert summary["packets_per_poll"] == 6
+        assert summary["unanswered"] == 1
+        assert summary["p50"] == 0.1
+
+
+@pytest.fixture
+def responder(tmp_path):
+    """Runs an asyncio responder on the loopback answering for a fleet."""
+    fleet = make_fleet(2, 15, 2)
+    cfg = make_config(
+        fleet,
+        geocache_file=str(tmp_path / "geocache.sqlite"),
+        multicast_enabled=True,
+    )
+    with ExitStack() as stack:
+        mocked_controller(stack, fleet, cfg)
+        aps = unifi_client.get_infos()
+    client = LoopbackClient(config.Config.from_dict(cfg))
+    client._refresher = SnapshotRefresher(0, collect=lambda: aps)
+    stop = serve_in_thread(client)
+    while not client._sock.getsockname()[1]:
+        time.sleep(0.01)
+    yield ("::1", client._sock.getsockname()[1]), fleet.ap_count
+    stop()
+
+
+class TestCollector:
+    """Test polling a responder end to end."""
+
+    def test_run(self, responder):
+        """Test that concurrent collectors receive every node on every poll."""
+        destAddress, count = responder
+        results = mock_collector.run(
+            destAddress, polls=3, rate=20, collectors=2, idle=0.5, expect=count
+        )
+        summary = summarize(results, count)
+
+        assert summary["polls"] == 6
+        assert summary["loss"] == 0
+        assert summary["invalid"] == 0
+        assert summary["packets_per_poll"] == count
+        assert 0 < summary["p50"] <= summary["p99"] < 0.5
+
+    def test_single(self, responder):
+        """Test that single requests are answered uncompressed."""
+        destAddress, count = responder
+        collector = mock_collector.Collector(
+            destAddress, sections=("neighbours",), multi=False, idle=0.5
+        )
+        try:
+            poll = collector.poll()
+        finally:
+            collector.close()
+
+        assert poll.nodes == poll.packets == count
+        assert poll.invalid == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/mock_controller.py module."""
+
+import socket
+import time
+import zlib
+from contextlib import ExitStack
+
+import pytest
+import requests
+
+from benchmarks.bench_pipeline import mocked_controller
+from unifi_respondd import config, unifi_client
+from unifi_respondd.fleet import make_config, make_fleet
+from unifi_respondd.mock_controller import MockController
+from unifi_respondd.refresher import Snapshot
+from unifi_respondd.respondd_client import ResponddClient
+from unifi_respondd.session import APIError, ControllerSession
+
+
+@pytest.fixture
+def fleet():
+    return make_fleet(2, 10, 4)
+
+
+@pytest.fixture
+def controller(fleet):
+    with MockController(fleet) as controller:
+        yield controller
+
+
+class TestMockController:
+    """Test the MockController against the ControllerSession."""
+
+    @pytest.mark.parametrize("version", ["v5", "unifiOS", "UDMP-unifiOS"])
+    def test_versions(self, fleet, controller, version):
+        """Test that all URL layouts are served."""
+        cfg = controller.config(version)
+        session = ControllerSession(
+            cfg["controller_url"],
+            cfg["username"],
+            cfg["password"],
+            port=cfg["controller_port"],
+            version=version,
+        )
+
+        assert [site["name"] for site in session.get_sites()] == ["site0", "site1"]
+        assert session.get_aps("site1") == fleet.devices["site1"]
+        assert session.get_clients("site0") == fleet.clients["site0"]
+        assert controller.logins == 1
+
+    def test_wrong_password(self, controller):
+        """Test that wrong credentials are rejected."""
+        session = ControllerSession(
+            controller.url, "admin", "wrong", port=controller.address[1]
+        )
+        with pytest.raises(APIError):
+            session.get_sites()
+
+    def test_login_required(self, controller):
+        """Test that requests without a session are answered with 401."""
+        response = requests.get(
+            "%s:%d/api/self/sites" % (controller.url, controller.address[1])
+        )
+        assert response.status_code == 401
+
+    def test_session_expiry(self, controller):
+        """Test that the client logs in again once its session expired."""
+        session = ControllerSession(
+            controller.url, "admin", "admin", port=controller.address[1]
+        )
+        session.get_sites()
+        controller.expire_sessions()
+        session.get_sites()
+
+        assert controller.logins == session.logins == 2
+
+    def test_injected_errors(self, controller):
+        """Test that an error rate of 1 fails every request."""
+        controller.error_rate = 1
+        session = ControllerSession(
+            controller.url, "admin", "admin", port=controller.address[1]
+        )
+        with pytest.raises(APIError):
+            session.get_sites()
+        assert controller.errors == 1
+
+    def test_latency(self, controller):
+        """Test that responses are delayed by the injected latency."""
+        controller.latency = 0.05
+        session = ControllerSession(
+            controller.url, "admin", "admin", port=controller.address[1]
+        )
+        started = time.monotonic()
+        session.get_sites()
+        assert time.monotonic() - started >= 0.1
+
+
+class TestEndToEnd:
+    """Test the full pipeline from the controller to the respondd packets."""
+
+    def test_throughput(self, tmp_path):
+        """Test that every AP of the fleet is collected over HTTP and answered."""
+        fleet = make_fleet(4, 25, 5)
+        receiver = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        receiver.bind(("::1", 0))
+        receiver.settimeout(1)
+        with MockController(
+            fleet, latency=0.001, jitter=0.001
+        ) as controller, ExitStack() as stack:
+            cfg = make_config(
+                fleet,
+                geocache_file=str(tmp_path / "geocache.sqlite"),
+                site_workers=4,
+                **controller.config(),
+            )
+            mocked_controller(stack, fleet, cfg)
+            started = time.perf_counter()
+            aps = unifi_client.get_infos()
+            client = ResponddClient(config.Config.from_dict(cfg))
+            snapshot = Snapshot(accesspoints=aps, version=1, created=time.monotonic())
+            try:
+                client.sendResponse(
+                    receiver.getsockname()[:2],
+                    snapshot,
+                    ["nodeinfo", "statistics", "neighbours"],
+                    True,
+                )
+                packets = [receiver.recv(65536) for _ in range(fleet.ap_count)]
+            finally:
+                client._sock.close()
+                receiver.close()
+            elapsed = time.perf_counter() - started
+
+        assert len(aps.accesspoints) == fleet.ap_count
+        assert controller.requests == 2 + len(fleet.sites)
+        nodes = [zlib.decompress(packet, -15) for packet in packets]
+        assert all(b'"nodeinfo"' in node and b'"statistics"' in node for node in nodes)
+        print(
+            "%d APs in %.3fs, %.0f APs/s"
+            % (fleet.ap_count, elapsed, fleet.ap_count / elapsed)
+        )
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/nodelist.py module."""
+
+from unittest.mock import Mock, patch
+
+import pytest
+
+from unifi_respondd.nodelist import Nodelist
+
+NODES = {"nodes": [{"mac": "aa:bb:cc:dd:ee:ff", "domain": "ffmuc"}, {"id": "nomac"}]}
+
+
+def make_response(status_code=200, json=None, headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.json.return_value = json
+    response.headers = headers or {}
+    return response
+
+
+class TestNodelist:
+    """Test the Nodelist class."""
+
+    @patch("unifi_respondd.nodelist.rget")
+    def test_refresh_builds_mac_index(self, mock_rget):
+        """Test that the nodelist is indexed by MAC."""
+        mock_rget.return_value = make_response(json=NODES)
+        nodelist = Nodelist("http://example.com/nodes.json", 300)
+
+        assert nodelist.refresh()
+        assert nodelist.get("aa:bb:cc:dd:ee:ff") == NODES["nodes"][0]
+        assert nodelist.get("00:00:00:00:00:00") is None
+        assert nodelist.get(None) is None
+
+    @patch("unifi_respondd.nodelist.rget")
+    def test_refresh_respects_max_age(self, mock_rget):
+        """Test that a fresh nodelist is not downloaded again."""
+        mock_rget.return_value = make_response(json=NODES)
+        nodelist = Nodelist("http://example.com/nodes.json", 300)
+
+        nodelist.refresh()
+        assert not nodelist.refresh()
+        mock_rget.assert_called_once()
+
+    @patch("unifi_respondd.nodelist.rget")
+    def test_conditional_request(self, mock_rget):
+        """Test that validators are sent and a 304 keeps the index."""
+        mock_rget.side_effect = [
+            make_response(
+                json=NODES,
+                headers={"ETag": '"abc"', "Last-Modified": "Sat, 17 Oct 2026"},
+            ),
+            make_response(status_code=304),
+        ]
+        nodelist = Nodelist("http://example.com/nodes.json", 0)
+
+        assert nodelist.refresh()
+        by_mac = nodelist.by_mac
+        assert not nodelist.refresh()
+        assert nodelist.by_mac is by_mac
+        assert mock_rget.call_args.kwargs["headers"] == {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Sat, 17 Oct 2026",
+        }
+
+    @patch("unifi_respondd.nodelist.rget")
+    @patch("unifi_respondd.nodelist.logger.error")
+    def test_failure_keeps_previous_index(self, mock_logger, mock_rget):
+        """Test that a failed download keeps the previous nodelist."""
+        mock_rget.side_effect = [make_response(json=NODES), Exception("Timeout")]
+        nodelist = Nodelist("http://example.com/nodes.json", 0)
+
+        nodelist.refresh()
+        assert not nodelist.refresh()
+        assert "aa:bb:cc:dd:ee:ff" in nodelist.by_mac
+        mock_logger.assert_called_once()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
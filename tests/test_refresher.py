@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/refresher.py module."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+import pytest
+
+from unifi_respondd import metrics
+from unifi_respondd.refresher import SnapshotRefresher
+from unifi_respondd.unifi_client import Accesspoints
+
+
+class TestSnapshotRefresher:
+    """Test the SnapshotRefresher class."""
+
+    def test_no_snapshot_before_first_refresh(self):
+        """Test that no snapshot is available before the first collection."""
+        refresher = SnapshotRefresher(60, collect=Mock())
+
+        assert refresher.snapshot is None
+        assert refresher.snapshot_age is None
+
+    def test_refresh_increments_version(self):
+        """Test that every successful refresh swaps in a newer snapshot."""
+        first = Accesspoints(accesspoints=[])
+        second = Accesspoints(accesspoints=[])
+        refresher = SnapshotRefresher(60, collect=Mock(side_effect=[first, second]))
+
+        assert refresher.refresh().version == 1
+        snapshot = refresher.refresh()
+        assert snapshot.version == 2
+        assert snapshot.accesspoints is second
+        assert refresher.snapshot is snapshot
+        assert refresher.snapshot_age >= 0
+
+    def test_failed_refresh_keeps_previous_snapshot(self):
+        """Test that a failed collection does not replace the snapshot."""
+        aps = Accesspoints(accesspoints=[])
+        collect = Mock(side_effect=[aps, None, Exception("Connection failed")])
+        refresher = SnapshotRefresher(60, collect=collect)
+
+        snapshot = refresher.refresh()
+        assert refresher.refresh() is None
+        assert refresher.refresh() is None
+        assert refresher.snapshot is snapshot
+
+    def test_get_does_not_collect_in_background_mode(self):
+        """Test that readers only see the latest snapshot in background mode."""
+        collect = Mock(return_value=Accesspoints(accesspoints=[]))
+        refresher = SnapshotRefresher(60, collect=collect)
+
+        assert refresher.get() is None
+        collect.assert_not_called()
+
+    def test_get_collects_on_demand_without_interval(self):
+        """Test that an interval of 0 collects on every request."""
+        collect = Mock(return_value=Accesspoints(accesspoints=[]))
+        refresher = SnapshotRefresher(0, collect=collect)
+
+        assert refresher.get().version == 1
+        assert refresher.get().version == 2
+        assert collect.call_count == 2
+
+    def test_background_thread(self):
+        """Test that the background thread publishes a snapshot."""
+        collect = Mock(return_value=Accesspoints(accesspoints=[]))
+        refresher = SnapshotRefresher(60, collect=collect)
+
+        refresher.start()
+        try:
+            assert refresher.wait_ready(timeout=5)
+            assert refresher.snapshot.version == 1
+        finally:
+            refresher.stop(timeout=5)
+
+
+class TestSingleFlight:
+    """Test request coalescing of the SnapshotRefresher."""
+
+    def test_concurrent_refreshes_are_coalesced(self):
+        """Test that refreshes during a running collection share its result."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def collect():
+            started.set()
+            release.wait(5)
+            return Accesspoints(accesspoints=[])
+
+        collect = Mock(side_effect=collect)
+        refresher = SnapshotRefresher(0, collect=collect)
+        coalesced = metrics.REFRESHES.value(result="coalesced")
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            leader = pool.submit(refresher.get)
+            assert started.wait(5)
+            followers = [pool.submit(refresher.get) for _ in range(2)]
+            while refresher.coalesced < 2:
+                time.sleep(0.01)
+            release.set()
+            snapshots = [f.result(5) for f in [leader] + followers]
+
+        assert collect.call_count == 1
+        assert refresher.refreshes == 1
+        assert refresher.coalesced == 2
+        assert metrics.REFRESHES.value(result="coalesced") == coalesced + 2
+        assert all(s is snapshots[0] for s in snapshots)
+
+    def test_sequential_refreshes_are_not_coalesced(self):
+        """Test that a finished collection does not swallow the next one."""
+        collect = Mock(return_value=Accesspoints(accesspoints=[]))
+        refresher = SnapshotRefresher(0, collect=collect)
+
+        refresher.refresh()
+        refresher.refresh()
+        assert collect.call_count == 2
+        assert refresher.coalesced == 0
+
+    def test_fresh_snapshot_is_reused(self):
+        """Test that a snapshot within the freshness window is reused."""
+        collect = Mock(return_value=Accesspoints(accesspoints=[]))
+        refresher = SnapshotRefresher(0, collect=collect, freshness=30)
+
+        first = refresher.get()
+        fresh = metrics.REFRESHES.value(result="fresh")
+        assert refresher.get() is first
+        assert refresher.fresh == 1
+        assert metrics.REFRESHES.value(result="fresh") == fresh + 1
+        with patch(
+            "unifi_respondd.refresher.time.monotonic", return_value=first.created + 31
+        ):
+            assert refresher.get().version == 2
+        assert collect.call_count == 2
+
+    def test_failed_refresh_releases_flight(self):
+        """Test that a failing collection does not block later refreshes."""
+        collect = Mock(
+            side_effect=[Exception("Connection failed"), Accesspoints(accesspoints=[])]
+        )
+        refresher = SnapshotRefresher(0, collect=collect)
+
+        assert refresher.refresh() is None
+        assert refresher.refresh().version == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/respondd_client.py module."""
+
+import asyncio
+import dataclasses
+import errno
+import json
+import socket
+from unittest.mock import Mock, call, patch
+
+import pytest
+
+from tests.helpers import inflate, make_ap, make_snapshot
+from unifi_respondd import listener
+from unifi_respondd.config import Config, Listener
+from unifi_respondd.fleet import make_config, make_fleet
+from unifi_respondd.respondd_client import (
+    UNICAST_REQUEST,
+    ResponddClient,
+    ResponddProtocol,
+)
+from unifi_respondd.scheduler import PushSchedule
+from unifi_respondd.sender import BatchSender
+from unifi_respondd.unifi_client import Accesspoints
+
+SEND_BATCH_SIZE = 64
+
+
+@pytest.fixture
+def client():
+    cfg = Mock()
+    cfg.refresh_interval = 60
+    cfg.refresh_freshness = 0
+    cfg.use_orjson = False
+    cfg.send_rate = 0
+    cfg.send_batch_size = SEND_BATCH_SIZE
+    cfg.shard_workers = 0
+    client = ResponddClient(cfg)
+    client._sock.close()
+    client._sock = Mock()
+    client._sender = BatchSender(client._sock, batch_size=SEND_BATCH_SIZE)
+    return client
+
+
+def sent(client):
+    return [c.args[0] for c in client._sock.sendto.call_args_list]
+
+
+class TestResponseCache:
+    """Test the cached response path of ResponddClient."""
+
+    def test_payload_matches_send_struct(self, client):
+        """Test that cached payloads are byte-identical to sendStruct."""
+        aps = [make_ap(), make_ap(mac="66:77:88:99:aa:bb", name="AP2")]
+        requests = ["nodeinfo", "statistics", "neighbours"]
+
+        client._aps = Accesspoints(accesspoints=aps)
+        client.sendStruct(
+            ("::1", 1001), {r: client.buildStruct(r) for r in requests}, True
+        )
+        expected = sent(client)
+        client._sock.reset_mock()
+
+        client.sendResponse(("::1", 1001), make_snapshot(aps), requests, True)
+        assert [inflate(p) for p in sent(client)] == [inflate(p) for p in expected]
+
+    def test_single_request_is_uncompressed(self, client):
+        """Test that a single request is answered with the bare section."""
+        client.sendResponse(
+            ("::1", 1001), make_snapshot([make_ap()]), ["nodeinfo"], False
+        )
+
+        payload = json.loads(sent(client)[0])
+        assert payload["node_id"] == "001122334455"
+        assert payload["hostname"] == "TestAP"
+
+    def test_unknown_and_duplicate_sections(self, client):
+        """Test that unknown sections are ignored and duplicates answered once."""
+        with patch("unifi_respondd.respondd_client.logger.warning") as mock_warning:
+            client.sendResponse(
+                ("::1", 1001),
+                make_snapshot([make_ap()]),
+                ["statistics", "foo", "statistics"],
+                True,
+            )
+        mock_warning.assert_called_once_with("unknown command: foo")
+        assert list(json.loads(inflate(sent(client)[0]))) == ["statistics"]
+
+    def test_payloads_are_reused(self, client):
+        """Test that unchanged nodes are not serialized again."""
+        ap = make_ap()
+        requests = ["nodeinfo", "statistics"]
+        with patch.object(
+            client._cache, "_serialize", wraps=client._cache._serialize
+        ) as mock_serialize:
+            client.sendResponse(("::1", 1001), make_snapshot([ap]), requests, True)
+            client.sendResponse(("::1", 1001), make_snapshot([ap]), requests, True)
+            client.sendResponse(
+                ("::1", 1001),
+                make_snapshot([dataclasses.replace(ap)], 2),
+                requests,
+                True,
+            )
+        assert mock_serialize.call_count == 1
+        assert len(set(sent(client))) == 1
+
+    def test_changed_node_is_invalidated(self, client):
+        """Test that only the changed node is serialized again."""
+        ap1, ap2 = make_ap(), make_ap(mac="66:77:88:99:aa:bb", name="AP2")
+        requests = ["statistics"]
+        with patch.object(
+            client._cache, "_serialize", wraps=client._cache._serialize
+        ) as mock_serialize:
+            client.sendResponse(
+                ("::1", 1001), make_snapshot([ap1, ap2]), requests, True
+            )
+            ap2 = dataclasses.replace(ap2, uptime=86460)
+            client.sendResponse(
+                ("::1", 1001), make_snapshot([ap1, ap2], 2), requests, True
+            )
+        assert mock_serialize.call_count == 3
+        payloads = [json.loads(inflate(p)) for p in sent(client)[2:]]
+        assert payloads[1]["statistics"]["uptime"] == 86460
+
+    def test_compressed_and_uncompressed_are_cached_separately(self, client):
+        """Test that single and multi requests do not share a payload."""
+        snapshot = make_snapshot([make_ap()])
+        client.sendResponse(("::1", 1001), snapshot, ["nodeinfo"], True)
+        client.sendResponse(("::1", 1001), snapshot, ["nodeinfo"], False)
+
+        multi, single = sent(client)
+        assert json.loads(inflate(multi))["nodeinfo"] == json.loads(single)
+
+
+class TestAsyncResponder:
+    """Test the asyncio responder of ResponddClient."""
+
+    def test_request_over_udp(self, client):
+        """Test answering a multi request received on a datagram endpoint."""
+        client._refresher = Mock(background=True)
+        client._refresher.snapshot = make_snapshot([make_ap()])
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: ResponddProtocol(client), local_addr=("::1", 0)
+            )
+            responses = asyncio.Queue()
+
+            class Collector(asyncio.DatagramProtocol):
+                def datagram_received(self, data, addr):
+                    responses.put_nowait(data)
+
+            collector, _ = await loop.create_datagram_endpoint(
+                Collector, remote_addr=transport.get_extra_info("sockname")[:2]
+            )
+            collector.sendto(b"GET nodeinfo statistics")
+            try:
+                return await asyncio.wait_for(responses.get(), 5)
+            finally:
+                collector.close()
+                transport.close()
+
+        payload = json.loads(inflate(asyncio.run(run())))
+        assert list(payload) == ["nodeinfo", "statistics"]
+
+    def test_overlapping_requests_interleave(self, client):
+        """Test that a large response does not block other requests."""
+        aps = [
+            make_ap(mac="00:00:00:00:%02x:%02x" % divmod(i, 256))
+            for i in range(2 * SEND_BATCH_SIZE)
+        ]
+        client._refresher = Mock(background=True)
+        client._refresher.snapshot = make_snapshot(aps)
+        transport = Mock()
+
+        async def run():
+            protocol = ResponddProtocol(client)
+            protocol.connection_made(transport)
+            protocol.datagram_received(b"GET nodeinfo", ("::1", 1))
+            protocol.datagram_received(b"GET statistics", ("::1", 2))
+            await asyncio.gather(*protocol._tasks)
+
+        asyncio.run(run())
+        destinations = [c.args[1][1] for c in transport.sendto.call_args_list]
+        assert len(destinations) == 4 * SEND_BATCH_SIZE
+        assert destinations.index(2) < len(destinations) - destinations[::-1].index(1)
+
+    def test_on_demand_collection_runs_in_executor(self, client):
+        """Test that collecting on demand does not block the event loop."""
+        client._refresher = Mock(background=False)
+        client._refresher.get.return_value = make_snapshot([make_ap()])
+        transport = Mock()
+
+        asyncio.run(client.handleRequest(["nodeinfo"], ("::1", 1), transport))
+        client._refresher.get.assert_called_once()
+        assert json.loads(transport.sendto.call_args.args[0])["hostname"] == "TestAP"
+
+    def test_no_snapshot(self, client):
+        """Test that requests are ignored until the first snapshot exists."""
+        client._refresher = Mock(background=True, snapshot=None)
+        transport = Mock()
+
+        asyncio.run(client.handleRequest(["GET", "nodeinfo"], ("::1", 1), transport))
+        transport.sendto.assert_not_called()
+
+
+class TestUnicastPush:
+    """Test the scheduled unicast push of ResponddClient."""
+
+    @patch("unifi_respondd.respondd_client.time.sleep")
+    @patch("unifi_respondd.scheduler.time.monotonic", return_value=0.0)
+    def test_collects_ahead_of_deadline(self, monotonic, sleep, client):
+        """Test that the snapshot is collected unicast_lead seconds early."""
+        client._config.unicast_period = 60
+        client._config.unicast_lead = 10
+        calls = Mock()
+        calls.attach_mock(sleep, "sleep")
+        client._refresher = Mock(background=False)
+        calls.attach_mock(client._refresher.get, "collect")
+        client.newPushSchedule()
+
+        assert client.waitForPush() is client._refresher.get.return_value
+        assert calls.mock_calls == [call.sleep(50), call.collect(), call.sleep(60)]
+
+    @patch("unifi_respondd.respondd_client.time.sleep")
+    @patch("unifi_respondd.scheduler.time.monotonic", return_value=0.0)
+    def test_background_refresh_ahead_of_deadline(self, monotonic, sleep, client):
+        """Test that a push refreshes the snapshot in background mode too and
+        falls back to the previous one if the collection fails."""
+        client._config.unicast_period = 60
+        client._config.unicast_lead = 10
+        calls = Mock()
+        calls.attach_mock(sleep, "sleep")
+        client._refresher = Mock(background=True)
+        calls.attach_mock(client._refresher.refresh, "refresh")
+        client.newPushSchedule()
+
+        assert client.waitForPush() is client._refresher.refresh.return_value
+        assert calls.mock_calls == [call.sleep(50), call.refresh(), call.sleep(60)]
+        client._refresher.get.assert_not_called()
+
+        client._refresher.refresh.return_value = None
+        assert client.collectForPush() is client._refresher.snapshot
+
+    @patch("unifi_respondd.scheduler.time.monotonic", return_value=62.5)
+    def test_lateness_is_reported(self, monotonic, client):
+        """Test that late pushes are logged and do not shift the schedule."""
+        client._config.unicast_period = 60
+        client._config.unicast_lead = 10
+        client._pushSchedule = PushSchedule(60, lead=10, start=0.0)
+
+        with patch("unifi_respondd.respondd_client.logger") as logger:
+            client.startPush()
+        logger.warning.assert_called_once_with("Unicast push 1 is 2.500s late")
+        assert client._pushSchedule.deadline == 120
+
+    @patch("unifi_respondd.sender.time.sleep")
+    def test_push_is_spread(self, sleep, client):
+        """Test that the packets of a push are spread across the window."""
+        aps = [
+            make_ap(mac="00:00:00:00:00:%02x" % i, name="AP%d" % i) for i in range(10)
+        ]
+
+        with patch("unifi_respondd.sender.time.monotonic", return_value=0.0):
+            client.sendResponse(
+                ("::1", 1), make_snapshot(aps), UNICAST_REQUEST[1:], True, window=5
+            )
+        assert len(sent(client)) == 10
+        assert [c.args[0] for c in sleep.call_args_list] == pytest.approx(
+            [0.5 * i for i in range(1, 10)]
+        )
+
+
+class TestListeners:
+    """Test answering on several listeners from one snapshot."""
+
+    def test_from_dict(self):
+        """Test that listener entries default to the top level keys."""
+        cfg = make_config(
+            make_fleet(1, 1, 0),
+            multicast_enabled=True,
+            listeners=[
+                {"interface": "br-a", "domains": ["a"]},
+                {"interface": "br-b", "multicast_port": 1002, "sites": ["Site 1"]},
+            ],
+        )
+        listeners = Config.from_dict(cfg).get_listeners()
+
+        assert [listenerCfg.interface for listenerCfg in listeners] == ["br-a", "br-b"]
+        assert listeners[0].multicast_port == 1001
+        assert listeners[1].multicast_port == 1002
+        assert listeners[0].multicast_address == "ff05::2:1001"
+        assert all(listenerCfg.multicast_enabled for listenerCfg in listeners)
+
+    def test_default_listener(self):
+        """Test that without listeners the top level interface is served for all APs."""
+        listeners = Config.from_dict(make_config(make_fleet(1, 1, 0))).get_listeners()
+
+        assert len(listeners) == 1
+        assert listeners[0].interface == "lo"
+        assert not listeners[0].filtered
+
+    def test_duplicate_group_rejected(self):
+        """Test that two listeners for the same group, port and interface are rejected."""
+        cfg = make_config(
+            make_fleet(1, 1, 0),
+            multicast_enabled=True,
+            listeners=[
+                {"domains": ["a"]},
+                {"multicast_address": "FF05:0::2:1001", "domains": ["b"]},
+            ],
+        )
+        with pytest.raises(ValueError, match="Listeners 0 and 1"):
+            Config.from_dict(cfg)
+
+        cfg["multicast_enabled"] = False
+        assert len(Config.from_dict(cfg).get_listeners()) == 2
+
+    def test_shares_port(self):
+        """Test that only listeners on the same interface and port share it."""
+        first = Listener("br-a", "ff02::2:1001", 1001, "::1", 1)
+        second = Listener("br-a", "ff05::2:1001", 1001, "::1", 1)
+        third = Listener("br-b", "ff05::2:1001", 1001, "::1", 1)
+        listenerCfgs = [first, second, third]
+
+        assert listener.shares_port(first, listenerCfgs)
+        assert listener.shares_port(second, listenerCfgs)
+        assert not listener.shares_port(third, listenerCfgs)
+        assert not listener.shares_port(first, [first])
+
+    def test_groups_on_one_port(self):
+        """Test that several groups on one interface and port can be bound and
+        that each socket only receives the requests of its group."""
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as probe:
+            probe.bind(("::", 0))
+            port = probe.getsockname()[1]
+
+        def request(ifname, listenerCfgs):
+            if_idx = socket.if_nametoindex(ifname)
+            with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as sender:
+                sender.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_IF, if_idx)
+                for listenerCfg in listenerCfgs:
+                    group = listenerCfg.multicast_address
+                    sender.sendto(group.encode(), (group, port, 0, if_idx))
+
+        for _, ifname in socket.if_nameindex():
+            listenerCfgs = [
+                Listener(ifname, "ff02::2:1001", port, "::1", 1),
+                Listener(ifname, "ff05::2:1001", port, "::1", 1),
+            ]
+            try:
+                socks = listener.open_sockets(listenerCfgs)
+            except OSError as ex:
+                if ex.errno == errno.EADDRINUSE:
+                    raise
+                continue
+            try:
+                request(ifname, listenerCfgs)
+            except OSError:
+                for sock in socks:
+                    sock.close()
+                continue
+            break
+        else:
+            pytest.skip("no interface with multicast")
+        try:
+            for sock, listenerCfg in zip(socks, listenerCfgs):
+                sock.settimeout(2)
+                assert sock.recv(64) == listenerCfg.multicast_address.encode()
+                sock.settimeout(0.1)
+                with pytest.raises(socket.timeout):
+                    sock.recv(64)
+        finally:
+            for sock in socks:
+                sock.close()
+
+    def test_accepts(self):
+        """Test the domain and site filters."""
+        listenerCfg = Listener("lo", "ff05::2:1001", 1001, "::1", 1, sites=["S1"])
+
+        assert listenerCfg.accepts(make_ap(site="S1"))
+        assert not listenerCfg.accepts(make_ap(site="S2"))
+        listenerCfg.domains = ["ffmuc"]
+        assert listenerCfg.accepts(make_ap(site="S1", domain_code="ffmuc"))
+        assert not listenerCfg.accepts(make_ap(site="S1", domain_code="other"))
+
+    def test_filtered_response(self, client):
+        """Test that a listener only answers for its APs and shares the cache."""
+        aps = [
+            make_ap(mac="00:00:00:00:00:01", domain_code="a"),
+            make_ap(mac="00:00:00:00:00:02", domain_code="b"),
+            make_ap(mac="00:00:00:00:00:03", domain_code="a"),
+        ]
+        snapshot = make_snapshot(aps)
+        listenerCfg = Listener("lo", "ff05::2:1001", 1001, "::1", 1, domains=["a"])
+
+        client.sendResponse(("::1", 1), snapshot, ["nodeinfo"], True, 0, listenerCfg)
+        node_ids = [json.loads(inflate(p))["nodeinfo"]["node_id"] for p in sent(client)]
+        assert node_ids == ["000000000001", "000000000003"]
+
+        client.sendResponse(("::1", 1), snapshot, ["nodeinfo"], True)
+        assert sent(client)[2:] == [sent(client)[0], sent(client)[3], sent(client)[1]]
+
+    def test_serve_listeners(self):
+        """Test that one event loop answers on every listener for its domain."""
+
+        class LoopbackClient(ResponddClient):
+            def setupSocket(self):
+                self._socks = []
+                for _ in self._config.get_listeners():
+                    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+                    sock.bind(("::1", 0))
+                    self._socks.append(sock)
+
+        cfg = make_config(
+            make_fleet(1, 1, 0),
+            multicast_enabled=True,
+            listeners=[
+                {"domains": ["a"]},
+                {"multicast_address": "ff02::2:1001", "domains": ["b"]},
+            ],
+        )
+        client = LoopbackClient(Config.from_dict(cfg))
+        client._sock.close()
+        client._refresher = Mock(background=True)
+        client._refresher.snapshot = make_snapshot(
+            [
+                make_ap(mac="00:00:00:00:00:01", domain_code="a"),
+                make_ap(mac="00:00:00:00:00:02", domain_code="b"),
+            ]
+        )
+
+        async def poll(address):
+            loop = asyncio.get_running_loop()
+            responses = asyncio.Queue()
+
+            class Collector(asyncio.DatagramProtocol):
+                def datagram_received(self, data, addr):
+                    responses.put_nowait(data)
+
+            collector, _ = await loop.create_datagram_endpoint(
+                Collector, remote_addr=address
+            )
+            collector.sendto(b"GET nodeinfo")
+            try:
+                return await asyncio.wait_for(responses.get(), 5)
+            finally:
+                collector.close()
+
+        async def run():
+            server = asyncio.get_running_loop().create_task(client.serve())
+            while len(client._socks) < 2 or not all(
+                sock.getblocking() is False for sock in client._socks
+            ):
+                await asyncio.sleep(0.01)
+            try:
+                return [await poll(sock.getsockname()[:2]) for sock in client._socks]
+            finally:
+                server.cancel()
+
+        responses = asyncio.run(run())
+        node_ids = [json.loads(inflate(r))["nodeinfo"]["node_id"] for r in responses]
+        assert node_ids == ["000000000001", "000000000002"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
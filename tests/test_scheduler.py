@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/scheduler.py module."""
+
+from unittest.mock import patch
+
+import pytest
+
+from unifi_respondd.scheduler import PushSchedule
+
+
+class TestPushSchedule:
+    """Test the PushSchedule class."""
+
+    def test_deadlines_do_not_drift(self):
+        """Test that the time a push takes does not shift the next deadline."""
+        schedule = PushSchedule(60, lead=10, start=0.0)
+
+        assert schedule.deadline == 60
+        assert schedule.collect_at == 50
+        assert schedule.pushed(now=60.5) == pytest.approx(0.5)
+        assert schedule.deadline == 120
+        assert schedule.pushed(now=121.25) == pytest.approx(1.25)
+        assert schedule.deadline == 180
+        assert schedule.pushes == 2
+        assert schedule.max_lateness == pytest.approx(1.25)
+
+    def test_early_push_is_not_late(self):
+        """Test that a push before its deadline has no lateness."""
+        schedule = PushSchedule(60, start=0.0)
+
+        assert schedule.pushed(now=59.0) == 0
+        assert schedule.deadline == 120
+
+    def test_missed_deadlines_are_skipped(self):
+        """Test that deadlines passed during a slow push are skipped."""
+        schedule = PushSchedule(60, start=0.0)
+
+        assert schedule.pushed(now=200.0) == pytest.approx(140)
+        assert schedule.missed == 2
+        assert schedule.deadline == 240
+
+    def test_lead_is_bounded_by_period(self):
+        """Test that collection is never due before the previous deadline."""
+        assert PushSchedule(60, lead=90, start=0.0).collect_at == 0
+        assert PushSchedule(60, lead=-5, start=0.0).collect_at == 60
+
+    @patch("unifi_respondd.scheduler.time.monotonic", return_value=1000.0)
+    def test_delay(self, monotonic):
+        """Test the seconds left until a timestamp."""
+        schedule = PushSchedule(60)
+
+        assert schedule.deadline == 1060
+        assert schedule.delay(schedule.collect_at) == 60
+        assert schedule.delay(900.0) == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/sender.py module."""
+
+import asyncio
+import socket
+from unittest.mock import Mock, patch
+
+import pytest
+
+from unifi_respondd.sender import (
+    ADDRESS_CACHE_SIZE,
+    EAGAIN_RETRIES,
+    BatchSender,
+    Pacer,
+)
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    sock.bind(("::1", 0))
+    sock.settimeout(5)
+    yield sock
+    sock.close()
+
+
+def payloads(count):
+    return [b"payload %d" % i for i in range(count)]
+
+
+class TestBatchSender:
+    """Test the BatchSender class."""
+
+    @pytest.mark.parametrize("use_sendmmsg", [True, False])
+    def test_send_over_loopback(self, receiver, use_sendmmsg):
+        """Test that all datagrams arrive in order, batched or not."""
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as sock:
+            sender = BatchSender(sock, batch_size=4, use_sendmmsg=use_sendmmsg)
+            assert sender.send(payloads(10), receiver.getsockname()[:2]) == 10
+
+        assert [receiver.recv(64) for _ in range(10)] == payloads(10)
+        assert sender.sent == 10
+        assert sender.dropped == 0
+        if sender.batched:
+            assert sender.batches == 3
+        else:
+            assert sender.batches == 10
+
+    def test_fallback_for_non_ipv6_socket(self):
+        """Test that non-IPv6 sockets fall back to sendto()."""
+        sock = Mock(family=socket.AF_INET)
+        sender = BatchSender(sock)
+
+        assert not sender.batched
+        sender.send(payloads(2), ("127.0.0.1", 1))
+        assert sock.sendto.call_count == 2
+
+    def test_fallback_uses_transport(self):
+        """Test that the fallback sends on the asyncio transport, if given."""
+        transport = Mock()
+        sender = BatchSender(Mock(), use_sendmmsg=False, transport=transport)
+
+        sender.send(payloads(3), ("::1", 1))
+        assert transport.sendto.call_count == 3
+
+    @patch("unifi_respondd.sender.select.select")
+    def test_eagain_drops_after_retries(self, select):
+        """Test that a socket that stays unwritable drops the datagram."""
+        sock = Mock()
+        sock.sendto.side_effect = [BlockingIOError] * (EAGAIN_RETRIES + 1) + [None]
+        sender = BatchSender(sock, use_sendmmsg=False)
+
+        assert sender.send(payloads(2), ("::1", 1)) == 1
+        assert sender.dropped == 1
+        assert sender.eagain == EAGAIN_RETRIES + 1
+        assert select.call_count == EAGAIN_RETRIES
+
+    @patch("unifi_respondd.sender.asyncio.sleep")
+    @patch("unifi_respondd.sender.select.select")
+    def test_eagain_async_does_not_block(self, select, sleep):
+        """Test that the asyncio path waits on the event loop, not in select()."""
+        sock = Mock()
+        sock.sendto.side_effect = [BlockingIOError] * (EAGAIN_RETRIES + 1) + [None]
+        sender = BatchSender(sock, use_sendmmsg=False)
+
+        sent = asyncio.run(sender.send_batch_async(payloads(2), ("::1", 1)))
+        assert sent == 1
+        assert sender.dropped == 1
+        assert sender.eagain == EAGAIN_RETRIES + 1
+        assert sleep.call_count == EAGAIN_RETRIES
+        select.assert_not_called()
+
+    def test_batch_size_is_bounded(self):
+        """Test that the batch size stays within what sendmmsg() accepts."""
+        assert BatchSender(Mock(), batch_size=0).batch_size == 1
+        assert BatchSender(Mock(), batch_size=5000).batch_size == 1024
+
+    def test_address_cache_is_bounded(self):
+        """Test that only the recently used destinations stay resolved."""
+        sender = BatchSender(Mock(family=socket.AF_INET6))
+        unicast = sender._sockaddr(("ff05::2:1001", 1001))
+        for port in range(1, 2 * ADDRESS_CACHE_SIZE):
+            sender._sockaddr(("::1", port))
+            assert sender._sockaddr(("ff05::2:1001", 1001)) is unicast
+
+        assert len(sender._addresses) == ADDRESS_CACHE_SIZE
+        assert ("::1", 1) not in sender._addresses
+
+
+class TestPacer:
+    """Test the Pacer class."""
+
+    def test_unlimited(self):
+        """Test that a rate of 0 never delays."""
+        pacer = Pacer(0)
+
+        assert pacer.delay(1000) == 0
+        assert pacer.delay(1000) == 0
+
+    @patch("unifi_respondd.sender.time.monotonic", return_value=100.0)
+    def test_rate(self, monotonic):
+        """Test that batches are spaced according to the rate."""
+        pacer = Pacer(1000)
+
+        assert pacer.delay(100) == 0
+        assert pacer.delay(100) == pytest.approx(0.1)
+        monotonic.return_value = 100.5
+        assert pacer.delay(100) == 0
+
+    def test_spread(self):
+        """Test that spreading derives the rate from the window."""
+        assert Pacer.spread(600, 30)._rate == 20
+        assert Pacer.spread(600, 30, rate=10)._rate == 10
+        assert Pacer.spread(600, 0, rate=10)._rate == 10
+        assert Pacer.spread(0, 30)._rate == 0
+
+    def test_batch_size(self):
+        """Test that paced batches get smaller at low rates."""
+        assert Pacer(0).batch_size(64) == 64
+        assert Pacer(20).batch_size(64) == 2
+        assert Pacer(0.5).batch_size(64) == 1
+        assert Pacer(100000).batch_size(64) == 64
+
+    @patch("unifi_respondd.sender.time.sleep")
+    def test_spread_send(self, sleep):
+        """Test that a spread response ends within its window."""
+        sender = BatchSender(Mock(), use_sendmmsg=False)
+
+        with patch("unifi_respondd.sender.time.monotonic", return_value=0.0):
+            sender.send(payloads(300), ("::1", 1), Pacer.spread(300, 30))
+        delays = [c.args[0] for c in sleep.call_args_list]
+        assert len(delays) == 299
+        assert max(delays) == pytest.approx(29.9)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/serializer.py module."""
+
+import json
+
+import pytest
+
+from tests.helpers import make_ap
+from unifi_respondd import serializer
+from unifi_respondd.respondd_client import ResponddClient
+from unifi_respondd.unifi_client import Accesspoints
+
+APS = [
+    make_ap(),
+    make_ap(channel24=None, rx_bytes24=None, tx_bytes24=None),
+    make_ap(channel5=None, rx_bytes5=None, tx_bytes5=None, channel24=14),
+    make_ap(
+        name="Ünïcödé AP",
+        contact=None,
+        snmp_location=None,
+        gateway=None,
+        gateway6=None,
+        gateway_nexthop=None,
+        neighbour_macs=[None],
+        latitude=0.0,
+        longitude=0.0,
+        load_avg=0.123456789,
+    ),
+]
+
+
+def to_dict_path(builder, ap):
+    """Returns the JSON of the dataclasses_json path."""
+    return json.dumps(builder(ap).to_dict())
+
+
+class TestSerializer:
+    """Test that the fast serializer matches the dataclasses_json path."""
+
+    @pytest.mark.parametrize("ap", APS)
+    def test_nodeinfo_is_byte_identical(self, ap):
+        expected = to_dict_path(ResponddClient.buildNodeInfo, ap)
+        assert serializer.dumps(serializer.nodeinfo_dict(ap)) == expected.encode()
+
+    @pytest.mark.parametrize("ap", APS)
+    def test_statistics_is_byte_identical(self, ap):
+        expected = to_dict_path(ResponddClient.buildStatistics, ap)
+        assert serializer.dumps(serializer.statistics_dict(ap)) == expected.encode()
+
+    @pytest.mark.parametrize("ap", APS)
+    def test_neighbours_is_byte_identical(self, ap):
+        expected = to_dict_path(ResponddClient.buildNeighbours, ap)
+        assert serializer.dumps(serializer.neighbours_dict(ap)) == expected.encode()
+
+    def test_sections_cover_all_builders(self):
+        """Test that every respondd section has a fast builder."""
+        client = ResponddClient.__new__(ResponddClient)
+        client._aps = Accesspoints(accesspoints=APS)
+        for section in serializer.SECTIONS:
+            assert client.buildStruct(section) is not None
+
+    def test_orjson_is_opt_in(self):
+        """Test that the byte-identical encoder is the default."""
+        assert serializer.get_dumps(False) is serializer.dumps
+
+    @pytest.mark.skipif(serializer.orjson is None, reason="orjson not installed")
+    def test_orjson_is_equivalent(self):
+        """Test that orjson encodes the same document."""
+        dumps = serializer.get_dumps(True)
+        for ap in APS:
+            section = serializer.statistics_dict(ap)
+            assert json.loads(dumps(section)) == json.loads(serializer.dumps(section))
+
+    @pytest.mark.parametrize(
+        "dumps",
+        [
+            serializer.dumps,
+            lambda obj: json.dumps(obj, separators=(",", ":")).encode(),
+        ],
+    )
+    @pytest.mark.parametrize("ap", APS)
+    def test_join_sections_is_byte_identical(self, dumps, ap):
+        """Test that joining encoded sections matches encoding the node."""
+        names = ["statistics", "nodeinfo"]
+        node = {name: serializer.SECTIONS[name](ap) for name in names}
+        parts = [(name, dumps(section)) for name, section in node.items()]
+
+        joined = serializer.join_sections(parts, *serializer.separators(dumps))
+        assert joined == dumps(node)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/session.py module."""
+
+import io
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+from unifi_respondd.config import Controller
+from unifi_respondd.session import APIError, ControllerSession
+from unifi_respondd.unifi_client import (
+    controller_sessions,
+    get_controller_session,
+    prune_sessions,
+)
+
+
+def make_response(status_code=200, data=None, headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.raw = io.BytesIO(
+        json.dumps({"meta": {"rc": "ok"}, "data": data or []}).encode()
+    )
+    response.headers = headers or {}
+    return response
+
+
+@pytest.fixture
+def session():
+    session = ControllerSession("unifi.lan", "admin", "password")
+    session.session = Mock()
+    session.session.post.return_value = make_response()
+    return session
+
+
+class TestControllerSession:
+    """Test the ControllerSession class."""
+
+    def test_urls(self):
+        """Test the API URLs of the supported controller versions."""
+        v5 = ControllerSession("unifi.lan", "admin", "password", port=8443)
+        assert v5.auth_url == "https://unifi.lan:8443/api/login"
+        assert v5.api_url("default") == "https://unifi.lan:8443/api/s/default/"
+
+        udmp = ControllerSession("udm.lan", "admin", "password", version="UDMP-unifiOS")
+        assert udmp.auth_url == "https://udm.lan/api/auth/login"
+        assert udmp.api_url("x") == "https://udm.lan/proxy/network/api/s/x/"
+
+        local = ControllerSession("http://127.0.0.1", "admin", "password", port=8080)
+        assert local.url == "http://127.0.0.1:8080/"
+
+    def test_unsupported_version(self):
+        """Test that ancient controllers are rejected."""
+        with pytest.raises(APIError):
+            ControllerSession("unifi.lan", "admin", "password", version="v3")
+
+    def test_login_once_across_sites(self, session):
+        """Test that sites are read without logging in again."""
+        session.session.get.side_effect = [
+            make_response(data=[{"mac": "x"}]) for _ in range(3)
+        ]
+
+        session.get_sites()
+        assert session.site("a").get_aps() == [{"mac": "x"}]
+        session.site("b").get_clients()
+
+        assert session.logins == 1
+        urls = [c.args[0] for c in session.session.get.call_args_list]
+        assert urls == [
+            "https://unifi.lan:8443/api/self/sites",
+            "https://unifi.lan:8443/api/s/a/stat/device",
+            "https://unifi.lan:8443/api/s/b/stat/sta",
+        ]
+
+    def test_relogin_on_401(self, session):
+        """Test that an expired session logs in again and retries."""
+        session.session.get.side_effect = [
+            make_response(),
+            make_response(status_code=401),
+            make_response(data=[{"name": "default"}]),
+        ]
+
+        session.get_sites()
+        assert session.get_sites() == [{"name": "default"}]
+        assert session.logins == 2
+
+    def test_no_relogin_on_other_errors(self, session):
+        """Test that other errors are raised without logging in again."""
+        session.session.get.return_value = make_response(status_code=500)
+
+        with pytest.raises(APIError):
+            session.get_sites()
+        assert session.logins == 1
+
+    def test_csrf_token(self, session):
+        """Test that the CSRF token of the login is sent with requests."""
+        session.session.post.return_value = make_response(
+            headers={"X-CSRF-Token": "token"}
+        )
+        session.session.get.return_value = make_response()
+
+        session.get_sites()
+        assert session.session.get.call_args.kwargs["headers"] == {
+            "X-CSRF-Token": "token"
+        }
+
+    def test_login_failure(self, session):
+        """Test that rejected credentials raise an APIError."""
+        session.session.post.return_value = make_response(status_code=403)
+
+        with pytest.raises(APIError):
+            session.get_sites()
+
+    def test_api_error(self, session):
+        """Test that errors reported in the meta field are raised."""
+        response = make_response()
+        response.raw = io.BytesIO(
+            b'{"meta": {"rc": "error", "msg": "api.err.NoSiteContext"}}'
+        )
+        session.session.get.return_value = response
+
+        with pytest.raises(APIError, match="NoSiteContext"):
+            session.get_sites()
+
+
+class TestStreaming:
+    """Test the reduced reading of device and client arrays."""
+
+    devices = [
+        {"mac": "a", "name": "AP1", "port_table": [{"big": "x" * 100}], "up": 1.5},
+        {"mac": "b", "name": "AP2", "port_table": []},
+    ]
+
+    @staticmethod
+    def reduce(doc):
+        return {"mac": doc["mac"]}
+
+    def test_streamed_documents_are_reduced(self, session):
+        """Test that the streamed documents are reduced one by one."""
+        pytest.importorskip("ijson")
+        response = make_response(data=self.devices)
+        session.session.get.return_value = response
+
+        assert session.get_aps("default", self.reduce) == [{"mac": "a"}, {"mac": "b"}]
+        assert session.session.get.call_args.kwargs["stream"] is True
+        response.close.assert_called_once()
+
+    def test_streamed_api_error(self, session):
+        """Test that errors reported in the meta field are raised when streaming."""
+        pytest.importorskip("ijson")
+        response = make_response()
+        response.raw = io.BytesIO(
+            b'{"data": [], "meta": {"rc": "error", "msg": "api.err.NoSiteContext"}}'
+        )
+        session.session.get.return_value = response
+
+        with pytest.raises(APIError, match="NoSiteContext"):
+            session.get_clients("default", self.reduce)
+
+    def test_streamed_deadline(self, session):
+        """Test that a response still streaming after the timeout is given up."""
+        pytest.importorskip("ijson")
+        session._timeout = 10
+        response = make_response(data=self.devices)
+        session.session.get.return_value = response
+
+        with patch("unifi_respondd.session.time.monotonic", side_effect=[0, 11]):
+            with pytest.raises(requests.Timeout):
+                session.get_aps("default", self.reduce)
+        response.close.assert_called_once()
+
+    @patch("unifi_respondd.session.READ_SIZE", 16)
+    @patch("unifi_respondd.session.ijson", None)
+    def test_deadline_without_ijson(self, session):
+        """Test that a response read as a whole is also given up after the timeout."""
+        session._timeout = 10
+        response = make_response(data=self.devices)
+        session.session.get.return_value = response
+
+        with patch("unifi_respondd.session.time.monotonic", side_effect=[0, 1, 11]):
+            with pytest.raises(requests.Timeout):
+                session.get_aps("default", self.reduce)
+        assert session.session.get.call_args.kwargs["stream"] is True
+        response.close.assert_called_once()
+
+    @patch("unifi_respondd.session.ijson", None)
+    def test_fallback_without_ijson(self, session):
+        """Test that documents are reduced after parsing without ijson."""
+        session.session.get.return_value = make_response(data=self.devices)
+
+        assert session.get_aps("default", self.reduce) == [{"mac": "a"}, {"mac": "b"}]
+
+    def test_without_reduce(self, session):
+        """Test that the documents are returned unchanged without reduce."""
+        session.session.get.return_value = make_response(data=self.devices)
+
+        assert session.get_aps("default") == self.devices
+
+
+@patch("unifi_respondd.unifi_client.ControllerSession")
+def test_session_is_shared_across_cycles(mock_session):
+    """Test that get_controller_session reuses the session of a controller."""
+    cfg = Mock(site_workers=1, site_timeout=60)
+    with patch.dict(controller_sessions, clear=True):
+        controller = Controller("unifi.lan", "unifi.lan", 8443, "admin", "admin")
+        assert get_controller_session(cfg, controller) is get_controller_session(
+            cfg, controller
+        )
+        mock_session.assert_called_once()
+        other = Controller("udm", "udm.lan", 443, "admin", "admin", "UDMP-unifiOS")
+        get_controller_session(cfg, other)
+        assert mock_session.call_count == 2
+        assert mock_session.call_args.kwargs["version"] == "UDMP-unifiOS"
+
+
+@patch("unifi_respondd.unifi_client.ControllerSession")
+def test_stale_sessions_are_closed(mock_session):
+    """Test that prune_sessions closes the sessions of changed controllers."""
+    mock_session.side_effect = lambda *args, **kwargs: Mock()
+    cfg = Mock(site_workers=1, site_timeout=60)
+    with patch.dict(controller_sessions, clear=True):
+        kept = Controller("unifi.lan", "unifi.lan", 8443, "admin", "admin")
+        changed = Controller("udm", "udm.lan", 443, "admin", "admin")
+        kept_session = get_controller_session(cfg, kept)
+        old_session = get_controller_session(cfg, changed)
+        changed = Controller("udm", "udm.lan", 443, "admin", "secret")
+        prune_sessions([kept, changed], cfg)
+
+        old_session.close.assert_called_once()
+        kept_session.close.assert_not_called()
+        assert len(controller_sessions) == 1
+        assert get_controller_session(cfg, changed) is not old_session
+
+        prune_sessions([kept], Mock(site_workers=4, site_timeout=60))
+        assert not controller_sessions
+        kept_session.close.assert_called_once()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
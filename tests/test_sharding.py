@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Unit tests for unifi_respondd/sharding.py module."""
+
+import functools
+import os
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.bench_pipeline import mocked_controller
+from tests.helpers import make_ap
+from unifi_respondd import config, serializer, sharding
+from unifi_respondd.fleet import make_config, make_fleet
+from unifi_respondd.refresher import Snapshot
+from unifi_respondd.respondd_client import RecordCache, ResponddClient, ResponseCache
+from unifi_respondd.sharding import NodeRecord, NodeRecords, ShardPool
+from unifi_respondd.unifi_client import Accesspoints
+
+APS = Accesspoints(
+    accesspoints=[
+        make_ap(mac="00:00:00:00:00:%02x" % i, domain_code="d%d" % (i % 2))
+        for i in range(4)
+    ]
+)
+
+
+def fake_collect(directory, index, count):
+    """Returns two records per shard, the first one is reported by every shard.
+
+    The files in directory make a shard fail, crash or hang."""
+    if os.path.exists(os.path.join(directory, "crash-%d" % index)):
+        os._exit(1)
+    if os.path.exists(os.path.join(directory, "hang-%d" % index)):
+        time.sleep(60)
+    if os.path.exists(os.path.join(directory, "fail-%d" % index)):
+        return None
+    generation = len(os.listdir(directory))
+    return [
+        NodeRecord("00:00:00:00:00:00", "d", "s", {}),
+        NodeRecord("00:00:00:00:01:%02x" % index, "d", "s", {"gen": generation}),
+    ]
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ShardPool(2, timeout=10, collect=functools.partial(fake_collect, tmp_path))
+    pool.directory = tmp_path
+    yield pool
+    pool.close()
+
+
+class TestEncode:
+    """Test the serialization of the APs of a shard."""
+
+    def test_payloads_match_response_cache(self):
+        """Test that the records carry the payloads of the ResponseCache and
+        that other requests are joined byte-identically."""
+        with patch.object(sharding, "cache", None):
+            records = NodeRecords(sharding.encode(APS, serializer.dumps))
+        expected = ResponseCache()
+        cache = RecordCache()
+        snapshot = Snapshot(accesspoints=APS, version=1, created=0.0)
+        record_snapshot = Snapshot(accesspoints=records, version=1, created=0.0)
+
+        for sections, multi in sharding.PRECOMPUTED + [
+            (("statistics", "nodeinfo"), True),
+            (("neighbours",), True),
+        ]:
+            assert cache.payloads(
+                record_snapshot, sections, multi
+            ) == expected.payloads(snapshot, sections, multi)
+        assert [record.domain_code for record in records.accesspoints] == [
+            "d0",
+            "d1",
+            "d0",
+            "d1",
+        ]
+
+    def test_shards_partition_the_sites(self, tmp_path):
+        """Test that every site is collected by exactly one shard."""
+        fleet = make_fleet(8, 2, 1)
+        cfg = make_config(fleet, geocache_file=str(tmp_path / "geocache.sqlite"))
+
+        with ExitStack() as stack:
+            mocked_controller(stack, fleet, cfg)
+            stack.enter_context(patch.object(sharding, "cache", None))
+            shards = [sharding.collect_shard(index, 3) for index in range(3)]
+
+        macs = [record.mac for records in shards for record in records]
+        assert len(macs) == len(set(macs)) == fleet.ap_count
+        assert all(records for records in shards)
+
+
+class TestShardPool:
+    """Test collecting in worker processes."""
+
+    def test_merge(self, pool):
+        """Test that the records of all shards are merged and deduplicated."""
+        records = pool.collect().accesspoints
+
+        assert [record.mac for record in records] == [
+            "00:00:00:00:00:00",
+            "00:00:00:00:01:00",
+            "00:00:00:00:01:01",
+        ]
+
+    def test_failure_keeps_previous_data(self, pool):
+        """Test that a failing, crashing or hanging shard keeps its previous
+        records and is restarted, while the other shard is updated."""
+        pool.collect()
+        for marker in ("fail-1", "crash-1", "hang-1"):
+            pool.timeout = 2
+            (pool.directory / marker).touch()
+            records = pool.collect().accesspoints
+            (pool.directory / marker).unlink()
+
+            assert records[1].payloads == {"gen": 1}
+            assert records[2].payloads == {"gen": 0}
+        assert pool.restarts == 2
+        assert pool.collect().accesspoints[2].payloads == {"gen": 0}
+
+    def test_all_failed(self, pool):
+        """Test that None is returned if no shard could be collected."""
+        (pool.directory / "fail-0").touch()
+        (pool.directory / "fail-1").touch()
+
+        assert pool.collect() is None
+
+
+class TestShardedClient:
+    """Test the responder in sharded mode."""
+
+    def test_uses_shard_pool(self):
+        """Test that the responder collects through the workers and answers from records."""
+        cfg = make_config(make_fleet(1, 1, 0), shard_workers=2)
+        client = ResponddClient(config.Config.from_dict(cfg))
+        client._sock.close()
+
+        assert client._shards.count == 2
+        assert client._refresher._collect == client._shards.collect
+        assert isinstance(client._cache, RecordCache)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Unit tests for the startup path of respondd.py."""
+
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.bench_startup import ROOT, best_import_times
+
+# modules only needed once the responder runs or collects
+DEFERRED_MODULES = ("asyncio", "dataclasses_json", "geopy", "requests")
+
+# generous limit in milliseconds for importing the entry point, it takes
+# about a third of it, while importing everything takes about 200 ms
+IMPORT_BUDGET = 150
+
+
+class TestStartup:
+    """Test that the entry point starts listening without the heavy imports."""
+
+    @pytest.mark.parametrize(
+        "module",
+        ["respondd", "unifi_respondd.listener", "unifi_respondd.config_manager"],
+    )
+    def test_deferred_imports(self, module):
+        """Test that importing the fast path does not import the deferred modules."""
+        code = "import sys, %s; print(' '.join(sorted(sys.modules)))" % module
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=ROOT,
+        )
+        loaded = {name.split(".")[0] for name in result.stdout.split()}
+        assert loaded.isdisjoint(DEFERRED_MODULES)
+
+    def test_refresher_defers_unifi_client(self):
+        """Test that the responder only imports the controller client on the first collection."""
+        code = (
+            "import sys, unifi_respondd.respondd_client;"
+            "print('unifi_respondd.unifi_client' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=ROOT,
+        )
+        assert result.stdout.strip() == "False"
+
+    def test_import_budget(self):
+        """Test that importing the entry point stays within the budget."""
+        times = best_import_times("respondd", 3)
+        assert times["respondd"] / 1000 < IMPORT_BUDGET
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
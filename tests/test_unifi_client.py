@@ -1,21 +1,58 @@
 #!/usr/bin/env python3
 """Unit tests for unifi_respondd/unifi_client.py module."""
 
+import json
+import threading
 from unittest.mock import Mock, patch
 
 import pytest
 
+from unifi_respondd import config, config_manager, metrics, unifi_client
+from unifi_respondd.config import Controller
+from unifi_respondd.fleet import FleetController, make_config, make_fleet
+from unifi_respondd.nodelist import Nodelist
 from unifi_respondd.unifi_client import (
     Accesspoint,
     Accesspoints,
+    SsidMatcher,
+    fetch_sites,
     get_ap_channel_usage,
     get_client_count_for_ap,
+    get_client_counts_by_ap,
+    get_client_counts_from_vap_table,
     get_infos,
     get_location_by_address,
+    get_location_cached,
+    get_offloader,
+    get_site_accesspoints,
+    is_inventory_due,
+    reduce_ap,
+    reduce_client,
     scrape,
+    update_site_accesspoints,
 )
 
 
+def make_controller(name="unifi.lan", **overrides):
+    """Returns a Controller with sensible defaults."""
+    fields = dict(
+        name=name,
+        controller_url=name,
+        controller_port=8443,
+        username="admin",
+        password="password",
+    )
+    fields.update(overrides)
+    return Controller(**fields)
+
+
+def make_nodelist(nodes):
+    """Returns a Nodelist that is already populated with nodes."""
+    nodelist = Nodelist("http://example.com/nodes.json", 300)
+    nodelist.by_mac = {node["mac"]: node for node in nodes}
+    return nodelist
+
+
 class TestAccesspointDataclass:
     """Test the Accesspoint dataclass."""
 
@@ -62,6 +99,39 @@ class TestAccesspointDataclass:
         assert ap.domain_code == "ffmuc"
 
 
+class TestCompactAccesspoints:
+    """Test the memory layout of the Accesspoint objects of a site."""
+
+    def test_shared_strings_are_interned(self):
+        """Test that values repeated across APs are stored once."""
+        devices = json.loads(
+            json.dumps(
+                [
+                    {
+                        "name": "AP%d" % i,
+                        "mac": "00:00:00:00:00:%02x" % i,
+                        "state": 1,
+                        "type": "uap",
+                        "model": "U6-Lite",
+                        "version": "6.6.55",
+                        "vap_table": [{"essid": "freifunk", "channel": 36}],
+                    }
+                    for i in range(2)
+                ]
+            )
+        )
+        assert devices[0]["model"] is not devices[1]["model"]
+        cfg = Mock(offloader_mac={}, fallback_domain="test_domain")
+        site = {"name": "testsite", "desc": "testsite"}
+
+        first, second = get_site_accesspoints(
+            site, devices, None, cfg, SsidMatcher("freifunk"), make_nodelist([]), None
+        )
+        assert first.model is second.model
+        assert first.firmware is second.firmware
+        assert not hasattr(first, "__dict__")
+
+
 class TestAccesspointsDataclass:
     """Test the Accesspoints dataclass."""
 
@@ -231,6 +301,152 @@ class TestGetClientCountForAp:
         assert count5 == 1
 
 
+class TestSsidMatcher:
+    """Test the SsidMatcher class."""
+
+    def test_match_case_insensitive(self):
+        """Test that SSIDs are matched case insensitive."""
+        matcher = SsidMatcher(".*freifunk.*")
+
+        assert matcher("FreiFunk-TEST")
+        assert not matcher("other-network")
+
+    def test_match_is_memoized(self):
+        """Test that every distinct SSID is only matched once."""
+        matcher = SsidMatcher(".*freifunk.*")
+        matcher._pattern = Mock(wraps=matcher._pattern)
+
+        for _ in range(3):
+            assert matcher("freifunk-test")
+            assert not matcher("other-network")
+        assert matcher._pattern.search.call_count == 2
+
+
+class TestGetClientCountsByAp:
+    """Test the get_client_counts_by_ap function."""
+
+    def test_counts_all_aps_in_one_pass(self):
+        """Test that clients are grouped by AP and band."""
+        clients = [
+            {"essid": "freifunk-test", "ap_mac": "00:11:22:33:44:55", "channel": 6},
+            {"essid": "freifunk-test", "ap_mac": "00:11:22:33:44:55", "channel": 36},
+            {"essid": "freifunk-test", "ap_mac": "aa:bb:cc:dd:ee:ff", "channel": 11},
+            {"essid": "other-network", "ap_mac": "aa:bb:cc:dd:ee:ff", "channel": 44},
+            {"ap_mac": "aa:bb:cc:dd:ee:ff", "channel": 44},
+        ]
+
+        counts = get_client_counts_by_ap(clients, SsidMatcher(".*freifunk.*"))
+        assert counts == {
+            "00:11:22:33:44:55": (2, 1, 1),
+            "aa:bb:cc:dd:ee:ff": (1, 1, 0),
+        }
+
+    def test_no_clients(self):
+        """Test with no clients connected."""
+        assert get_client_counts_by_ap([], SsidMatcher(".*freifunk.*")) == {}
+
+
+class TestGetClientCountsFromVapTable:
+    """Test the get_client_counts_from_vap_table function."""
+
+    def test_counts_matching_vaps_by_band(self):
+        """Test that num_sta of matching VAPs is summed per band."""
+        ssids = [
+            {"essid": "freifunk-test", "channel": 6, "num_sta": 3},
+            {"essid": "freifunk-guest", "channel": 11, "num_sta": 1},
+            {"essid": "freifunk-test", "channel": 36, "num_sta": 4},
+            {"essid": "other-network", "channel": 44, "num_sta": 7},
+            {"essid": "freifunk-test", "channel": 100},
+        ]
+
+        counts = get_client_counts_from_vap_table(ssids, SsidMatcher(".*freifunk.*"))
+        assert counts == (8, 4, 4)
+
+    def test_no_vaps(self):
+        """Test an AP without VAPs."""
+        assert get_client_counts_from_vap_table([], SsidMatcher(".*")) == (0, 0, 0)
+
+
+class TestReduce:
+    """Test the reduction of controller documents."""
+
+    def test_reduce_ap(self):
+        """Test that only the fields an Accesspoint is built from are kept."""
+        ap = {
+            "name": "TestAP",
+            "mac": "00:11:22:33:44:55",
+            "port_table": [{"port_idx": 1}],
+            "uplink": {"ap_mac": "66:77:88:99:aa:bb", "rssi": -60},
+            "vap_table": [{"essid": "freifunk", "num_sta": 2, "sta_table": []}],
+            "lldp_table": None,
+            "sys_stats": {"loadavg_1": "0.5", "loadavg_5": "0.4"},
+        }
+
+        assert reduce_ap(ap) == {
+            "name": "TestAP",
+            "mac": "00:11:22:33:44:55",
+            "uplink": {"ap_mac": "66:77:88:99:aa:bb"},
+            "vap_table": [{"essid": "freifunk", "num_sta": 2}],
+            "lldp_table": None,
+            "sys_stats": {"loadavg_1": "0.5"},
+        }
+
+    def test_reduce_client(self):
+        """Test that clients are reduced to what they are counted by."""
+        client = {"essid": "freifunk", "ap_mac": "x", "channel": 6, "hostname": "y"}
+
+        assert reduce_client(client) == {
+            "essid": "freifunk",
+            "ap_mac": "x",
+            "channel": 6,
+        }
+
+
+class TestClientCountSources:
+    """Test that both client count sources yield the same Accesspoints."""
+
+    def test_vap_table_matches_client_list(self):
+        """Test that counting from vap_table agrees with the client list."""
+        aps = [
+            {
+                "name": "AP%d" % i,
+                "mac": mac,
+                "state": 1,
+                "type": "uap",
+                "vap_table": [
+                    {"essid": "freifunk", "channel": 6, "num_sta": count24},
+                    {"essid": "freifunk", "channel": 36, "num_sta": count5},
+                    {"essid": "private", "channel": 36, "num_sta": 2},
+                ],
+            }
+            for i, (mac, count24, count5) in enumerate(
+                [("00:00:00:00:00:01", 2, 3), ("00:00:00:00:00:02", 0, 1)]
+            )
+        ]
+        clients = [
+            {"essid": essid, "ap_mac": ap["mac"], "channel": vap["channel"]}
+            for ap in aps
+            for vap in ap["vap_table"]
+            for essid in [vap["essid"]] * vap["num_sta"]
+        ]
+        cfg = Mock()
+        cfg.offloader_mac = {}
+        cfg.fallback_domain = "test_domain"
+        site = {"name": "testsite", "desc": "testsite"}
+        matcher = SsidMatcher("freifunk")
+        nodes = make_nodelist([])
+
+        from_clients = get_site_accesspoints(
+            site, aps, clients, cfg, matcher, nodes, Mock()
+        )
+        from_vap_table = get_site_accesspoints(
+            site, aps, None, cfg, matcher, nodes, Mock()
+        )
+        assert from_vap_table == from_clients
+        assert [ap.client_count for ap in from_vap_table] == [5, 1]
+        assert [ap.client_count24 for ap in from_vap_table] == [2, 0]
+
+
 class TestGetApChannelUsage:
     """Test the get_ap_channel_usage function."""
 
@@ -379,6 +595,129 @@ class TestGetLocationByAddress:
         result = mock_get_location(address, app)
         assert result == (0.0, 0.0)
 
+    @patch("unifi_respondd.unifi_client.time.sleep")
+    def test_geocoding_failure_bounded_backoff(self, mock_sleep):
+        """Test that failing lookups are retried with a bounded backoff."""
+        address = "Invalid Address"
+        app = Mock()
+        app.geocode.side_effect = Exception("Geocoding failed")
+
+        assert get_location_by_address(address, app, retries=3) is None
+        assert app.geocode.call_count == 3
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [1, 2, 4]
+
+    @patch("unifi_respondd.unifi_client.time.sleep")
+    def test_geocoding_unknown_address(self, mock_sleep):
+        """Test that unknown addresses are not retried."""
+        app = Mock()
+        app.geocode.return_value = None
+
+        assert get_location_by_address("Nowhere", app) is None
+        app.geocode.assert_called_once_with("Nowhere")
+
+
+class TestGetLocationCached:
+    """Test the get_location_cached function."""
+
+    @patch("unifi_respondd.unifi_client.geocode_address")
+    def test_shared_address_resolved_once(self, mock_geocode, tmp_path):
+        """Test that an address shared by many APs is only geocoded once."""
+        cfg = Mock()
+        cfg.geocache_file = str(tmp_path / "geocache.sqlite")
+        cfg.geocache_ttl = 3600
+        cfg.geocache_negative_ttl = 60
+        cfg.geocache_max_entries = 100
+        cfg.geocode_retries = 3
+        mock_geocode.return_value = ("48.1351", "11.5820")
+
+        for address in ["Munich, Germany", "munich,  germany", "Munich, Germany"]:
+            lat, lon = get_location_cached(address, Mock(), cfg)
+            assert lat == pytest.approx(48.1351)
+            assert lon == pytest.approx(11.5820)
+        mock_geocode.assert_called_once()
+
+    @staticmethod
+    def make_cfg(tmp_path):
+        cfg = Mock()
+        cfg.geocache_file = str(tmp_path / "geocache.sqlite")
+        cfg.geocache_ttl = 3600
+        cfg.geocache_negative_ttl = 3600
+        cfg.geocache_max_entries = 100
+        cfg.geocode_retries = 2
+        return cfg
+
+    @patch("unifi_respondd.unifi_client.time.sleep")
+    @patch.object(unifi_client, "geocoder_failed", False)
+    def test_failures_are_not_cached(self, mock_sleep, tmp_path):
+        """Test that only unknown addresses are cached, not failed lookups."""
+        cfg = self.make_cfg(tmp_path)
+        app = Mock()
+        app.geocode.side_effect = Exception("Service unavailable")
+
+        assert get_location_cached("Munich, Germany", app, cfg) is None
+        # the next collection
+        unifi_client.geocoder_failed = False
+        app.geocode.side_effect = None
+        app.geocode.return_value = Mock(raw={"lat": "48.1351", "lon": "11.5820"})
+        lat, lon = get_location_cached("Munich, Germany", app, cfg)
+        assert lat == pytest.approx(48.1351)
+
+        app.geocode.return_value = None
+        assert get_location_cached("Nowhere", app, cfg) is None
+        assert get_location_cached("Nowhere", app, cfg) is None
+        assert app.geocode.call_count == 4
+
+    @patch("unifi_respondd.unifi_client.time.sleep")
+    @patch.object(unifi_client, "geocoder_failed", False)
+    def test_failure_is_not_retried_per_ap(self, mock_sleep, tmp_path):
+        """Test that many APs sharing an address that fails only wait for the
+        retries of the first one in a collection."""
+        cfg = self.make_cfg(tmp_path)
+        cfg.offloader_mac = {}
+        cfg.fallback_domain = "test_domain"
+        app = Mock()
+        app.geocode.side_effect = Exception("Service unavailable")
+        devices = [
+            {
+                "name": "AP%d" % i,
+                "mac": "00:00:00:00:00:%02x" % i,
+                "state": 1,
+                "type": "uap",
+                "snmp_location": "Marienplatz 1, Munich",
+                "vap_table": [{"essid": "freifunk", "channel": 36}],
+            }
+            for i in range(100)
+        ]
+        site = {"name": "testsite", "desc": "testsite"}
+
+        aps = get_site_accesspoints(
+            site, devices, None, cfg, SsidMatcher("freifunk"), make_nodelist([]), app
+        )
+        assert len(aps) == 100
+        assert all((ap.latitude, ap.longitude) == (0, 0) for ap in aps)
+        assert app.geocode.call_count == cfg.geocode_retries
+        assert sum(c.args[0] for c in mock_sleep.call_args_list) == 3
+
+    @patch.object(unifi_client, "geocache", None)
+    def test_cache_reopened_on_path_change(self, tmp_path):
+        """Test that the old cache is closed when geocache_file changes."""
+        cfg = self.make_cfg(tmp_path)
+        first = unifi_client.get_geocache(cfg)
+        assert unifi_client.get_geocache(cfg) is first
+        cfg.geocache_file = str(tmp_path / "other.sqlite")
+        with patch.object(first, "close", wraps=first.close) as close:
+            second = unifi_client.get_geocache(cfg)
+        close.assert_called_once()
+        assert second is not first and second.path == cfg.geocache_file
+        second.close()
+
+    @patch("unifi_respondd.unifi_client.geocode_address")
+    def test_coordinates_bypass_cache(self, mock_geocode):
+        """Test that coordinate pairs are parsed without the cache."""
+        lat, lon = get_location_cached("48.1351, 11.5820", Mock(), Mock())
+        assert lat == pytest.approx(48.1351)
+        mock_geocode.assert_not_called()
+
 
 class TestScrape:
     """Test the scrape function."""
@@ -405,13 +744,134 @@ class TestScrape:
         mock_logger.assert_called_once()
 
 
+class TestGetOffloader:
+    """Test the get_offloader function."""
+
+    def test_offloader_in_nodelist(self):
+        """Test resolving a configured offloader from the nodelist."""
+        cfg = Mock()
+        cfg.offloader_mac = {"testsite": "aa:bb:cc:dd:ee:ff"}
+        node = {"mac": "aa:bb:cc:dd:ee:ff", "domain": "ffmuc"}
+
+        result = get_offloader("testsite", cfg, make_nodelist([node]))
+        assert result == ("aa:bb:cc:dd:ee:ff", "aabbccddeeff", node)
+
+    def test_offloader_not_in_nodelist(self):
+        """Test a configured offloader that is missing from the nodelist."""
+        cfg = Mock()
+        cfg.offloader_mac = {"testsite": "aa:bb:cc:dd:ee:ff"}
+
+        result = get_offloader("testsite", cfg, make_nodelist([]))
+        assert result == ("aa:bb:cc:dd:ee:ff", None, {})
+
+    def test_site_without_offloader(self):
+        """Test a site without a configured offloader."""
+        cfg = Mock()
+        cfg.offloader_mac = {}
+
+        result = get_offloader("testsite", cfg, make_nodelist([]))
+        assert result == (None, None, {})
+
+
+class TestFetchSites:
+    """Test the fetch_sites function."""
+
+    @staticmethod
+    def make_cfg(workers, timeout=60):
+        cfg = Mock()
+        cfg.version = "v5"
+        cfg.site_workers = workers
+        cfg.site_timeout = timeout
+        cfg.client_count_source = "clients"
+        return cfg
+
+    @staticmethod
+    def make_site(name):
+        return {"name": name, "desc": name}
+
+    @staticmethod
+    def make_session(get_aps):
+        """Returns a controller session whose sites answer with get_aps."""
+        c = Mock()
+        c.site.side_effect = lambda site_id: Mock(
+            site_id=site_id,
+            get_aps=Mock(side_effect=lambda reduce: get_aps(site_id)),
+            get_clients=Mock(return_value=[]),
+        )
+        return c
+
+    def test_sites_are_bound_to_their_site_id(self):
+        """Test that every site is fetched with its own site_id."""
+        c = self.make_session(lambda site_id: [site_id])
+        sites = [self.make_site("a"), self.make_site("b")]
+
+        result = fetch_sites(c, sites, self.make_cfg(2))
+        assert result == {"a": (["a"], []), "b": (["b"], [])}
+
+    def test_sites_run_concurrently(self):
+        """Test that sites are fetched in parallel."""
+        barrier = threading.Barrier(3, timeout=5)
+        c = self.make_session(lambda site_id: barrier.wait() and [])
+        sites = [self.make_site(name) for name in "abc"]
+
+        result = fetch_sites(c, sites, self.make_cfg(3))
+        assert set(result) == {"a", "b", "c"}
+
+    @patch("unifi_respondd.unifi_client.logger.error")
+    def test_failed_site_is_missing(self, mock_logger):
+        """Test that a failing site does not affect the other sites."""
+
+        def get_aps(site_id):
+            if site_id == "a":
+                raise Exception("Connection failed")
+            return []
+
+        c = self.make_session(get_aps)
+        sites = [self.make_site("a"), self.make_site("b")]
+
+        result = fetch_sites(c, sites, self.make_cfg(2))
+        assert set(result) == {"b"}
+        mock_logger.assert_called_once()
+
+    @patch("unifi_respondd.unifi_client.logger.error")
+    def test_slow_site_times_out(self, mock_logger):
+        """Test that a site exceeding site_timeout is given up."""
+        release = threading.Event()
+
+        def get_aps(site_id):
+            if site_id == "slow":
+                release.wait(5)
+            return []
+
+        c = self.make_session(get_aps)
+        sites = [self.make_site("slow"), self.make_site("fast")]
+
+        result = fetch_sites(c, sites, self.make_cfg(2, timeout=0.2))
+        release.set()
+        assert set(result) == {"fast"}
+        mock_logger.assert_called_once_with("Timeout collecting site slow")
+
+    def test_vap_table_source_skips_clients(self):
+        """Test that the client list is not fetched when counting from vap_table."""
+        site_c = Mock()
+        site_c.get_aps.return_value = ["a"]
+        c = Mock()
+        c.site.return_value = site_c
+        cfg = self.make_cfg(1)
+        cfg.client_count_source = "vap_table"
+
+        result = fetch_sites(c, [self.make_site("a")], cfg)
+        assert result == {"a": (["a"], None)}
+        site_c.get_clients.assert_not_called()
+
+
 class TestGetInfos:
     """Test the get_infos function (main integration function)."""
 
     @patch("unifi_respondd.unifi_client.config.load_config")
     @patch("unifi_respondd.unifi_client.config.Config.from_dict")
-    @patch("unifi_respondd.unifi_client.scrape")
-    @patch("unifi_respondd.unifi_client.Controller")
+    @patch("unifi_respondd.unifi_client.get_nodelist")
+    @patch("unifi_respondd.unifi_client.get_controller_session")
     @patch("unifi_respondd.unifi_client.Nominatim")
     @patch("unifi_respondd.unifi_client.logger.error")
     def test_get_infos_controller_error(
@@ -419,7 +879,7 @@ class TestGetInfos:
         mock_logger,
         mock_nominatim,
         mock_controller,
-        mock_scrape,
+        mock_nodelist,
         mock_config_from_dict,
         mock_load_config,
     ):
@@ -428,7 +888,8 @@ class TestGetInfos:
         mock_cfg = Mock()
         mock_cfg.nodelist = "http://example.com/nodes.json"
         mock_config_from_dict.return_value = mock_cfg
-        mock_scrape.return_value = {"nodes": []}
+        mock_cfg.get_controllers.return_value = [make_controller()]
+        mock_nodelist.return_value = make_nodelist([])
         mock_controller.side_effect = Exception("Connection failed")
 
         result = get_infos()
@@ -437,14 +898,14 @@ class TestGetInfos:
 
     @patch("unifi_respondd.unifi_client.config.load_config")
     @patch("unifi_respondd.unifi_client.config.Config.from_dict")
-    @patch("unifi_respondd.unifi_client.scrape")
-    @patch("unifi_respondd.unifi_client.Controller")
+    @patch("unifi_respondd.unifi_client.get_nodelist")
+    @patch("unifi_respondd.unifi_client.get_controller_session")
     @patch("unifi_respondd.unifi_client.Nominatim")
     def test_get_infos_basic_success(
         self,
         mock_nominatim,
         mock_controller,
-        mock_scrape,
+        mock_nodelist,
         mock_config_from_dict,
         mock_load_config,
     ):
@@ -462,10 +923,15 @@ class TestGetInfos:
         mock_cfg.ssid_regex = ".*freifunk.*"
         mock_cfg.offloader_mac = {}
         mock_cfg.fallback_domain = "test_domain"
+        mock_cfg.site_workers = 1
+        mock_cfg.site_timeout = 60
+        mock_cfg.client_count_source = "clients"
+        mock_cfg.inventory_interval = 0
         mock_config_from_dict.return_value = mock_cfg
+        mock_cfg.get_controllers.return_value = [make_controller()]
 
-        # Setup scrape
-        mock_scrape.return_value = {"nodes": []}
+        # Setup nodelist
+        mock_nodelist.return_value = make_nodelist([])
 
         # Setup controller
         mock_controller_instance = Mock()
@@ -479,12 +945,12 @@ class TestGetInfos:
 
     @patch("unifi_respondd.unifi_client.config.load_config")
     @patch("unifi_respondd.unifi_client.config.Config.from_dict")
-    @patch("unifi_respondd.unifi_client.scrape")
-    @patch("unifi_respondd.unifi_client.Controller")
+    @patch("unifi_respondd.unifi_client.get_nodelist")
+    @patch("unifi_respondd.unifi_client.get_controller_session")
     @patch("unifi_respondd.unifi_client.Nominatim")
-    @patch("unifi_respondd.unifi_client.get_client_count_for_ap")
+    @patch("unifi_respondd.unifi_client.get_client_counts_by_ap")
     @patch("unifi_respondd.unifi_client.get_ap_channel_usage")
-    @patch("unifi_respondd.unifi_client.get_location_by_address")
+    @patch("unifi_respondd.unifi_client.get_location_cached")
     def test_get_infos_with_access_points(
         self,
         mock_get_location,
@@ -492,7 +958,7 @@ class TestGetInfos:
         mock_get_clients,
         mock_nominatim,
         mock_controller,
-        mock_scrape,
+        mock_nodelist,
         mock_config_from_dict,
         mock_load_config,
     ):
@@ -510,11 +976,16 @@ class TestGetInfos:
         mock_cfg.ssid_regex = ".*freifunk.*"
         mock_cfg.offloader_mac = {"testsite": "aa:bb:cc:dd:ee:ff"}
         mock_cfg.fallback_domain = "test_domain"
+        mock_cfg.site_workers = 1
+        mock_cfg.site_timeout = 60
+        mock_cfg.client_count_source = "clients"
+        mock_cfg.inventory_interval = 0
         mock_config_from_dict.return_value = mock_cfg
+        mock_cfg.get_controllers.return_value = [make_controller()]
 
-        # Setup scrape
-        mock_scrape.return_value = {
-            "nodes": [
+        # Setup nodelist
+        mock_nodelist.return_value = make_nodelist(
+            [
                 {
                     "mac": "aa:bb:cc:dd:ee:ff",
                     "gateway": "10.0.0.1",
@@ -522,7 +993,7 @@ class TestGetInfos:
                     "domain": "ffmuc",
                 }
             ]
-        }
+        )
 
         # Setup controller
         mock_controller_instance = Mock()
@@ -558,11 +1029,11 @@ class TestGetInfos:
             ],
         }
 
-        mock_controller_instance.get_aps.return_value = [mock_ap]
-        mock_controller_instance.get_clients.return_value = []
+        mock_controller_instance.site.return_value.get_aps.return_value = [mock_ap]
+        mock_controller_instance.site.return_value.get_clients.return_value = []
 
         # Setup helper functions
-        mock_get_clients.return_value = (5, 2, 3)
+        mock_get_clients.return_value = {"00:11:22:33:44:55": (5, 2, 3)}
         mock_get_channel.return_value = (36, 1000, 2000, None, None, None)
         mock_get_location.return_value = (48.1351, 11.5820)
 
@@ -573,17 +1044,21 @@ class TestGetInfos:
         assert result.accesspoints[0].name == "TestAP"
         assert result.accesspoints[0].mac == "00:11:22:33:44:55"
         assert result.accesspoints[0].client_count == 5
+        assert result.accesspoints[0].gateway == "10.0.0.1"
+        assert result.accesspoints[0].gateway_nexthop == "aabbccddeeff"
+        assert result.accesspoints[0].domain_code == "ffmuc"
+        assert result.accesspoints[0].neighbour_macs == ["aa:bb:cc:dd:ee:ff"]
 
     @patch("unifi_respondd.unifi_client.config.load_config")
     @patch("unifi_respondd.unifi_client.config.Config.from_dict")
-    @patch("unifi_respondd.unifi_client.scrape")
-    @patch("unifi_respondd.unifi_client.Controller")
+    @patch("unifi_respondd.unifi_client.get_nodelist")
+    @patch("unifi_respondd.unifi_client.get_controller_session")
     @patch("unifi_respondd.unifi_client.Nominatim")
     def test_get_infos_filters_non_uap_devices(
         self,
         mock_nominatim,
         mock_controller,
-        mock_scrape,
+        mock_nodelist,
         mock_config_from_dict,
         mock_load_config,
     ):
@@ -601,10 +1076,15 @@ class TestGetInfos:
         mock_cfg.ssid_regex = ".*freifunk.*"
         mock_cfg.offloader_mac = {}
         mock_cfg.fallback_domain = "test_domain"
+        mock_cfg.site_workers = 1
+        mock_cfg.site_timeout = 60
+        mock_cfg.client_count_source = "clients"
+        mock_cfg.inventory_interval = 0
         mock_config_from_dict.return_value = mock_cfg
+        mock_cfg.get_controllers.return_value = [make_controller()]
 
-        # Setup scrape
-        mock_scrape.return_value = {"nodes": []}
+        # Setup nodelist
+        mock_nodelist.return_value = make_nodelist([])
 
         # Setup controller
         mock_controller_instance = Mock()
@@ -621,8 +1101,8 @@ class TestGetInfos:
             "type": "usw",  # This is a switch, not an AP
         }
 
-        mock_controller_instance.get_aps.return_value = [mock_ap]
-        mock_controller_instance.get_clients.return_value = []
+        mock_controller_instance.site.return_value.get_aps.return_value = [mock_ap]
+        mock_controller_instance.site.return_value.get_clients.return_value = []
 
         result = get_infos()
         assert result is not None
@@ -631,14 +1111,14 @@ class TestGetInfos:
 
     @patch("unifi_respondd.unifi_client.config.load_config")
     @patch("unifi_respondd.unifi_client.config.Config.from_dict")
-    @patch("unifi_respondd.unifi_client.scrape")
-    @patch("unifi_respondd.unifi_client.Controller")
+    @patch("unifi_respondd.unifi_client.get_nodelist")
+    @patch("unifi_respondd.unifi_client.get_controller_session")
     @patch("unifi_respondd.unifi_client.Nominatim")
     def test_get_infos_filters_aps_without_matching_ssid(
         self,
         mock_nominatim,
         mock_controller,
-        mock_scrape,
+        mock_nodelist,
         mock_config_from_dict,
         mock_load_config,
     ):
@@ -656,10 +1136,15 @@ class TestGetInfos:
         mock_cfg.ssid_regex = ".*freifunk.*"
         mock_cfg.offloader_mac = {}
         mock_cfg.fallback_domain = "test_domain"
+        mock_cfg.site_workers = 1
+        mock_cfg.site_timeout = 60
+        mock_cfg.client_count_source = "clients"
+        mock_cfg.inventory_interval = 0
         mock_config_from_dict.return_value = mock_cfg
+        mock_cfg.get_controllers.return_value = [make_controller()]
 
-        # Setup scrape
-        mock_scrape.return_value = {"nodes": []}
+        # Setup nodelist
+        mock_nodelist.return_value = make_nodelist([])
 
         # Setup controller
         mock_controller_instance = Mock()
@@ -684,14 +1169,349 @@ class TestGetInfos:
             ],
         }
 
-        mock_controller_instance.get_aps.return_value = [mock_ap]
-        mock_controller_instance.get_clients.return_value = []
+        mock_controller_instance.site.return_value.get_aps.return_value = [mock_ap]
+        mock_controller_instance.site.return_value.get_clients.return_value = []
 
         result = get_infos()
         assert result is not None
         assert isinstance(result, Accesspoints)
         assert len(result.accesspoints) == 0
 
+    @patch("unifi_respondd.unifi_client.config.load_config")
+    @patch("unifi_respondd.unifi_client.config.Config.from_dict")
+    @patch("unifi_respondd.unifi_client.get_nodelist")
+    @patch("unifi_respondd.unifi_client.get_controller_session")
+    @patch("unifi_respondd.unifi_client.Nominatim")
+    @patch("unifi_respondd.unifi_client.fetch_sites")
+    @patch("unifi_respondd.unifi_client.get_site_accesspoints")
+    @patch.dict("unifi_respondd.unifi_client.site_accesspoints", clear=True)
+    def test_get_infos_keeps_previous_data_of_failed_sites(
+        self,
+        mock_get_site_accesspoints,
+        mock_fetch_sites,
+        mock_nominatim,
+        mock_controller,
+        mock_nodelist,
+        mock_config_from_dict,
+        mock_load_config,
+    ):
+        """Test that sites which could not be fetched keep their previous APs."""
+        mock_cfg = Mock()
+        mock_cfg.ssid_regex = ".*freifunk.*"
+        mock_cfg.inventory_interval = 0
+        mock_config_from_dict.return_value = mock_cfg
+        mock_cfg.get_controllers.return_value = [make_controller()]
+        mock_controller.return_value.get_sites.return_value = [
+            {"name": "a", "desc": "a"},
+            {"name": "b", "desc": "b"},
+        ]
+        ap_a, ap_b, ap_b2 = Mock(), Mock(), Mock()
+        mock_fetch_sites.side_effect = [
+            {"a": ([], []), "b": ([], [])},
+            {"a": ([], [])},
+            {"b": ([], [])},
+        ]
+        mock_get_site_accesspoints.side_effect = [[ap_a], [ap_b], [], [ap_b2]]
+
+        assert get_infos().accesspoints == [ap_a, ap_b]
+        assert get_infos().accesspoints == [ap_b]
+        assert get_infos().accesspoints == [ap_b2]
+
+
+class TestTwoTierRefresh:
+    """Test the stats-only update between full refreshes of a site."""
+
+    site = {"name": "testsite", "desc": "testsite"}
+
+    @staticmethod
+    def make_cfg(inventory_interval=600):
+        cfg = Mock()
+        cfg.offloader_mac = {}
+        cfg.fallback_domain = "test_domain"
+        cfg.inventory_interval = inventory_interval
+        return cfg
+
+    @staticmethod
+    def make_device(mac="00:11:22:33:44:55", **overrides):
+        device = {
+            "name": "TestAP",
+            "mac": mac,
+            "state": 1,
+            "type": "uap",
+            "model": "U6-Lite",
+            "uptime": 100,
+            "snmp_location": "48.1351, 11.5820",
+            "vap_table": [{"essid": "freifunk", "channel": 36, "num_sta": 1}],
+            "sys_stats": {"loadavg_1": "0.5", "mem_total": 1000},
+        }
+        device.update(overrides)
+        return device
+
+    def test_update_keeps_inventory_and_refreshes_stats(self):
+        """Test that only the changing fields are taken from a light poll."""
+        cfg = self.make_cfg()
+        matcher = SsidMatcher("freifunk")
+        previous = get_site_accesspoints(
+            self.site,
+            [self.make_device()],
+            None,
+            cfg,
+            matcher,
+            make_nodelist([]),
+            Mock(),
+        )
+        device = self.make_device(
+            name="Renamed",
+            uptime=160,
+            vap_table=[{"essid": "freifunk", "channel": 6, "num_sta": 4}],
+        )
+
+        (ap,) = update_site_accesspoints(previous, [device], None, cfg, matcher)
+        assert ap.name == "TestAP"
+        assert ap.latitude == previous[0].latitude
+        assert ap.uptime == 160
+        assert (ap.client_count, ap.client_count24, ap.channel24) == (4, 4, 6)
+        assert ap.channel5 is None
+
+    def test_changed_aps_need_full_refresh(self):
+        """Test that new or vanished APs are not handled by the light update."""
+        cfg = self.make_cfg()
+        matcher = SsidMatcher("freifunk")
+        previous = get_site_accesspoints(
+            self.site,
+            [self.make_device()],
+            None,
+            cfg,
+            matcher,
+            make_nodelist([]),
+            Mock(),
+        )
+
+        added = [self.make_device(), self.make_device(mac="66:77:88:99:aa:bb")]
+        assert update_site_accesspoints(previous, added, None, cfg, matcher) is None
+        offline = [self.make_device(state=0)]
+        assert update_site_accesspoints(previous, offline, None, cfg, matcher) is None
+
+    @patch.dict("unifi_respondd.unifi_client.site_accesspoints", {"a": []}, clear=True)
+    @patch.dict("unifi_respondd.unifi_client.site_inventory", {"a": 1000.0}, clear=True)
+    @patch("unifi_respondd.unifi_client.time.monotonic", return_value=1300.0)
+    def test_inventory_due(self, monotonic):
+        """Test when a site needs a full refresh."""
+        assert not is_inventory_due("a", self.make_cfg(600))
+        assert is_inventory_due("a", self.make_cfg(0))
+        assert is_inventory_due("b", self.make_cfg(600))
+        monotonic.return_value = 1600.0
+        assert is_inventory_due("a", self.make_cfg(600))
+
+    @patch("unifi_respondd.unifi_client.config.load_config")
+    @patch("unifi_respondd.unifi_client.config.Config.from_dict")
+    @patch("unifi_respondd.unifi_client.get_nodelist")
+    @patch("unifi_respondd.unifi_client.get_controller_session")
+    @patch("unifi_respondd.unifi_client.Nominatim")
+    @patch("unifi_respondd.unifi_client.fetch_sites")
+    @patch("unifi_respondd.unifi_client.get_location_cached")
+    @patch.dict("unifi_respondd.unifi_client.site_accesspoints", clear=True)
+    @patch.dict("unifi_respondd.unifi_client.site_inventory", clear=True)
+    def test_get_infos_geocodes_only_on_full_refresh(
+        self,
+        mock_get_location,
+        mock_fetch_sites,
+        mock_nominatim,
+        mock_controller,
+        mock_nodelist,
+        mock_config_from_dict,
+        mock_load_config,
+    ):
+        """Test that light polls do not repeat the inventory work."""
+        cfg = self.make_cfg()
+        cfg.ssid_regex = "freifunk"
+        mock_config_from_dict.return_value = cfg
+        cfg.get_controllers.return_value = [make_controller()]
+        mock_nodelist.return_value = make_nodelist([])
+        mock_controller.return_value.get_sites.return_value = [self.site]
+        mock_get_location.return_value = (48.1351, 11.5820)
+        mock_fetch_sites.side_effect = [
+            {"testsite": ([self.make_device(uptime=uptime)], None)}
+            for uptime in (100, 160)
+        ]
+
+        assert get_infos().accesspoints[0].uptime == 100
+        assert get_infos().accesspoints[0].uptime == 160
+        mock_get_location.assert_called_once()
+
+
+class TestControllers:
+    """Test collecting several controllers into one snapshot."""
+
+    @pytest.fixture
+    def collect(self, tmp_path):
+        """Returns a function running get_infos() for a config dict, with the
+        controllers served from fleets by their controller_url."""
+        fleets = {"a": make_fleet(2, 3, 1), "b": make_fleet(3, 3, 1, seed=1)}
+        nodes = Nodelist("http://127.0.0.1/nodes.json", 300)
+        nodes.by_mac = {node["mac"]: node for node in fleets["b"].nodes}
+        controllers = {url: FleetController(fleet) for url, fleet in fleets.items()}
+
+        def get_controller_session(cfg, controller):
+            return controllers[controller.controller_url]
+
+        def collect(cfg):
+            with patch.object(config, "load_config", return_value=cfg), patch.object(
+                unifi_client, "get_nodelist", return_value=nodes
+            ):
+                config_manager.manager = None
+                return get_infos()
+
+        with patch.object(
+            unifi_client, "get_controller_session", side_effect=get_controller_session
+        ) as session, patch.dict(
+            unifi_client.site_accesspoints, clear=True
+        ), patch.dict(
+            unifi_client.site_inventory, clear=True
+        ), patch.dict(
+            unifi_client.controller_sites, clear=True
+        ):
+            collect.fleets = fleets
+            collect.session = session
+            collect.geocache_file = str(tmp_path / "geocache.sqlite")
+            yield collect
+
+    def make_cfg(self, collect, controllers):
+        cfg = make_config(
+            collect.fleets["b"],
+            geocache_file=collect.geocache_file,
+            controllers=controllers,
+        )
+        for key in ("controller_url", "username", "password"):
+            del cfg[key]
+        return cfg
+
+    def test_from_dict(self):
+        """Test that controller entries default to the top level keys."""
+        cfg = make_config(
+            make_fleet(1, 1, 0),
+            controllers=[
+                {"controller_url": "unifi.lan"},
+                {
+                    "name": "udm",
+                    "controller_url": "udm.lan",
+                    "controller_port": 443,
+                    "version": "UDMP-unifiOS",
+                    "ssl_verify": True,
+                    "username": "ro",
+                    "sites": ["Site 0"],
+                },
+            ],
+        )
+        first, second = config.Config.from_dict(cfg).get_controllers()
+
+        assert (first.name, first.controller_port, first.version) == (
+            "unifi.lan:8443",
+            8443,
+            "v5",
+        )
+        assert (first.username, first.ssl_verify) == ("admin", False)
+        assert (second.name, second.controller_port, second.username) == (
+            "udm",
+            443,
+            "ro",
+        )
+        assert second.collects({"name": "site0", "desc": "Site 0"})
+        assert not second.collects({"name": "site1", "desc": "Site 1"})
+
+    def test_same_host(self):
+        """Test that controllers on one host are told apart by their port and
+        that duplicate names are rejected."""
+        cfg = make_config(
+            make_fleet(1, 1, 0),
+            controllers=[
+                {"controller_url": "unifi.lan"},
+                {"controller_url": "unifi.lan", "controller_port": 443},
+            ],
+        )
+        first, second = config.Config.from_dict(cfg).get_controllers()
+        assert (first.name, second.name) == ("unifi.lan:8443", "unifi.lan:443")
+
+        cfg["controllers"][1]["name"] = "unifi.lan:8443"
+        with pytest.raises(ValueError, match="Controllers 0 and 1"):
+            config.Config.from_dict(cfg)
+
+    def test_default_controller(self):
+        """Test that without controllers the top level controller is collected."""
+        cfg = config.Config.from_dict(make_config(make_fleet(1, 1, 0)))
+        (controller,) = cfg.get_controllers()
+
+        assert controller.controller_url == controller.name == "127.0.0.1"
+        assert controller.sites == []
+
+    def test_merge_and_deduplicate(self, collect):
+        """Test that the APs of all controllers are merged, the first controller
+        wins for APs reported twice and site filters apply."""
+        cfg = self.make_cfg(
+            collect,
+            [
+                {"controller_url": "a"},
+                {"controller_url": "b", "sites": ["site1", "Site 2"]},
+            ],
+        )
+        aps = collect(cfg).accesspoints
+
+        assert len(aps) == len({ap.mac for ap in aps}) == 9
+        assert [ap.site for ap in aps].count("Site 2") == 3
+        samples = metrics.CONTROLLER_ACCESSPOINTS.samples()
+        assert {key: value for _, key, _, value in samples}[("b:8443",)] == 6
+
+    def test_failure_isolation(self, collect):
+        """Test that a failing controller keeps its previous APs and does not
+        affect the other one."""
+        cfg = self.make_cfg(collect, [{"controller_url": "a"}, {"controller_url": "b"}])
+        assert len(collect(cfg).accesspoints) == 9
+        failed = metrics.CONTROLLER_COLLECTIONS.value(
+            controller="b:8443", result="failed"
+        )
+
+        side_effect = collect.session.side_effect
+
+        def fail_b(cfg, controller):
+            if controller.name == "b:8443":
+                raise Exception("Connection failed")
+            return side_effect(cfg, controller)
+
+        collect.session.side_effect = fail_b
+        assert len(collect(cfg).accesspoints) == 9
+        assert (
+            metrics.CONTROLLER_COLLECTIONS.value(controller="b:8443", result="failed")
+            == failed + 1
+        )
+
+        collect.session.side_effect = Exception("Connection failed")
+        assert collect(cfg) is None
+
+    def test_removed_sites_are_pruned(self, collect):
+        """Test that sites and controllers no longer collected are forgotten."""
+        cfg = self.make_cfg(collect, [{"controller_url": "a"}, {"controller_url": "b"}])
+        collect(cfg)
+        assert len(unifi_client.site_accesspoints) == 5
+
+        cfg = self.make_cfg(collect, [{"controller_url": "b", "sites": ["site1"]}])
+        assert len(collect(cfg).accesspoints) == 3
+        assert set(unifi_client.site_accesspoints) == {("b:8443", "site1")}
+        assert set(unifi_client.site_inventory) == {("b:8443", "site1")}
+        assert set(unifi_client.controller_sites) == {"b:8443"}
+
+    def test_concurrent(self, collect):
+        """Test that the controllers are fetched concurrently."""
+        cfg = self.make_cfg(collect, [{"controller_url": "a"}, {"controller_url": "b"}])
+        barrier = threading.Barrier(2, timeout=5)
+        side_effect = collect.session.side_effect
+
+        def wait_for_both(cfg, controller):
+            barrier.wait()
+            return side_effect(cfg, controller)
+
+        collect.session.side_effect = wait_for_both
+        assert len(collect(cfg).accesspoints) == 9
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import dataclasses
 import os
+import socket
 import sys
 from functools import lru_cache
 from typing import Any, Dict, List, Optional, Union
@@ -9,6 +10,16 @@ import yaml
 
 UNIFI_RESPONDD_CONFIG_OS_ENV = "UNIFI_RESPONDD_CONFIG_FILE"
 UNIFI_RESPONDD_CONFIG_DEFAULT_LOCATION = "./unifi_respondd.yaml"
+UNIFI_RESPONDD_GEOCACHE_FILENAME = "unifi_respondd_geocache.sqlite"
+# the defaults of the top level controller keys if a list of controllers is configured
+CONTROLLER_DEFAULTS = {
+    "controller_url": "",
+    "controller_port": 8443,
+    "username": "",
+    "password": "",
+    "version": "v5",
+    "ssl_verify": True,
+}
 
 
 class Error(Exception):
@@ -19,6 +30,159 @@ class ConfigFileNotFoundError(Error):
     """File could not be found on disk."""
 
 
+@dataclasses.dataclass
+class Controller:
+    """A UniFi controller the APs are collected from.
+    Attributes:
+        name: The name of the controller in logs and metrics, defaults to controller_url:controller_port.
+        controller_url: The unifi controller URL.
+        controller_port: The unifi Controller port.
+        username: The username for unifi controller.
+        password: The password for unifi controller.
+        version: The API version of the controller, e.g. v5 or UDMP-unifiOS.
+        ssl_verify: Verify the certificate of the controller.
+        sites: Only collect these sites (their name or description), all if empty.
+    """
+
+    name: str
+    controller_url: str
+    controller_port: int
+    username: str
+    password: str
+    version: str = "v5"
+    ssl_verify: bool = True
+    sites: List[str] = dataclasses.field(default_factory=list)
+
+    def collects(self, site: Dict[str, Any]) -> bool:
+        """Returns True if a site of the controller is collected."""
+        return (
+            not self.sites or site["name"] in self.sites or site["desc"] in self.sites
+        )
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any], cfg: Dict[str, Any]) -> "Controller":
+        """Creates a Controller object from an entry of the controllers list.
+        Arguments:
+            entry: The entry as a dict.
+            cfg: The configuration file as a dict, its keys are the defaults of the entry.
+        Returns:
+            A Controller object.
+        """
+
+        controller_port = entry.get("controller_port", cfg["controller_port"])
+        return cls(
+            name=entry.get(
+                "name", "%s:%s" % (entry["controller_url"], controller_port)
+            ),
+            controller_url=entry["controller_url"],
+            controller_port=controller_port,
+            username=entry.get("username", cfg["username"]),
+            password=entry.get("password", cfg["password"]),
+            version=entry.get("version", cfg["version"]),
+            ssl_verify=entry.get("ssl_verify", cfg["ssl_verify"]),
+            sites=list(entry.get("sites", [])),
+        )
+
+
+@dataclasses.dataclass
+class Listener:
+    """A socket the requests are answered on, with the APs it answers for.
+    Attributes:
+        interface: The interface the socket is bound to.
+        multicast_address: The multicast group joined on the interface.
+        multicast_port: The port requests are received on.
+        unicast_address: The address unicast pushes are sent to.
+        unicast_port: The port unicast pushes are sent to.
+        multicast_enabled: Answer multicast requests, otherwise push to the unicast address.
+        domains: Only answer for APs with one of these domain codes, all if empty.
+        sites: Only answer for APs of one of these sites (their description), all if empty.
+    """
+
+    interface: str
+    multicast_address: str
+    multicast_port: int
+    unicast_address: str
+    unicast_port: int
+    multicast_enabled: bool = True
+    domains: List[str] = dataclasses.field(default_factory=list)
+    sites: List[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def filtered(self) -> bool:
+        """Returns True if the listener only answers for some of the APs."""
+        return bool(self.domains or self.sites)
+
+    def accepts(self, ap) -> bool:
+        """Returns True if the listener answers for an AP."""
+        if self.domains and ap.domain_code not in self.domains:
+            return False
+        return not self.sites or ap.site in self.sites
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any], cfg: Dict[str, Any]) -> "Listener":
+        """Creates a Listener object from an entry of the listeners list.
+        Arguments:
+            entry: The entry as a dict.
+            cfg: The configuration file as a dict, its keys are the defaults of the entry.
+        Returns:
+            A Listener object.
+        """
+
+        return cls(
+            interface=entry.get("interface", cfg["interface"]),
+            multicast_address=entry.get("multicast_address", cfg["multicast_address"]),
+            multicast_port=entry.get("multicast_port", cfg["multicast_port"]),
+            unicast_address=entry.get("unicast_address", cfg["unicast_address"]),
+            unicast_port=entry.get("unicast_port", cfg["unicast_port"]),
+            multicast_enabled=cfg["multicast_enabled"],
+            domains=list(entry.get("domains", [])),
+            sites=list(entry.get("sites", [])),
+        )
+
+
+def check_listeners(listeners: List[Listener]):
+    """Checks that no two multicast listeners receive the same group on the same
+    interface and port, the second one could not be bound.
+    Raises:
+        ValueError: If two listeners receive the same requests."""
+    seen = {}
+    for index, listenerCfg in enumerate(listeners):
+        if not listenerCfg.multicast_enabled:
+            continue
+        key = (
+            listenerCfg.interface,
+            socket.inet_pton(socket.AF_INET6, listenerCfg.multicast_address),
+            listenerCfg.multicast_port,
+        )
+        if key in seen:
+            raise ValueError(
+                "Listeners %d and %d both receive %s port %d on %s"
+                % (
+                    seen[key],
+                    index,
+                    listenerCfg.multicast_address,
+                    listenerCfg.multicast_port,
+                    listenerCfg.interface,
+                )
+            )
+        seen[key] = index
+
+
+def check_controllers(controllers: List[Controller]):
+    """Checks that the controllers have distinct names, their sites and
+    metrics are kept by name.
+    Raises:
+        ValueError: If two controllers have the same name."""
+    seen = {}
+    for index, controller in enumerate(controllers):
+        if controller.name in seen:
+            raise ValueError(
+                "Controllers %d and %d are both named %s"
+                % (seen[controller.name], index, controller.name)
+            )
+        seen[controller.name] = index
+
+
 @dataclasses.dataclass
 class Config:
     """A representation of the configuration file.
@@ -27,6 +191,30 @@ class Config:
         controller_port: The unifi Controller port.
         username: The username for unifi controller.
         password: The password for unifi controller.
+        refresh_interval: Seconds between two background collections, 0 collects on every request.
+        refresh_freshness: With refresh_interval 0, seconds a collected snapshot is reused for further requests.
+        geocache_file: The geocoding cache database, defaults to a file next to the config file.
+        geocache_ttl: Seconds a resolved address is cached.
+        geocache_negative_ttl: Seconds an unresolvable address is cached.
+        geocache_max_entries: The maximum number of cached addresses.
+        geocode_retries: The number of geocoding attempts per address.
+        nodelist_max_age: Seconds the nodelist is used before it is checked for changes.
+        site_workers: The number of sites collected concurrently.
+        site_timeout: Seconds after which a site is given up and its previous data is kept.
+        asyncio_enabled: Answer requests concurrently with the asyncio responder.
+        use_orjson: Encode responses with orjson, if installed. The JSON is compact instead of byte-identical.
+        send_rate: The maximum number of response packets per second, 0 for no limit.
+        send_batch_size: The number of packets sent per sendmmsg() call.
+        unicast_period: Seconds between two unicast pushes.
+        unicast_lead: Seconds the collection for a unicast push starts ahead of it.
+        unicast_spread: Seconds the packets of a unicast push are spread across, 0 sends them at once.
+        client_count_source: "vap_table" counts clients from the num_sta of the APs, "clients" downloads the client list.
+        inventory_interval: Seconds between two full refreshes of a site, in between only the stats of its APs are updated. 0, the default, refreshes fully on every collection.
+        metrics_port: Port of the HTTP server exposing the metrics on /metrics in the Prometheus text format, 0 disables it.
+        metrics_address: Address the metrics server listens on.
+        listeners: Sockets to answer on instead of the one of interface, e.g. one per mesh domain, all served from the same snapshot.
+        controllers: Controllers to collect from instead of the one of controller_url, they are collected concurrently into one snapshot.
+        shard_workers: The number of worker processes the sites are collected and serialized in, 0 collects in the responder process.
     """
 
     controller_url: str
@@ -48,6 +236,30 @@ class Config:
 
     version: str = "v5"
     ssl_verify: bool = True
+    refresh_interval: int = 60
+    refresh_freshness: float = 0
+    geocache_file: Optional[str] = None
+    geocache_ttl: int = 30 * 24 * 3600
+    geocache_negative_ttl: int = 3600
+    geocache_max_entries: int = 10000
+    geocode_retries: int = 3
+    nodelist_max_age: int = 300
+    site_workers: int = 1
+    site_timeout: int = 60
+    use_orjson: bool = False
+    asyncio_enabled: bool = False
+    send_rate: int = 0
+    send_batch_size: int = 64
+    unicast_period: float = 60
+    unicast_lead: float = 10
+    unicast_spread: float = 0
+    client_count_source: str = "vap_table"
+    inventory_interval: int = 0
+    metrics_port: int = 0
+    metrics_address: str = "127.0.0.1"
+    listeners: List[Listener] = dataclasses.field(default_factory=list)
+    controllers: List[Controller] = dataclasses.field(default_factory=list)
+    shard_workers: int = 0
 
     @classmethod
     def from_dict(cls, cfg: Dict[str, str]) -> "Config":
@@ -58,6 +270,17 @@ class Config:
             A Config object.
         """
 
+        if cfg.get("controllers"):
+            # the top level controller keys are only the defaults of the list
+            cfg = dict(CONTROLLER_DEFAULTS, **cfg)
+        listeners = [
+            Listener.from_dict(entry, cfg) for entry in cfg.get("listeners", [])
+        ]
+        check_listeners(listeners)
+        controllers = [
+            Controller.from_dict(entry, cfg) for entry in cfg.get("controllers", [])
+        ]
+        check_controllers(controllers)
         return cls(
             controller_url=cfg["controller_url"],
             controller_port=cfg["controller_port"],
@@ -76,8 +299,63 @@ class Config:
             unicast_port=cfg["unicast_port"],
             interface=cfg["interface"],
             verbose=cfg["verbose"],
+            refresh_interval=cfg.get("refresh_interval", 60),
+            refresh_freshness=cfg.get("refresh_freshness", 0),
+            geocache_file=cfg.get("geocache_file", None),
+            geocache_ttl=cfg.get("geocache_ttl", 30 * 24 * 3600),
+            geocache_negative_ttl=cfg.get("geocache_negative_ttl", 3600),
+            geocache_max_entries=cfg.get("geocache_max_entries", 10000),
+            geocode_retries=cfg.get("geocode_retries", 3),
+            nodelist_max_age=cfg.get("nodelist_max_age", 300),
+            site_workers=cfg.get("site_workers", 1),
+            site_timeout=cfg.get("site_timeout", 60),
+            use_orjson=cfg.get("use_orjson", False),
+            asyncio_enabled=cfg.get("asyncio_enabled", False),
+            send_rate=cfg.get("send_rate", 0),
+            send_batch_size=cfg.get("send_batch_size", 64),
+            unicast_period=cfg.get("unicast_period", 60),
+            unicast_lead=cfg.get("unicast_lead", 10),
+            unicast_spread=cfg.get("unicast_spread", 0),
+            client_count_source=cfg.get("client_count_source", "vap_table"),
+            inventory_interval=cfg.get("inventory_interval", 0),
+            metrics_port=cfg.get("metrics_port", 0),
+            metrics_address=cfg.get("metrics_address", "127.0.0.1"),
+            listeners=listeners,
+            controllers=controllers,
+            shard_workers=cfg.get("shard_workers", 0),
         )
 
+    def get_controllers(self) -> List[Controller]:
+        """Returns the configured controllers, or the controller of controller_url if none are configured."""
+        if self.controllers:
+            return self.controllers
+        return [
+            Controller(
+                name=self.controller_url,
+                controller_url=self.controller_url,
+                controller_port=self.controller_port,
+                username=self.username,
+                password=self.password,
+                version=self.version,
+                ssl_verify=self.ssl_verify,
+            )
+        ]
+
+    def get_listeners(self) -> List[Listener]:
+        """Returns the configured listeners, or the listener of interface if none are configured."""
+        if self.listeners:
+            return self.listeners
+        return [
+            Listener(
+                interface=self.interface,
+                multicast_address=self.multicast_address,
+                multicast_port=self.multicast_port,
+                unicast_address=self.unicast_address,
+                unicast_port=self.unicast_port,
+                multicast_enabled=self.multicast_enabled,
+            )
+        ]
+
 
 @lru_cache(maxsize=10)
 def fetch_from_config(key: str) -> Optional[Union[Dict[str, Any], List[str]]]:
@@ -90,12 +368,14 @@ def fetch_from_config(key: str) -> Optional[Union[Dict[str, Any], List[str]]]:
     return load_config().get(key)
 
 
-def load_config() -> Dict[str, str]:
+def load_config(path: Optional[str] = None) -> Dict[str, str]:
     """Fetches and validates configuration file from disk.
+    Arguments:
+        path: The configuration file, config_file_path() if None.
     Returns:
         Linted configuration file.
     """
-    cfg_contents = fetch_config_from_disk()
+    cfg_contents = fetch_config_from_disk(path)
     try:
         config = yaml.safe_load(cfg_contents)
     except yaml.YAMLError as e:
@@ -104,21 +384,35 @@ def load_config() -> Dict[str, str]:
     try:
         _ = Config.from_dict(config)
         return config
-    except (KeyError, TypeError) as e:
+    except (KeyError, TypeError, ValueError) as e:
         print("Failed to lint file: %s", e)
         sys.exit(2)
 
 
-def fetch_config_from_disk() -> str:
+def config_file_path() -> str:
+    """Returns the path of the configuration file."""
+    return os.environ.get(
+        UNIFI_RESPONDD_CONFIG_OS_ENV, UNIFI_RESPONDD_CONFIG_DEFAULT_LOCATION
+    )
+
+
+def default_geocache_file() -> str:
+    """Returns the path of the geocoding cache next to the configuration file."""
+    return os.path.join(
+        os.path.dirname(config_file_path()), UNIFI_RESPONDD_GEOCACHE_FILENAME
+    )
+
+
+def fetch_config_from_disk(path: Optional[str] = None) -> str:
     """Fetches config file from disk and returns as string.
+    Arguments:
+        path: The configuration file, config_file_path() if None.
     Raises:
         ConfigFileNotFoundError: If we could not find the configuration file on disk.
     Returns:
         The file contents as string.
     """
-    config_file = os.environ.get(
-        UNIFI_RESPONDD_CONFIG_OS_ENV, UNIFI_RESPONDD_CONFIG_DEFAULT_LOCATION
-    )
+    config_file = path or config_file_path()
     try:
         with open(config_file, "r") as stream:
             return stream.read()
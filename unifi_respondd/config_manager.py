@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+from typing import Optional
+
+import yaml
+
+from unifi_respondd import config, logger
+
+# seconds between two checks of the configuration file for changes
+CHECK_INTERVAL = 5.0
+
+manager = None
+
+
+def file_signature(path):
+    """This function returns what identifies a version of a file: its inode,
+    size and modification time, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class ConfigManager:
+    """This class keeps the parsed configuration and reloads it when the file changes.
+
+    The file is parsed once. get() checks at most every check_interval seconds
+    whether the file was modified or replaced and parses it again if so. The
+    new Config replaces the previous one in a single assignment, so anything
+    holding the previous object, like a collection or response in progress,
+    keeps a consistent view until it asks for the config again. A changed
+    logging_config is applied on reload. A file that fails to parse is logged
+    and the previous config is kept.
+    Attributes:
+        path: The configuration file.
+        check_interval: Seconds between two checks of the file for changes.
+        reloads: The number of successful reloads."""
+
+    def __init__(self, path=None, check_interval=CHECK_INTERVAL):
+        self.path = path or config.config_file_path()
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._config: Optional[config.Config] = None
+        self._signature = None
+        self._checked = None
+        self._logging_config = None
+        self._lock = threading.Lock()
+
+    def get(self) -> config.Config:
+        """Returns the current Config, loading it on first use and reloading
+        it if the file changed.
+
+        The first load exits on an invalid file, like load_config()."""
+        cfg = self._config
+        now = time.monotonic()
+        if cfg is not None and now - self._checked < self.check_interval:
+            return cfg
+        with self._lock:
+            if self._config is None:
+                self._signature = file_signature(self.path)
+                raw = config.load_config(self.path)
+                self._config = config.Config.from_dict(raw)
+                self._logging_config = raw.get("logging_config")
+                logger.configure(self._logging_config)
+            elif now - self._checked >= self.check_interval:
+                signature = file_signature(self.path)
+                if signature is not None and signature != self._signature:
+                    self._signature = signature
+                    self._reload()
+            self._checked = now
+            return self._config
+
+    def _reload(self):
+        try:
+            with open(self.path, "r") as stream:
+                raw = yaml.safe_load(stream)
+            cfg = config.Config.from_dict(raw)
+        except (
+            OSError,
+            yaml.YAMLError,
+            KeyError,
+            TypeError,
+            ValueError,
+            AttributeError,
+        ) as ex:
+            logger.error("Error: Keeping previous configuration: %s" % (ex))
+            return
+        self._config = cfg
+        self.reloads += 1
+        if raw.get("logging_config") != self._logging_config:
+            self._logging_config = raw.get("logging_config")
+            logger.configure(self._logging_config)
+        logger.info("Reloaded configuration from %s" % self.path)
+
+
+def get_manager() -> ConfigManager:
+    """This function returns the ConfigManager of the configuration file, it is created on first use."""
+    global manager
+    if manager is None:
+        manager = ConfigManager()
+    return manager
+
+
+def get_config() -> config.Config:
+    """This function returns the current configuration."""
+    return get_manager().get()
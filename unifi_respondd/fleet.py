@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import json
+import random
+from collections import Counter
+from typing import Any, Dict, List
+
+from unifi_respondd.session import SiteSession
+
+SSID = "muenchen.freifunk.net"
+PRIVATE_SSID = "office"
+MODELS = ["U6-Lite", "U6-LR", "U6-Pro", "UAP-AC-Lite", "UAP-AC-M", "UAP-nanoHD"]
+FIRMWARES = ["6.6.55.15189", "6.6.77.15402", "6.5.62.14789"]
+CHANNELS5 = [36, 40, 44, 48, 100, 104, 108, 112]
+CHANNELS24 = [1, 6, 11]
+
+
+def make_mac(*parts):
+    """This function returns a MAC address built from the given numbers."""
+    value = 0
+    for part in parts:
+        value = (value << 16) | part
+    return ":".join("%02x" % b for b in (value & 0xFFFFFFFFFFFF).to_bytes(6, "big"))
+
+
+@dataclasses.dataclass
+class Fleet:
+    """This class contains a synthetic UniFi fleet as the controller API returns it.
+    Attributes:
+        sites: The documents of api/self/sites.
+        devices: The stat/device documents per site name.
+        clients: The stat/sta documents per site name.
+        offloader_mac: The offloader MAC per site description, like the config option.
+        nodes: The nodelist entries of the offloaders."""
+
+    sites: List[Dict[str, Any]]
+    devices: Dict[str, List[Dict[str, Any]]]
+    clients: Dict[str, List[Dict[str, Any]]]
+    offloader_mac: Dict[str, str]
+    nodes: List[Dict[str, Any]]
+
+    @property
+    def ap_count(self) -> int:
+        """Returns the number of APs of all sites."""
+        return sum(len(devices) for devices in self.devices.values())
+
+
+def make_device(site_idx, ap_idx, channel24, channel5, stations, rng):
+    """This function returns the stat/device document of an AP.
+    Arguments:
+        stations: A Counter of the clients per (essid, channel)."""
+    mac = make_mac(0x0A00 + site_idx, ap_idx, 1)
+    vap_table = []
+    for essid in (SSID, PRIVATE_SSID):
+        for channel, radio in ((channel24, "ng"), (channel5, "na")):
+            vap_table.append(
+                {
+                    "essid": essid,
+                    "bssid": make_mac(0x0B00 + site_idx, ap_idx, channel),
+                    "radio": radio,
+                    "channel": channel,
+                    "num_sta": stations[essid, channel],
+                    "rx_bytes": rng.randrange(10**10),
+                    "tx_bytes": rng.randrange(10**10),
+                    "rx_packets": rng.randrange(10**7),
+                    "tx_packets": rng.randrange(10**7),
+                    "satisfaction": rng.randrange(50, 100),
+                    "is_guest": essid == SSID,
+                    "up": True,
+                    "usage": "user",
+                }
+            )
+    if ap_idx > 0 and ap_idx % 4 == 0:
+        uplink = {
+            "type": "wireless",
+            "ap_mac": make_mac(0x0A00 + site_idx, ap_idx - 1, 1),
+            "rssi": -rng.randrange(40, 80),
+        }
+    else:
+        uplink = {"type": "wire", "full_duplex": True, "speed": 1000}
+    lldp_table = [
+        {
+            "chassis_id": make_mac(0x0C00 + site_idx, 0, 0),
+            "is_wired": True,
+            "local_port_idx": 1,
+            "port_id": "Port %d" % (ap_idx % 24 + 1),
+        }
+    ]
+    if ap_idx > 0:
+        lldp_table.append(
+            {
+                "chassis_id": make_mac(0x0A00 + site_idx, ap_idx - 1, 1),
+                "is_wired": False,
+                "local_port_idx": 0,
+            }
+        )
+    return {
+        "_id": "%024x" % rng.getrandbits(96),
+        "name": "site%d-ap%d" % (site_idx, ap_idx),
+        "mac": mac,
+        "ip": "10.%d.%d.%d" % (site_idx % 256, ap_idx // 256, ap_idx % 256),
+        "state": 1,
+        "adopted": True,
+        "type": "uap",
+        "model": rng.choice(MODELS),
+        "version": rng.choice(FIRMWARES),
+        "uptime": rng.randrange(10**7),
+        "snmp_location": "%.5f, %.5f"
+        % (48.0 + rng.random() * 0.3, 11.4 + rng.random() * 0.3),
+        "snmp_contact": "site%d@example.com" % site_idx,
+        "uplink": uplink,
+        "lldp_table": lldp_table,
+        "sys_stats": {
+            "loadavg_1": "%.2f" % rng.random(),
+            "loadavg_5": "%.2f" % rng.random(),
+            "loadavg_15": "%.2f" % rng.random(),
+            "mem_used": rng.randrange(100000, 200000) * 1024,
+            "mem_buffer": rng.randrange(1000, 10000) * 1024,
+            "mem_total": 256 * 1024 * 1024,
+        },
+        "radio_table": [
+            {"name": "wifi0", "radio": "ng", "channel": channel24, "tx_power": 20},
+            {"name": "wifi1", "radio": "na", "channel": channel5, "tx_power": 23},
+        ],
+        "port_table": [
+            {
+                "port_idx": 1,
+                "name": "Main",
+                "up": True,
+                "speed": 1000,
+                "rx_bytes": rng.randrange(10**10),
+                "tx_bytes": rng.randrange(10**10),
+            }
+        ],
+        "vap_table": vap_table,
+    }
+
+
+def make_fleet(sites, aps, clients, seed=0):
+    """This function returns a reproducible Fleet of sites sites with aps APs
+    and clients clients per AP each. Three out of four clients connect to the
+    Freifunk SSID, the others to a private SSID."""
+    rng = random.Random(seed)
+    fleet = Fleet(sites=[], devices={}, clients={}, offloader_mac={}, nodes=[])
+    for site_idx in range(sites):
+        name = "site%d" % site_idx
+        desc = "Site %d" % site_idx
+        offloader = make_mac(0x0D00 + site_idx, 0, 0)
+        fleet.sites.append({"_id": "%024x" % site_idx, "name": name, "desc": desc})
+        fleet.offloader_mac[desc] = offloader
+        fleet.nodes.append(
+            {
+                "mac": offloader,
+                "node_id": offloader.replace(":", ""),
+                "gateway": make_mac(0x0E00, site_idx % 4, 0),
+                "gateway6": make_mac(0x0E00, site_idx % 4, 0),
+                "domain": "ffmuc_muc_%s" % "nswe"[site_idx % 4],
+            }
+        )
+        devices = []
+        site_clients = []
+        for ap_idx in range(aps):
+            ap_mac = make_mac(0x0A00 + site_idx, ap_idx, 1)
+            channel24 = rng.choice(CHANNELS24)
+            channel5 = rng.choice(CHANNELS5)
+            stations = Counter()
+            for client_idx in range(clients):
+                client_mac = make_mac(0x0F00 + site_idx, ap_idx, client_idx)
+                essid = SSID if client_idx % 4 else PRIVATE_SSID
+                channel = rng.choice((channel24, channel5))
+                stations[essid, channel] += 1
+                site_clients.append(
+                    {
+                        "mac": client_mac,
+                        "ap_mac": ap_mac,
+                        "essid": essid,
+                        "channel": channel,
+                        "radio": "na" if channel > 14 else "ng",
+                        "hostname": "client-%s" % client_mac.replace(":", ""),
+                        "ip": "10.%d.%d.%d" % (site_idx % 256, 128 + ap_idx % 128, 1),
+                        "rssi": -rng.randrange(40, 90),
+                        "rx_bytes": rng.randrange(10**9),
+                        "tx_bytes": rng.randrange(10**9),
+                        "uptime": rng.randrange(10**5),
+                        "is_guest": essid == SSID,
+                        "is_wired": False,
+                    }
+                )
+            devices.append(
+                make_device(site_idx, ap_idx, channel24, channel5, stations, rng)
+            )
+        fleet.devices[name] = devices
+        fleet.clients[name] = site_clients
+    return fleet
+
+
+def make_config(fleet, **overrides):
+    """This function returns a configuration dict for a Fleet, as read from the config file."""
+    cfg = {
+        "controller_url": "127.0.0.1",
+        "controller_port": 8443,
+        "username": "admin",
+        "password": "admin",
+        "ssid_regex": "freifunk",
+        "offloader_mac": dict(fleet.offloader_mac),
+        "nodelist": "http://127.0.0.1/nodes.json",
+        "fallback_domain": "ffmuc_unifi_respondd_fallback",
+        "multicast_address": "ff05::2:1001",
+        "multicast_port": 1001,
+        "unicast_address": "::1",
+        "unicast_port": 45123,
+        "interface": "lo",
+        "version": "v5",
+        "ssl_verify": False,
+        "multicast_enabled": False,
+        "verbose": False,
+    }
+    cfg.update(overrides)
+    return cfg
+
+
+class FleetController:
+    """This class answers the ControllerSession API from a Fleet without a network.
+
+    The documents are kept as JSON text and parsed on every request, like a
+    response body, so parsing is part of what is measured."""
+
+    def __init__(self, fleet: Fleet):
+        self.fleet = fleet
+        self._sites = json.dumps(fleet.sites)
+        self._devices = {name: json.dumps(docs) for name, docs in fleet.devices.items()}
+        self._clients = {name: json.dumps(docs) for name, docs in fleet.clients.items()}
+        self.requests = 0
+
+    def _read(self, body, reduce=None):
+        self.requests += 1
+        items = json.loads(body)
+        if reduce is None:
+            return items
+        return [reduce(item) for item in items]
+
+    def get_sites(self) -> List[Dict[str, Any]]:
+        return self._read(self._sites)
+
+    def get_aps(self, site_id: str, reduce=None) -> List[Dict[str, Any]]:
+        return self._read(self._devices[site_id], reduce)
+
+    def get_clients(self, site_id: str, reduce=None) -> List[Dict[str, Any]]:
+        return self._read(self._clients[site_id], reduce)
+
+    def site(self, site_id: str) -> SiteSession:
+        return SiteSession(self, site_id)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import contextlib
+import fcntl
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+Location = Tuple[float, float]
+# seconds a connection waits for the write lock of another process
+BUSY_TIMEOUT = 5.0
+# seconds between two geocoding requests of all processes sharing the cache,
+# Nominatim allows one request per second
+REQUEST_INTERVAL = 1.0
+
+
+class GeoCache:
+    """This class persists geocoding results in a SQLite database.
+
+    Entries are keyed by the normalized address. Resolved addresses expire
+    after ttl seconds, unresolvable ones after negative_ttl seconds. Once more
+    than max_entries addresses are stored, the least recently used ones are
+    evicted.
+
+    Every write is committed right away and the database uses write-ahead
+    logging, so several processes can share the file, e.g. the workers of
+    sharding.ShardPool, without holding the write lock for a whole collection.
+    Lookups of these processes are spaced by throttle()."""
+
+    def __init__(self, path: str, ttl: float, negative_ttl: float, max_entries: int):
+        self.path = path
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocache ("
+            "address TEXT PRIMARY KEY, latitude REAL, longitude REAL, "
+            "expires REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def normalize(address: str) -> str:
+        """Returns the cache key for an address."""
+        return " ".join(address.split()).lower()
+
+    def get(self, address: str) -> Tuple[bool, Optional[Location]]:
+        """Looks up an address.
+        Returns:
+            A tuple of a hit flag and the cached location. The location is None
+            for cached negative results."""
+        key = self.normalize(address)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, expires FROM geocache WHERE address = ?",
+                (key,),
+            ).fetchone()
+            if row is None or row[2] < now:
+                return False, None
+            self._conn.execute(
+                "UPDATE geocache SET last_used = ? WHERE address = ?", (now, key)
+            )
+            self._conn.commit()
+        if row[0] is None:
+            return True, None
+        return True, (row[0], row[1])
+
+    def put(self, address: str, location: Optional[Location]):
+        """Stores a location for an address, None stores a negative result."""
+        now = time.time()
+        if location is None:
+            values = (None, None, now + self._negative_ttl)
+        else:
+            values = (float(location[0]), float(location[1]), now + self._ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocache "
+                "(address, latitude, longitude, expires, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.normalize(address),) + values + (now,),
+            )
+            self._conn.execute(
+                "DELETE FROM geocache WHERE address IN ("
+                "SELECT address FROM geocache ORDER BY last_used DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self._max_entries,),
+            )
+            self._conn.commit()
+
+    @contextlib.contextmanager
+    def throttle(self):
+        """Serializes the geocoding requests of all processes sharing the cache.
+
+        The block runs while holding a lock on a file next to the database,
+        at least REQUEST_INTERVAL seconds after the previous block of any
+        process ended."""
+        with open(self.path + ".lock", "a+") as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                lockfile.seek(0)
+                try:
+                    last = float(lockfile.read() or 0)
+                except ValueError:
+                    last = 0.0
+                wait = last + REQUEST_INTERVAL - time.time()
+                if wait > 0:
+                    time.sleep(min(wait, REQUEST_INTERVAL))
+                try:
+                    yield
+                finally:
+                    lockfile.seek(0)
+                    lockfile.truncate()
+                    lockfile.write(repr(time.time()))
+                    lockfile.flush()
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def flush(self):
+        """Writes pending changes to disk, writes are already committed by get() and put()."""
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import socket
+import struct
+
+
+def join_group(sock, addr, ifname):
+    """This function joins a multicast group on a socket."""
+    group = socket.inet_pton(socket.AF_INET6, addr)
+    if_idx = socket.if_nametoindex(ifname)
+    sock.setsockopt(
+        socket.IPPROTO_IPV6,
+        socket.IPV6_JOIN_GROUP,
+        group + struct.pack("I", if_idx),
+    )
+
+
+def shares_port(cfg, listenerCfgs):
+    """This function returns True if another multicast listener receives on the same interface and port."""
+    return cfg.multicast_enabled and any(
+        other is not cfg
+        and other.multicast_enabled
+        and (other.interface, other.multicast_port)
+        == (cfg.interface, cfg.multicast_port)
+        for other in listenerCfgs
+    )
+
+
+def bind_socket(sock, cfg, shared=False):
+    """This function binds a socket to the interface and joins the multicast group, if enabled.
+
+    A socket that shares its interface and port with other listeners is
+    bound to its multicast group instead of the wildcard address, so the
+    kernel hands it only the requests sent to its group."""
+    sock.setsockopt(
+        socket.SOL_SOCKET,
+        socket.SO_BINDTODEVICE,
+        bytes(cfg.interface.encode()),
+    )
+    if cfg.multicast_enabled:
+        if shared:
+            if_idx = socket.if_nametoindex(cfg.interface)
+            sock.bind((cfg.multicast_address, cfg.multicast_port, 0, if_idx))
+        else:
+            sock.bind(("::", cfg.multicast_port))
+        join_group(sock, cfg.multicast_address, cfg.interface)
+
+
+def open_socket(cfg, shared=False):
+    """This function returns the socket of the responder, bound and joined as configured.
+
+    It only needs the standard library, so the entry point can listen before
+    the collection and response modules are imported; requests arriving in
+    the meantime are queued by the kernel."""
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    try:
+        bind_socket(sock, cfg, shared)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def open_sockets(listenerCfgs):
+    """This function returns a socket per listener, see open_socket()."""
+    socks = []
+    try:
+        for cfg in listenerCfgs:
+            socks.append(open_socket(cfg, shares_port(cfg, listenerCfgs)))
+    except BaseException:
+        for sock in socks:
+            sock.close()
+        raise
+    return socks
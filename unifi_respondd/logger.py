@@ -1,4 +1,3 @@
-import os.path
 from logging import DEBUG, basicConfig, config
 from logging import critical as critical
 from logging import debug as debug
@@ -6,10 +5,6 @@ from logging import error as error
 from logging import info as info
 from logging import warning as warning
 
-import yaml
-
-from unifi_respondd.config import UNIFI_RESPONDD_CONFIG_DEFAULT_LOCATION
-
 # Explicitly declare public API
 __all__ = [
     "basicConfig",
@@ -38,24 +33,22 @@ _LOGGING_DEFAULT_CONFIG = {
 }
 
 
-def fetch_logging_configuration():
-    """Fetches logging configuration from disk, if exists.
-
-    If the config exists, then we check to see if the key 'logging_config' is set. If it is, we return this configuration.
-    Otherwise, we return the default configuration (_LOGGING_DEFAULT_CONFIG).
+def configure(logging_cfg=None):
+    """Applies the logging configuration of the config file.
 
-    Returns:
-        Logging configuration.
-    """
-    logging_cfg = dict()
-    if os.path.isfile(UNIFI_RESPONDD_CONFIG_DEFAULT_LOCATION):
-        with open(UNIFI_RESPONDD_CONFIG_DEFAULT_LOCATION) as cfg_file:
-            logging_cfg = yaml.safe_load(cfg_file)
-    if logging_cfg.get("logging_config"):
-        return logging_cfg.get("logging_config")
-    return _LOGGING_DEFAULT_CONFIG
+    This is called once the config file was parsed, so that importing the logger
+    does not read the file again. Until then, and if logging_cfg is not set or
+    invalid, the default configuration (_LOGGING_DEFAULT_CONFIG) is used.
+    Arguments:
+        logging_cfg: The value of the key 'logging_config' of the config file."""
+    cfg = logging_cfg or _LOGGING_DEFAULT_CONFIG
+    try:
+        config.dictConfig(cfg)
+    except (ValueError, TypeError, AttributeError, ImportError) as ex:
+        cfg = _LOGGING_DEFAULT_CONFIG
+        config.dictConfig(cfg)
+        error("Error: Invalid logging_config: %s" % (ex))
+    info("Initialised logger, using configuration: %s", cfg)
 
 
-cfg = fetch_logging_configuration()
-config.dictConfig(cfg)
-info("Initialised logger, using configuration: %s", cfg)
+config.dictConfig(_LOGGING_DEFAULT_CONFIG)
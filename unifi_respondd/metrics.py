@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from unifi_respondd import logger
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def format_value(value):
+    """This function formats a sample value in the Prometheus text format."""
+    if value is None or math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    """This function formats a label set, e.g. {stage="login"}."""
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        '%s="%s"'
+        % (
+            name,
+            str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metric:
+    """This class is the base of all metrics, the samples are kept per label set.
+    Attributes:
+        name: The metric name.
+        documentation: The help text.
+        labelnames: The names of the labels, their values are passed as keyword arguments.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                "%s expects labels %s, got %s"
+                % (self.name, self.labelnames, tuple(labels))
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Returns the samples as (suffix, labelvalues, extra labels, value) tuples."""
+        with self._lock:
+            return [("", key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        """Returns the metric in the Prometheus text format."""
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation),
+            "# TYPE %s %s" % (self.name, self.kind),
+        ]
+        for suffix, labelvalues, extra, value in self.samples():
+            lines.append(
+                "%s%s%s %s"
+                % (
+                    self.name,
+                    suffix,
+                    format_labels(self.labelnames, labelvalues, extra),
+                    format_value(value),
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """This class counts events, its value only goes up."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Increases the counter of a label set by amount."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Returns the value of a label set."""
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """This class holds a value that goes up and down, or is read from a
+    function when the metrics are rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        """Sets the value of a label set."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, **labels):
+        """Reads the value of a label set from function on every render."""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def samples(self):
+        samples = super().samples()
+        with self._lock:
+            functions = sorted(self._functions.items())
+        for key, function in functions:
+            try:
+                value = function()
+            except Exception as ex:
+                logger.error("Error: %s" % (ex))
+                value = None
+            samples.append(("", key, (), value))
+        return samples
+
+
+class Histogram(Metric):
+    """This class counts observations, e.g. durations, in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        """Records one observation of a label set."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the with block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        """Returns the number of observations of a label set."""
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            values = sorted((key, (list(c), t)) for key, (c, t) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(
+                    ("_bucket", key, (("le", format_value(bound)),), cumulative)
+                )
+            samples.append(("_sum", key, (), total))
+            samples.append(("_count", key, (), cumulative))
+        return samples
+
+
+class Registry:
+    """This class collects the metrics that are exposed together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """Adds a metric and returns it."""
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns all metrics in the Prometheus text format."""
+        return "".join(metric.render() for metric in self._metrics)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "unifi_respondd_stage_duration_seconds",
+        "Time spent per stage of collecting and answering.",
+        ["stage"],
+    )
+)
+COLLECTIONS = REGISTRY.register(
+    Counter(
+        "unifi_respondd_collections_total",
+        "Collections from the controller by result.",
+        ["result"],
+    )
+)
+REFRESHES = REGISTRY.register(
+    Counter(
+        "unifi_respondd_refreshes_total",
+        "Snapshot refreshes by whether they collected, joined a running "
+        "collection or reused a fresh snapshot.",
+        ["result"],
+    )
+)
+REQUESTS = REGISTRY.register(
+    Counter(
+        "unifi_respondd_requests_total",
+        "Respondd requests answered, unicast counts the pushes.",
+        ["method"],
+    )
+)
+PACKETS = REGISTRY.register(
+    Counter(
+        "unifi_respondd_packets_total",
+        "Response datagrams by result.",
+        ["result"],
+    )
+)
+PAYLOAD_BYTES = REGISTRY.register(
+    Counter(
+        "unifi_respondd_payload_bytes_total",
+        "Bytes of serialized payloads before and after compression.",
+        ["encoding"],
+    )
+)
+SENT_BYTES = REGISTRY.register(
+    Counter("unifi_respondd_sent_bytes_total", "Bytes of response datagrams sent.")
+)
+SNAPSHOT_AGE = REGISTRY.register(
+    Gauge(
+        "unifi_respondd_snapshot_age_seconds",
+        "Age of the snapshot requests are answered from.",
+    )
+)
+ACCESSPOINTS = REGISTRY.register(
+    Gauge("unifi_respondd_accesspoints", "Number of APs in the latest snapshot.")
+)
+CONTROLLER_SECONDS = REGISTRY.register(
+    Histogram(
+        "unifi_respondd_controller_duration_seconds",
+        "Time spent per controller on fetching its sites and building their APs.",
+        ["controller", "stage"],
+    )
+)
+CONTROLLER_COLLECTIONS = REGISTRY.register(
+    Counter(
+        "unifi_respondd_controller_collections_total",
+        "Collections per controller by result.",
+        ["controller", "result"],
+    )
+)
+CONTROLLER_ACCESSPOINTS = REGISTRY.register(
+    Gauge(
+        "unifi_respondd_controller_accesspoints",
+        "Number of APs of a controller in the latest snapshot, before deduplication.",
+        ["controller"],
+    )
+)
+SHARD_SECONDS = REGISTRY.register(
+    Histogram(
+        "unifi_respondd_shard_duration_seconds",
+        "Time until a worker process returned the APs of its shard.",
+        ["shard"],
+    )
+)
+SHARD_COLLECTIONS = REGISTRY.register(
+    Counter(
+        "unifi_respondd_shard_collections_total",
+        "Collections per worker process by result.",
+        ["shard", "result"],
+    )
+)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """This class serves the metrics of REGISTRY on /metrics."""
+
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(address, port):
+    """This function serves /metrics on address and port in a background thread.
+    Returns:
+        The HTTP server."""
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info("Serving metrics on http://%s:%d/metrics" % server.server_address[:2])
+    return server
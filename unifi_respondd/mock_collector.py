@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+import argparse
+import dataclasses
+import json
+import math
+import select
+import socket
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+DEFAULT_SECTIONS = ("nodeinfo", "statistics", "neighbours")
+# keys every node must report per section
+REQUIRED_KEYS = {
+    "nodeinfo": ("node_id", "hostname", "network", "software"),
+    "statistics": ("node_id", "clients", "uptime"),
+    "neighbours": ("node_id", "batadv"),
+}
+
+
+def parse_payload(data, sections, multi=True):
+    """This function decodes a response packet and checks its shape.
+    Arguments:
+        data: The packet, raw deflate compressed for multi requests.
+        sections: The requested sections.
+        multi: True if the packet answers a GET request.
+    Returns:
+        The node_id the packet belongs to.
+    Raises:
+        ValueError: If the packet is not a valid response."""
+    try:
+        if multi:
+            data = zlib.decompress(data, -15)
+        node = json.loads(data)
+    except (zlib.error, UnicodeDecodeError) as ex:
+        raise ValueError(str(ex))
+    if not multi:
+        node = {sections[0]: node}
+    if not isinstance(node, dict) or set(node) != set(sections):
+        raise ValueError("Expected sections %s" % (sorted(sections),))
+    node_ids = set()
+    for section, info in node.items():
+        if not isinstance(info, dict):
+            raise ValueError("Section %s is not an object" % section)
+        missing = [key for key in REQUIRED_KEYS.get(section, ()) if key not in info]
+        if missing:
+            raise ValueError("Section %s lacks %s" % (section, ", ".join(missing)))
+        node_ids.add(info.get("node_id"))
+    if len(node_ids) != 1:
+        raise ValueError(
+            "Sections disagree on node_id: %s" % sorted(map(str, node_ids))
+        )
+    return node_ids.pop()
+
+
+def percentile(values, p):
+    """This function returns the p-th percentile of values, by nearest rank."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+@dataclasses.dataclass
+class Poll:
+    """This class contains the outcome of one request.
+    Attributes:
+        latency: Seconds from sending the request to the last packet, None if nothing arrived.
+        packets: The number of packets received.
+        nodes: The number of distinct nodes answered.
+        invalid: The number of packets that failed validation."""
+
+    latency: Optional[float]
+    packets: int
+    nodes: int
+    invalid: int
+
+
+class Collector:
+    """This class sends respondd requests like a collector, e.g. yanic, and
+    waits for the answers.
+
+    The response to a poll is complete once expect nodes answered, or once
+    no packet arrived for idle seconds.
+    Attributes:
+        destAddress: The address the requests are sent to, a multicast group or unicast address.
+        sections: The requested sections.
+        multi: True to send GET requests with compressed answers."""
+
+    def __init__(
+        self,
+        destAddress,
+        sections=DEFAULT_SECTIONS,
+        multi=True,
+        interface=None,
+        idle=0.5,
+        expect=None,
+    ):
+        self.sections = tuple(sections)
+        self.multi = multi
+        self.idle = idle
+        self.expect = expect
+        host, port = destAddress
+        if interface is not None and "%" not in host:
+            host = "%s%%%s" % (host, interface)
+        self.destAddress = socket.getaddrinfo(
+            host, port, socket.AF_INET6, socket.SOCK_DGRAM
+        )[0][4]
+        self._sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        if interface is not None:
+            self._sock.setsockopt(
+                socket.IPPROTO_IPV6,
+                socket.IPV6_MULTICAST_IF,
+                struct.pack("I", socket.if_nametoindex(interface)),
+            )
+        self._sock.bind(("::", 0))
+        if multi:
+            self.request = ("GET " + " ".join(self.sections)).encode()
+        else:
+            self.request = self.sections[0].encode()
+
+    def _drain(self):
+        while select.select([self._sock], [], [], 0)[0]:
+            self._sock.recv(65536)
+
+    def poll(self) -> Poll:
+        """Sends one request and collects the answers."""
+        self._drain()
+        started = time.perf_counter()
+        self._sock.sendto(self.request, self.destAddress)
+        last = None
+        packets = 0
+        invalid = 0
+        nodes = set()
+        while self.expect is None or len(nodes) < self.expect:
+            if not select.select([self._sock], [], [], self.idle)[0]:
+                break
+            data = self._sock.recv(65536)
+            last = time.perf_counter()
+            packets += 1
+            try:
+                nodes.add(parse_payload(data, self.sections, self.multi))
+            except ValueError:
+                invalid += 1
+        return Poll(
+            latency=None if last is None else last - started,
+            packets=packets,
+            nodes=len(nodes),
+            invalid=invalid,
+        )
+
+    def close(self):
+        self._sock.close()
+
+
+def run(destAddress, polls=10, rate=1.0, collectors=1, **kwargs) -> List[Poll]:
+    """This function polls destAddress with concurrent collectors.
+    Arguments:
+        polls: The number of polls per collector.
+        rate: Polls per second per collector, a poll that takes longer delays the next one.
+        collectors: The number of collectors polling concurrently.
+        kwargs: Passed on to Collector.
+    Returns:
+        The polls of all collectors."""
+    results = []
+    lock = threading.Lock()
+
+    def collect(collector):
+        started = time.monotonic()
+        try:
+            for i in range(polls):
+                time.sleep(max(0.0, started + i / rate - time.monotonic()))
+                result = collector.poll()
+                with lock:
+                    results.append(result)
+        finally:
+            collector.close()
+
+    threads = [
+        threading.Thread(target=collect, args=(Collector(destAddress, **kwargs),))
+        for _ in range(collectors)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results: List[Poll], expect=None) -> Dict[str, float]:
+    """This function aggregates polls to latency percentiles, packets per poll and loss.
+
+    Loss is the share of expected node answers that did not arrive, where
+    expect defaults to the most nodes any poll received."""
+    latencies = [poll.latency for poll in results if poll.latency is not None]
+    if expect is None:
+        expect = max((poll.nodes for poll in results), default=0)
+    wanted = expect * len(results)
+    received = sum(min(poll.nodes, expect) for poll in results)
+    return {
+        "polls": len(results),
+        "nodes": expect,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "packets_per_poll": (
+            sum(poll.packets for poll in results) / len(results) if results else 0
+        ),
+        "loss": 1 - received / wanted if wanted else 0.0,
+        "invalid": sum(poll.invalid for poll in results),
+        "unanswered": sum(1 for poll in results if poll.latency is None),
+    }
+
+
+def format_summary(summary) -> str:
+    """This function returns a summary as one line."""
+    return (
+        "%(polls)d polls of %(nodes)d nodes: p50 %(p50_ms).1f ms  p95 %(p95_ms).1f ms"
+        "  p99 %(p99_ms).1f ms  %(packets_per_poll).1f packets/poll"
+        "  loss %(loss_pct).2f%%  invalid %(invalid)d  unanswered %(unanswered)d"
+        % dict(
+            summary,
+            p50_ms=summary["p50"] * 1e3,
+            p95_ms=summary["p95"] * 1e3,
+            p99_ms=summary["p99"] * 1e3,
+            loss_pct=summary["loss"] * 100,
+        )
+    )
+
+
+def main():
+    """This function polls a running unifi_respondd and prints the latency."""
+    parser = argparse.ArgumentParser(
+        description="Poll a respondd responder and report latency and loss."
+    )
+    parser.add_argument("address", help="multicast group or unicast address")
+    parser.add_argument("port", type=int, nargs="?", default=1001)
+    parser.add_argument("--interface", help="interface for link-local destinations")
+    parser.add_argument("--polls", type=int, default=10, help="per collector")
+    parser.add_argument("--rate", type=float, default=1.0, help="polls per second")
+    parser.add_argument("--collectors", type=int, default=1)
+    parser.add_argument("--idle", type=float, default=0.5, help="seconds")
+    parser.add_argument("--expect", type=int, help="nodes answering each poll")
+    parser.add_argument("--single", help="request one section without compression")
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.single:
+        kwargs = dict(sections=(args.single,), multi=False)
+    results = run(
+        (args.address, args.port),
+        polls=args.polls,
+        rate=args.rate,
+        collectors=args.collectors,
+        interface=args.interface,
+        idle=args.idle,
+        expect=args.expect,
+        **kwargs,
+    )
+    print(format_summary(summarize(results, args.expect)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import random
+import secrets
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from unifi_respondd.fleet import Fleet, make_fleet
+
+UNIFI_OS_PREFIX = "/proxy/network"
+SESSION_COOKIE = "unifises"
+# seconds stop() may wait for the serving thread
+POLL_INTERVAL = 0.05
+
+
+def envelope(data=None, rc="ok", msg=None):
+    """This function returns a response body in the format of the controller API."""
+    meta = {"rc": rc}
+    if msg is not None:
+        meta["msg"] = msg
+    return json.dumps({"meta": meta, "data": data if data is not None else []}).encode()
+
+
+class MockControllerHandler(BaseHTTPRequestHandler):
+    """This class answers the controller endpoints read by ControllerSession."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _session(self):
+        for cookie in self.headers.get_all("Cookie", []):
+            for part in cookie.split(";"):
+                name, _, value = part.strip().partition("=")
+                if name == SESSION_COOKIE:
+                    return value
+        return None
+
+    def _path(self):
+        return self.path.split("?")[0].removeprefix(UNIFI_OS_PREFIX)
+
+    def do_POST(self):
+        controller = self.server.controller
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not controller.delay():
+            self._reply(500, envelope(rc="error", msg="api.err.Injected"))
+            return
+        if self._path() not in ("/api/login", "/api/auth/login"):
+            self._reply(404, envelope(rc="error", msg="api.err.NotFound"))
+            return
+        try:
+            credentials = json.loads(body)
+        except ValueError:
+            credentials = {}
+        token = controller.login(
+            credentials.get("username"), credentials.get("password")
+        )
+        if token is None:
+            self._reply(400, envelope(rc="error", msg="api.err.Invalid"))
+            return
+        self._reply(
+            200,
+            envelope(),
+            {
+                "Set-Cookie": "%s=%s; Path=/" % (SESSION_COOKIE, token),
+                "X-CSRF-Token": token,
+            },
+        )
+
+    def do_GET(self):
+        controller = self.server.controller
+        if not controller.delay():
+            self._reply(500, envelope(rc="error", msg="api.err.Injected"))
+            return
+        if not controller.authorized(self._session()):
+            self._reply(401, envelope(rc="error", msg="api.err.LoginRequired"))
+            return
+        body = controller.read(self._path())
+        if body is None:
+            self._reply(404, envelope(rc="error", msg="api.err.NotFound"))
+            return
+        self._reply(200, body)
+
+
+class MockController:
+    """This class serves a Fleet over HTTP like a UniFi controller, to test
+    and benchmark the collection without a real controller.
+
+    It answers the login, self/sites, stat/device and stat/sta endpoints of
+    both the classic and the UniFi OS (/proxy/network) layout. Every response
+    can be delayed by latency plus a random jitter, fail with a server error
+    at error_rate, and sessions expire after session_ttl seconds, so that the
+    client has to log in again.
+    Attributes:
+        fleet: The Fleet that is served.
+        latency: Seconds every response is delayed.
+        jitter: Maximum seconds added to or removed from latency at random.
+        error_rate: Probability of a request failing with status 500.
+        session_ttl: Seconds a session is valid after login, 0 for no expiry.
+        requests: The number of requests answered.
+        logins: The number of successful logins.
+        errors: The number of injected errors."""
+
+    def __init__(
+        self,
+        fleet: Fleet,
+        address: str = "127.0.0.1",
+        port: int = 0,
+        username: str = "admin",
+        password: str = "admin",
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        session_ttl: float = 0,
+        seed: int = 0,
+        certfile: Optional[str] = None,
+    ):
+        self.fleet = fleet
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.session_ttl = session_ttl
+        self.requests = 0
+        self.logins = 0
+        self.errors = 0
+        self._username = username
+        self._password = password
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._bodies = {"/api/self/sites": envelope(fleet.sites)}
+        for name, devices in fleet.devices.items():
+            self._bodies["/api/s/%s/stat/device" % name] = envelope(devices)
+            self._bodies["/api/s/%s/stat/sta" % name] = envelope(fleet.clients[name])
+        self._server = ThreadingHTTPServer((address, port), MockControllerHandler)
+        self._server.daemon_threads = True
+        self._server.controller = self
+        self.scheme = "http"
+        if certfile is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            self._server.socket = context.wrap_socket(
+                self._server.socket, server_side=True
+            )
+            self.scheme = "https"
+        self._thread = None
+
+    @property
+    def address(self):
+        """Returns the address and port the controller listens on."""
+        return self._server.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        """Returns the base URL without port, as used for controller_url."""
+        return "%s://%s" % (self.scheme, self.address[0])
+
+    def delay(self) -> bool:
+        """Sleeps for the injected latency and counts the request.
+        Returns:
+            False if the request has to fail with an injected error."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._rng.uniform(-self.jitter, self.jitter)
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        return not failed
+
+    def login(self, username, password) -> Optional[str]:
+        """Returns a new session token, or None if the credentials are wrong."""
+        if username != self._username or password != self._password:
+            return None
+        token = secrets.token_hex(16)
+        with self._lock:
+            self.logins += 1
+            self._sessions[token] = time.monotonic()
+        return token
+
+    def authorized(self, token) -> bool:
+        """Returns True if token belongs to a session that has not expired."""
+        with self._lock:
+            created = self._sessions.get(token)
+            if created is None:
+                return False
+            if self.session_ttl > 0 and time.monotonic() - created > self.session_ttl:
+                del self._sessions[token]
+                return False
+            return True
+
+    def expire_sessions(self):
+        """Ends all sessions, the next request of every client is answered with 401."""
+        with self._lock:
+            self._sessions.clear()
+
+    def read(self, path) -> Optional[bytes]:
+        """Returns the response body of an API path or None if it is unknown."""
+        return self._bodies.get(path)
+
+    def config(self, version="v5", **overrides):
+        """Returns the controller part of a configuration dict pointing to this controller."""
+        cfg = {
+            "controller_url": self.url,
+            "controller_port": self.address[1],
+            "username": self._username,
+            "password": self._password,
+            "version": version,
+            "ssl_verify": False,
+        }
+        if version in ("unifiOS", "UDMP-unifiOS"):
+            cfg["controller_url"] = "%s:%d" % (self.url, self.address[1])
+        cfg.update(overrides)
+        return cfg
+
+    def start(self):
+        """Serves requests in a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            args=(POLL_INTERVAL,),
+            name="mock-controller",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def serve_forever(self):
+        """Serves requests in the calling thread until it is interrupted."""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """This function serves a generated fleet until it is interrupted."""
+    parser = argparse.ArgumentParser(description="Serve a synthetic UniFi fleet.")
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--sites", type=int, default=10)
+    parser.add_argument("--aps", type=int, default=100, help="APs per site")
+    parser.add_argument("--clients", type=int, default=20, help="clients per AP")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--session-ttl", type=float, default=0, help="seconds")
+    parser.add_argument("--certfile", help="PEM file with certificate and key")
+    args = parser.parse_args()
+
+    fleet = make_fleet(args.sites, args.aps, args.clients, seed=args.seed)
+    controller = MockController(
+        fleet,
+        address=args.address,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        session_ttl=args.session_ttl,
+        seed=args.seed,
+        certfile=args.certfile,
+    )
+    print(
+        "Serving %d APs on %s:%d, log in as admin/admin"
+        % (fleet.ap_count, controller.url, controller.address[1])
+    )
+    controller.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
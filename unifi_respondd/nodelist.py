@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import time
+from typing import Any, Dict, Optional
+
+from requests import get as rget
+
+from unifi_respondd import logger
+
+
+class Nodelist:
+    """This class caches the meshviewer nodelist.
+
+    The nodelist is downloaded at most once every max_age seconds. Downloads
+    are conditional on the ETag and Last-Modified headers of the previous
+    response, so an unchanged nodelist is not transferred again. The MAC index
+    is only rebuilt when the nodelist actually changed.
+    Attributes:
+        url: The URL of the meshviewer.json.
+        by_mac: A dict from node MAC to meshviewer node."""
+
+    def __init__(self, url: str, max_age: float, timeout: float = 30):
+        self.url = url
+        self.by_mac: Dict[str, Dict[str, Any]] = {}
+        self._max_age = max_age
+        self._timeout = timeout
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._fetched: Optional[float] = None
+
+    @property
+    def stale(self) -> bool:
+        """Returns True if the nodelist should be checked for changes."""
+        return (
+            self._fetched is None or time.monotonic() - self._fetched >= self._max_age
+        )
+
+    def refresh(self, force: bool = False) -> bool:
+        """Fetches the nodelist if it is stale.
+        Returns:
+            True if the nodelist changed."""
+        if not force and not self.stale:
+            return False
+        headers = {}
+        if self._etag is not None:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified is not None:
+            headers["If-Modified-Since"] = self._last_modified
+        try:
+            response = rget(self.url, headers=headers, timeout=self._timeout)
+            self._fetched = time.monotonic()
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+            nodes = response.json()["nodes"]
+        except Exception as ex:
+            logger.error("Error: %s" % (ex))
+            return False
+        self._etag = response.headers.get("ETag")
+        self._last_modified = response.headers.get("Last-Modified")
+        self.by_mac = {node["mac"]: node for node in nodes if "mac" in node}
+        logger.debug("Indexed %d nodes from %s" % (len(self.by_mac), self.url))
+        return True
+
+    def get(self, mac: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Returns the node with the given MAC or None."""
+        if mac is None:
+            return None
+        return self.by_mac.get(mac)
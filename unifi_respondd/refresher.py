@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Callable, Optional
+
+from unifi_respondd import logger, metrics
+
+if TYPE_CHECKING:
+    from unifi_respondd import unifi_client
+
+
+def collect_infos() -> Optional["unifi_client.Accesspoints"]:
+    """This function collects the APs from the controller.
+
+    unifi_client and its HTTP and geocoding dependencies are only imported on the
+    first collection, so the responder can start listening before."""
+    from unifi_respondd import unifi_client
+
+    return unifi_client.get_infos()
+
+
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    """This class contains one collected, immutable view of all APs.
+    Attributes:
+        accesspoints: The Accesspoints object returned by the collection.
+        version: The snapshot number, increased by one on every successful refresh.
+        created: The time.monotonic() timestamp the snapshot was taken at."""
+
+    accesspoints: "unifi_client.Accesspoints"
+    version: int
+    created: float
+
+    @property
+    def age(self) -> float:
+        """Returns the age of the snapshot in seconds."""
+        return time.monotonic() - self.created
+
+
+class SnapshotRefresher:
+    """This class keeps the latest Accesspoints snapshot up to date.
+
+    With a positive interval a background thread collects a new snapshot every
+    interval seconds and swaps it in atomically, so readers never block on the
+    controller. With an interval of 0 no thread is started and every call to
+    get() collects synchronously, which is the behaviour of older versions,
+    unless the snapshot is younger than freshness seconds.
+
+    Refreshes are single-flight: a refresh requested while another one is in
+    progress waits for and returns the result of the running one.
+    Attributes:
+        refreshes: The number of collections run.
+        coalesced: The number of refreshes that joined a running collection.
+        fresh: The number of requests answered from a fresh snapshot without collecting.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        collect: Optional[Callable[[], Optional["unifi_client.Accesspoints"]]] = None,
+        freshness: float = 0,
+    ):
+        self._interval = interval
+        self._collect = collect or collect_infos
+        self._freshness = freshness
+        self._snapshot: Optional[Snapshot] = None
+        self._inflight: Optional[Future] = None
+        self.refreshes = 0
+        self.coalesced = 0
+        self.fresh = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def snapshot(self) -> Optional[Snapshot]:
+        """Returns the latest snapshot or None if nothing was collected yet."""
+        return self._snapshot
+
+    @property
+    def snapshot_age(self) -> Optional[float]:
+        """Returns the age of the latest snapshot in seconds or None."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        return snapshot.age
+
+    @property
+    def background(self) -> bool:
+        """Returns True if snapshots are refreshed by a background thread."""
+        return self._interval > 0
+
+    def refresh(self) -> Optional[Snapshot]:
+        """Collects a new snapshot and swaps it in, or waits for the collection
+        that is already in progress.
+        Returns:
+            The new snapshot, or None if the collection failed. On failure the
+            previous snapshot is kept."""
+        with self._lock:
+            flight = self._inflight
+            leader = flight is None
+            if leader:
+                flight = self._inflight = Future()
+                self.refreshes += 1
+            else:
+                self.coalesced += 1
+        metrics.REFRESHES.inc(result="collected" if leader else "coalesced")
+        if not leader:
+            return flight.result()
+        try:
+            snapshot = self._refresh()
+        except BaseException as ex:
+            flight.set_exception(ex)
+            raise
+        else:
+            flight.set_result(snapshot)
+        finally:
+            with self._lock:
+                self._inflight = None
+        return snapshot
+
+    def _refresh(self) -> Optional[Snapshot]:
+        try:
+            with metrics.STAGE_SECONDS.time(stage="collect"):
+                aps = self._collect()
+        except Exception as ex:
+            logger.error("Error: %s" % (ex))
+            aps = None
+        if aps is None:
+            logger.warning("Collection failed, keeping previous snapshot")
+            metrics.COLLECTIONS.inc(result="failed")
+            return None
+        metrics.COLLECTIONS.inc(result="ok")
+        metrics.ACCESSPOINTS.set(len(aps.accesspoints))
+        with self._lock:
+            version = 1 if self._snapshot is None else self._snapshot.version + 1
+            snapshot = Snapshot(
+                accesspoints=aps, version=version, created=time.monotonic()
+            )
+            self._snapshot = snapshot
+        self._ready.set()
+        return snapshot
+
+    def get(self) -> Optional[Snapshot]:
+        """Returns the snapshot to answer a request from.
+
+        In background mode this only reads the latest snapshot, otherwise a new
+        snapshot is collected first if the latest one is older than freshness."""
+        if not self.background:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.age < self._freshness:
+                with self._lock:
+                    self.fresh += 1
+                metrics.REFRESHES.inc(result="fresh")
+                return snapshot
+            self.refresh()
+        return self._snapshot
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the first snapshot is available.
+        Returns:
+            True if a snapshot is available."""
+        return self._ready.wait(timeout)
+
+    def start(self):
+        """Starts the background thread, if enabled."""
+        if not self.background or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="snapshot-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stops the background thread."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            snapshot = self.refresh()
+            if snapshot is not None:
+                logger.debug(
+                    "Refreshed snapshot %d with %d APs in %.2fs"
+                    % (
+                        snapshot.version,
+                        len(snapshot.accesspoints.accesspoints),
+                        time.monotonic() - started,
+                    )
+                )
+            self._stopped.wait(max(0.0, self._interval - (time.monotonic() - started)))
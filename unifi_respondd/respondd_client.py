@@ -1,16 +1,23 @@
 #!/usr/bin/env python3
 
+import asyncio
 import dataclasses
 import json
 import socket
-import struct
 import time
 import zlib
 from typing import Dict, List
 
 from dataclasses_json import dataclass_json
 
-from unifi_respondd import logger, unifi_client
+from unifi_respondd import listener, logger, metrics, serializer, sharding
+from unifi_respondd.refresher import SnapshotRefresher
+from unifi_respondd.scheduler import PushSchedule
+from unifi_respondd.sender import BatchSender, Pacer
+
+UNICAST_REQUEST = ["GET", "nodeinfo", "statistics", "neighbours"]
+# pushes starting later than this many seconds are logged as warning
+PUSH_LATENESS_WARNING = 1.0
 
 
 @dataclasses.dataclass
@@ -233,15 +240,168 @@ class NeighboursInfo:
     batadv: Dict[str, Neighbours]
 
 
+def compress(data):
+    """This function compresses a payload with raw deflate, as expected by respondd."""
+    encoder = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return encoder.compress(data) + encoder.flush()
+
+
+class ResponseCache:
+    """This class caches the serialized respondd payload of every node.
+
+    Payloads are keyed by node_id, the requested sections and whether the
+    request was a compressed multi request. When a new snapshot arrives, only
+    the entries of nodes whose Accesspoint changed are dropped. Sections are
+    built with the dict builders of the serializer module, which produce the
+    same JSON as the to_dict() of the respondd dataclasses."""
+
+    def __init__(self, sections=serializer.SECTIONS, dumps=serializer.dumps):
+        self._sections = sections
+        self._dumps = dumps
+        self._version = None
+        self._nodes = {}
+
+    def _update(self, snapshot):
+        if snapshot.version == self._version:
+            return
+        nodes = {}
+        for ap in snapshot.accesspoints.accesspoints:
+            node_id = ap.mac.replace(":", "")
+            cached = self._nodes.get(node_id)
+            if cached is not None and cached[0] == ap:
+                nodes[node_id] = cached
+            else:
+                nodes[node_id] = (ap, self._initial(ap))
+        self._nodes = nodes
+        self._version = snapshot.version
+
+    def _initial(self, ap):
+        return {}
+
+    def _serialize(self, ap, sections, multi):
+        if multi:
+            node = {section: self._sections[section](ap) for section in sections}
+            return self._dumps(node)
+        return self._dumps(self._sections[sections[0]](ap))
+
+    def payloads(self, snapshot, sections, multi, accept=None):
+        """This method returns the payload of every node in the snapshot.
+
+        The payloads missing from the cache are serialized, and compressed for
+        multi requests, in one go, so that both stages are timed once per call.
+        Arguments:
+            snapshot: The snapshot to answer from.
+            sections: A tuple of known, distinct sections.
+            multi: True for a compressed multi request, False for a single request.
+            accept: A function returning True for the APs to answer for, all if None."""
+        self._update(snapshot)
+        key = (sections, multi)
+        nodes = self._nodes.values()
+        if accept is not None:
+            nodes = [node for node in nodes if accept(node[0])]
+        missing = [(ap, payloads) for ap, payloads in nodes if key not in payloads]
+        if missing:
+            with metrics.STAGE_SECONDS.time(stage="serialize"):
+                encoded = [self._serialize(ap, sections, multi) for ap, _ in missing]
+            metrics.PAYLOAD_BYTES.inc(
+                sum(len(payload) for payload in encoded), encoding="identity"
+            )
+            if multi:
+                with metrics.STAGE_SECONDS.time(stage="compress"):
+                    encoded = [compress(payload) for payload in encoded]
+                metrics.PAYLOAD_BYTES.inc(
+                    sum(len(payload) for payload in encoded), encoding="deflate"
+                )
+            for (_, payloads), payload in zip(missing, encoded):
+                payloads[key] = payload
+        return [payloads[key] for _, payloads in nodes]
+
+
+class RecordCache(ResponseCache):
+    """This class caches the payloads of snapshots of sharding.NodeRecords.
+
+    The records come with the payloads of single requests and of the multi
+    request for all sections, as the workers serialized them. Other multi
+    requests are joined from the encoded sections and compressed, without
+    decoding or building any sections again."""
+
+    def __init__(self, dumps=serializer.dumps):
+        super().__init__(dumps=dumps)
+        self._separators = serializer.separators(dumps)
+
+    def _initial(self, ap):
+        return dict(ap.payloads)
+
+    def _serialize(self, ap, sections, multi):
+        parts = [(section, ap.payloads[((section,), False)]) for section in sections]
+        if multi:
+            return serializer.join_sections(parts, *self._separators)
+        return parts[0][1]
+
+
+class ResponddProtocol(asyncio.DatagramProtocol):
+    """This class hands datagrams received by the asyncio responder to the ResponddClient."""
+
+    def __init__(self, client, listenerCfg=None):
+        self._client = client
+        self._listenerCfg = listenerCfg
+        self._tasks = set()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        logger.info("Using multicast method")
+        metrics.REQUESTS.inc(method="multicast")
+        msgSplit = str(data, "UTF-8").split(" ")
+        task = asyncio.get_running_loop().create_task(
+            self._client.handleRequest(
+                msgSplit, addr, self.transport, self._listenerCfg
+            )
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def error_received(self, exc):
+        logger.error("Error: %s" % (exc))
+
+
 class ResponddClient:
     """This class receives a request from the respondd server and returns the response."""
 
-    def __init__(self, config):
+    def __init__(self, config, socks=None):
         self._config = config
         self._aps = None
-        self._timeStart = time.time()
-        self._timeStop = time.time()
-        self._sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        dumps = serializer.get_dumps(self._config.use_orjson)
+        self._cache = ResponseCache(dumps=dumps)
+        self._shards = None
+        collect = None
+        if self._config.shard_workers > 0:
+            # a worker bounds the login and the site list, and every site, by site_timeout
+            self._shards = sharding.ShardPool(
+                self._config.shard_workers, timeout=3 * self._config.site_timeout
+            )
+            collect = self._shards.collect
+            self._cache = RecordCache(dumps=dumps)
+        self._refresher = SnapshotRefresher(
+            self._config.refresh_interval,
+            collect=collect,
+            freshness=self._config.refresh_freshness,
+        )
+        self._pushSchedule = None
+        # sockets passed in are already bound by listener.open_sockets(), one per listener
+        self._bound = bool(socks)
+        self._socks = list(socks or [socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)])
+        self._sock = self._socks[0]
+        self._sender = BatchSender(self._sock, batch_size=self._config.send_batch_size)
+        self._transportSenders = {}
+        metrics.SNAPSHOT_AGE.set_function(lambda: self.snapshot_age)
+
+    @property
+    def snapshot_age(self):
+        """Returns the age of the snapshot requests are answered from in seconds."""
+        return self._refresher.snapshot_age
 
     @property
     def _nodeinfos(self):
@@ -258,121 +418,102 @@ class ResponddClient:
     @staticmethod
     def joinMCAST(sock, addr, ifname):
         """Joins a multicast group on a socket."""
-        group = socket.inet_pton(socket.AF_INET6, addr)
-        if_idx = socket.if_nametoindex(ifname)
-        sock.setsockopt(
-            socket.IPPROTO_IPV6,
-            socket.IPV6_JOIN_GROUP,
-            group + struct.pack("I", if_idx),
+        listener.join_group(sock, addr, ifname)
+
+    @staticmethod
+    def buildNodeInfo(ap):
+        """This method returns the node information of an AP."""
+        return NodeInfo(
+            software=SoftwareInfo(
+                firmware=FirmwareInfo(base="UniFi", release=ap.firmware)
+            ),
+            hostname=ap.name,
+            node_id=ap.mac.replace(":", ""),
+            location=LocationInfo(latitude=ap.latitude, longitude=ap.longitude),
+            hardware=HardwareInfo(model=ap.model),
+            owner=OwnerInfo(contact=ap.contact),
+            network=NetworkInfo(
+                mac=ap.mac,
+                mesh={"bat0": IntInfo(interfaces=InterfacesInfo(other=[ap.mac]))},
+            ),
+            system=SystemInfo(domain_code=ap.domain_code),
         )
 
     def getNodeInfos(self):
         """This method returns the node information of all APs."""
-        aps = self._aps
-        nodes = []
-        for ap in aps.accesspoints:
-            nodes.append(
-                NodeInfo(
-                    software=SoftwareInfo(
-                        firmware=FirmwareInfo(base="UniFi", release=ap.firmware)
-                    ),
-                    hostname=ap.name,
-                    node_id=ap.mac.replace(":", ""),
-                    location=LocationInfo(latitude=ap.latitude, longitude=ap.longitude),
-                    hardware=HardwareInfo(model=ap.model),
-                    owner=OwnerInfo(contact=ap.contact),
-                    network=NetworkInfo(
-                        mac=ap.mac,
-                        mesh={
-                            "bat0": IntInfo(interfaces=InterfacesInfo(other=[ap.mac]))
-                        },
-                    ),
-                    system=SystemInfo(domain_code=ap.domain_code),
+        return [self.buildNodeInfo(ap) for ap in self._aps.accesspoints]
+
+    frequency_from_channel = staticmethod(serializer.frequency_from_channel)
+
+    @classmethod
+    def buildStatistics(cls, ap):
+        """This method returns the statistics information of an AP."""
+        wirelessinfos = []
+
+        if ap.channel5:
+            frequency5 = cls.frequency_from_channel(ap.channel5)
+            wirelessinfos.append(
+                WirelessInfo(
+                    frequency=frequency5,
+                    rx=ap.rx_bytes5,
+                    tx=ap.tx_bytes5,
                 )
             )
-        return nodes
 
-    @staticmethod
-    def frequency_from_channel(channel):
-        if channel >= 36:
-            return 5000 + (channel) * 5
-        else:
-            if channel == 14:
-                return 2484
-            elif channel < 14:
-                return 2407 + (channel) * 5
+        if ap.channel24:
+            frequency24 = cls.frequency_from_channel(ap.channel24)
+            wirelessinfos.append(
+                WirelessInfo(
+                    frequency=frequency24,
+                    rx=ap.rx_bytes5,
+                    tx=ap.tx_bytes5,
+                )
+            )
+
+        return StatisticsInfo(
+            clients=ClientInfo(
+                total=ap.client_count,
+                wifi=ap.client_count,
+                wifi24=ap.client_count24,
+                wifi5=ap.client_count5,
+            ),
+            uptime=ap.uptime,
+            node_id=ap.mac.replace(":", ""),
+            loadavg=ap.load_avg,
+            memory=MemoryInfo(
+                total=int(ap.mem_total / 1024),
+                free=int((ap.mem_total - ap.mem_used) / 1024),
+                buffers=int(ap.mem_buffer / 1024),
+            ),
+            traffic=TrafficInfo(
+                tx=txInfo(bytes=int(ap.tx_bytes)),
+                rx=rxInfo(bytes=int(ap.rx_bytes)),
+            ),
+            gateway=ap.gateway,
+            gateway6=ap.gateway6,
+            gateway_nexthop=ap.gateway_nexthop,
+            wireless=wirelessinfos,
+        )
 
     def getStatistics(self):
         """This method returns the statistics information of all APs."""
-        aps = self._aps
-        statistics = []
-        for ap in aps.accesspoints:
-            wirelessinfos = []
-
-            if ap.channel5:
-                frequency5 = self.frequency_from_channel(ap.channel5)
-                wirelessinfos.append(
-                    WirelessInfo(
-                        frequency=frequency5,
-                        rx=ap.rx_bytes5,
-                        tx=ap.tx_bytes5,
-                    )
-                )
+        return [self.buildStatistics(ap) for ap in self._aps.accesspoints]
 
-            if ap.channel24:
-                frequency24 = self.frequency_from_channel(ap.channel24)
-                wirelessinfos.append(
-                    WirelessInfo(
-                        frequency=frequency24,
-                        rx=ap.rx_bytes5,
-                        tx=ap.tx_bytes5,
-                    )
-                )
-
-            statistics.append(
-                StatisticsInfo(
-                    clients=ClientInfo(
-                        total=ap.client_count,
-                        wifi=ap.client_count,
-                        wifi24=ap.client_count24,
-                        wifi5=ap.client_count5,
-                    ),
-                    uptime=ap.uptime,
-                    node_id=ap.mac.replace(":", ""),
-                    loadavg=ap.load_avg,
-                    memory=MemoryInfo(
-                        total=int(ap.mem_total / 1024),
-                        free=int((ap.mem_total - ap.mem_used) / 1024),
-                        buffers=int(ap.mem_buffer / 1024),
-                    ),
-                    traffic=TrafficInfo(
-                        tx=txInfo(bytes=int(ap.tx_bytes)),
-                        rx=rxInfo(bytes=int(ap.rx_bytes)),
-                    ),
-                    gateway=ap.gateway,
-                    gateway6=ap.gateway6,
-                    gateway_nexthop=ap.gateway_nexthop,
-                    wireless=wirelessinfos,
-                )
-            )
-        return statistics
+    @staticmethod
+    def buildNeighbours(ap):
+        """This method returns the neighbour information of an AP."""
+        nbs = {}
+        for neighbour_mac in ap.neighbour_macs:
+            if neighbour_mac is not None:
+                nbs[neighbour_mac] = NeighbourDetails(tq=255, lastseen=0.45)
+        return NeighboursInfo(
+            node_id=ap.mac.replace(":", ""),
+            batadv={ap.mac: Neighbours(neighbours=nbs)},
+        )
 
     def getNeighbours(self):
         """This method returns the neighbour information of all APs."""
-        aps = self._aps
-        neighbours = []
-        for ap in aps.accesspoints:
-            nbs = {}
-            for neighbour_mac in ap.neighbour_macs:
-                if neighbour_mac is not None:
-                    nbs[neighbour_mac] = NeighbourDetails(tq=255, lastseen=0.45)
-            neighbours.append(
-                NeighboursInfo(
-                    node_id=ap.mac.replace(":", ""),
-                    batadv={ap.mac: Neighbours(neighbours=nbs)},
-                )
-            )
-        return neighbours
+        return [self.buildNeighbours(ap) for ap in self._aps.accesspoints]
 
     def listenMulticast(self):
         msg, sourceAddress = self._sock.recvfrom(2048)
@@ -381,49 +522,285 @@ class ResponddClient:
 
         return msgSplit, sourceAddress
 
-    def sendUnicast(self):
+    def newPushSchedule(self):
+        """This method starts the schedule of the unicast pushes."""
         logger.info("Using unicast method")
-
-        timeSleep = int(60 - (self._timeStop - self._timeStart) % 60)
+        self._pushSchedule = PushSchedule(
+            self._config.unicast_period, self._config.unicast_lead
+        )
+        return self._pushSchedule
+
+    def waitForPush(self):
+        """This method sleeps until the next unicast push, the snapshot is
+        collected unicast_lead seconds ahead of it.
+        Returns:
+            The snapshot to push."""
+        schedule = self._pushSchedule
+        timeSleep = schedule.delay(schedule.collect_at)
         if self._config.verbose:
-            logger.debug("will now sleep " + str(timeSleep) + " seconds")
+            logger.debug("will now sleep %.1f seconds" % timeSleep)
         time.sleep(timeSleep)
+        snapshot = self.collectForPush()
+        time.sleep(schedule.delay(schedule.deadline))
+        return snapshot
+
+    def collectForPush(self):
+        """This method collects the snapshot of a unicast push. In background
+        mode a refresh is run as well, or joined if one is in progress, so the
+        push does not send a snapshot up to refresh_interval seconds old.
+        Returns:
+            The snapshot to push, the previous one if the collection failed."""
+        if self._refresher.background:
+            return self._refresher.refresh() or self._refresher.snapshot
+        return self._refresher.get()
+
+    def startPush(self):
+        """This method records the start of a unicast push and reports how late it is."""
+        schedule = self._pushSchedule
+        missed = schedule.missed
+        lateness = schedule.pushed()
+        if schedule.missed > missed:
+            logger.warning("Skipped %d unicast pushes" % (schedule.missed - missed))
+        if lateness > PUSH_LATENESS_WARNING:
+            logger.warning(
+                "Unicast push %d is %.3fs late" % (schedule.pushes, lateness)
+            )
+        elif self._config.verbose:
+            logger.debug("Unicast push %d is %.3fs late" % (schedule.pushes, lateness))
 
-    def start(self):
-        """This method starts the respondd client."""
-        self._sock.setsockopt(
-            socket.SOL_SOCKET,
-            socket.SO_BINDTODEVICE,
-            bytes(self._config.interface.encode()),
+    def setupSocket(self):
+        """This method binds the socket of every listener to its interface and joins its multicast group."""
+        if self._bound:
+            return
+        listenerCfgs = self._config.get_listeners()
+        listener.bind_socket(
+            self._sock,
+            listenerCfgs[0],
+            listener.shares_port(listenerCfgs[0], listenerCfgs),
         )
-        if self._config.multicast_enabled:
-            self._sock.bind(("::", self._config.multicast_port))
+        for listenerCfg in listenerCfgs[1:]:
+            self._socks.append(
+                listener.open_socket(
+                    listenerCfg, listener.shares_port(listenerCfg, listenerCfgs)
+                )
+            )
+        self._bound = True
+
+    def getEndpoints(self):
+        """This method returns the socket and the configuration of every listener."""
+        return list(zip(self._socks, self._config.get_listeners()))
 
-            self.joinMCAST(
-                self._sock, self._config.multicast_address, self._config.interface
+    @staticmethod
+    def parseRequest(msgSplit):
+        """This method returns the requested sections and whether it is a multi request."""
+        if msgSplit[0] == "GET":  # multi_request
+            return msgSplit[1:], True
+        return msgSplit[:1], False  # single_request
+
+    def checkSnapshot(self, snapshot):
+        """This method logs the snapshot a request is answered from.
+        Returns:
+            True if the request can be answered."""
+        if snapshot is None:
+            logger.warning("No snapshot available yet, ignoring request")
+            return False
+        if self._config.verbose:
+            logger.debug(
+                "Answering from snapshot %d, age %.1fs"
+                % (snapshot.version, snapshot.age)
             )
+        if (
+            self._refresher.background
+            and snapshot.age > 2 * self._config.refresh_interval
+        ):
+            logger.warning("Snapshot is stale, age %.1fs" % snapshot.age)
+        self._aps = snapshot.accesspoints
+        return True
 
-        while True:
-            responseStruct = {}
-            sourceAddress = (self._config.unicast_address, self._config.unicast_port)
-            msgSplit = ["GET", "nodeinfo", "statistics", "neighbours"]
+    def start(self):
+        """This method starts the respondd client."""
+        self.startMetrics()
+        # several listeners are always served from one event loop
+        if self._config.asyncio_enabled or len(self._config.get_listeners()) > 1:
+            asyncio.run(self.serve())
+            return
+        self.setupSocket()
+        listenerCfg = self._config.get_listeners()[0]
+        self._refresher.start()
+        if not self._config.multicast_enabled:
+            self.newPushSchedule()
 
+        while True:
             if self._config.multicast_enabled:
                 msgSplit, sourceAddress = self.listenMulticast()
+                metrics.REQUESTS.inc(method="multicast")
+                snapshot = self._refresher.get()
+                window = 0
             else:
-                self.sendUnicast()
-            self._timeStart = time.time()
-            self._aps = unifi_client.get_infos()
-            if self._aps is None:
+                snapshot = self.waitForPush()
+                self.startPush()
+                metrics.REQUESTS.inc(method="unicast")
+                msgSplit = UNICAST_REQUEST
+                sourceAddress = (listenerCfg.unicast_address, listenerCfg.unicast_port)
+                window = self._config.unicast_spread
+            if not self.checkSnapshot(snapshot):
                 continue
-            if msgSplit[0] == "GET":  # multi_request
-                for request in msgSplit[1:]:
-                    responseStruct[request] = self.buildStruct(request)
-                self.sendStruct(sourceAddress, responseStruct, True)
-            else:  # single_request
-                responseStruct = self.buildStruct(msgSplit[0])
-                self.sendStruct(sourceAddress, responseStruct, False)
-            self._timeStop = time.time()
+            requests, multi = self.parseRequest(msgSplit)
+            self.sendResponse(
+                sourceAddress, snapshot, requests, multi, window, listenerCfg
+            )
+
+    def startMetrics(self):
+        """This method serves the metrics on metrics_address and metrics_port, if enabled."""
+        if self._config.metrics_port <= 0:
+            return None
+        try:
+            return metrics.start_server(
+                self._config.metrics_address, self._config.metrics_port
+            )
+        except OSError as ex:
+            logger.error("Error: %s" % (ex))
+            return None
+
+    def getPayloads(self, snapshot, requests, multi, listenerCfg=None):
+        """This method returns the cached payload of every node for a request,
+        or of the nodes the listener answers for."""
+        sections = []
+        for request in requests:
+            if request not in serializer.SECTIONS:
+                logger.warning("unknown command: " + request)
+            elif request not in sections:
+                sections.append(request)
+        if not sections:
+            return []
+        accept = None
+        if listenerCfg is not None and listenerCfg.filtered:
+            accept = listenerCfg.accepts
+        return self._cache.payloads(snapshot, tuple(sections), multi, accept)
+
+    def sendResponse(
+        self, destAddress, snapshot, requests, multi, window=0, listenerCfg=None
+    ):
+        """This method sends the cached payload of every node to the respondd server,
+        spread across window seconds."""
+        payloads = self.getPayloads(snapshot, requests, multi, listenerCfg)
+        pacer = Pacer.spread(len(payloads), window, self._config.send_rate)
+        self._sender.send(payloads, destAddress, pacer)
+        if self._config.verbose:
+            self._sender.log_stats()
+
+    def getTransportSender(self, transport):
+        """This method returns the BatchSender for the socket of an asyncio transport."""
+        sender = self._transportSenders.get(transport)
+        if sender is None:
+            sender = BatchSender(
+                transport.get_extra_info("socket"),
+                batch_size=self._config.send_batch_size,
+                transport=transport,
+            )
+            self._transportSenders[transport] = sender
+        return sender
+
+    async def serve(self):
+        """This method runs the asyncio responder.
+
+        Every request is answered by its own task from the current snapshot,
+        so overlapping requests of several collectors are served concurrently.
+        Every listener gets its own datagram endpoint, all of them answer from
+        the same snapshot. The collection runs as a separate task."""
+        loop = asyncio.get_running_loop()
+        self.setupSocket()
+        endpoints = []
+        try:
+            for sock, listenerCfg in self.getEndpoints():
+                sock.setblocking(False)
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda listenerCfg=listenerCfg: ResponddProtocol(self, listenerCfg),
+                    sock=sock,
+                )
+                endpoints.append((transport, listenerCfg))
+            tasks = []
+            if self._refresher.background:
+                tasks.append(loop.create_task(self.refreshForever()))
+            if not self._config.multicast_enabled:
+                tasks.append(loop.create_task(self.pushForever(endpoints)))
+            await asyncio.gather(*tasks, loop.create_future())
+        finally:
+            for transport, _ in endpoints:
+                transport.close()
+
+    async def refreshForever(self):
+        """This method collects a new snapshot every refresh_interval seconds."""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await loop.run_in_executor(None, self._refresher.refresh)
+            await asyncio.sleep(
+                max(0.0, self._config.refresh_interval - (loop.time() - started))
+            )
+
+    async def pushForever(self, endpoints):
+        """This method pushes all sections to the unicast address of every listener
+        every unicast_period seconds.
+        Arguments:
+            endpoints: A list of the transport and the configuration of every listener.
+        """
+        loop = asyncio.get_running_loop()
+        schedule = self.newPushSchedule()
+        while True:
+            timeSleep = schedule.delay(schedule.collect_at)
+            if self._config.verbose:
+                logger.debug("will now sleep %.1f seconds" % timeSleep)
+            await asyncio.sleep(timeSleep)
+            snapshot = await loop.run_in_executor(None, self.collectForPush)
+            await asyncio.sleep(schedule.delay(schedule.deadline))
+            self.startPush()
+            metrics.REQUESTS.inc(method="unicast")
+            await asyncio.gather(
+                *(
+                    self.respond(
+                        snapshot,
+                        UNICAST_REQUEST,
+                        (listenerCfg.unicast_address, listenerCfg.unicast_port),
+                        transport,
+                        self._config.unicast_spread,
+                        listenerCfg,
+                    )
+                    for transport, listenerCfg in endpoints
+                )
+            )
+
+    async def getSnapshot(self):
+        """This method returns the snapshot to answer from without blocking the event loop."""
+        if self._refresher.background:
+            return self._refresher.snapshot
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._refresher.get)
+
+    async def handleRequest(self, msgSplit, sourceAddress, transport, listenerCfg=None):
+        """This method answers one request on an asyncio transport."""
+        snapshot = await self.getSnapshot()
+        await self.respond(
+            snapshot, msgSplit, sourceAddress, transport, listenerCfg=listenerCfg
+        )
+
+    async def respond(
+        self, snapshot, msgSplit, sourceAddress, transport, window=0, listenerCfg=None
+    ):
+        """This method sends the response to a request from a snapshot, spread
+        across window seconds, for the nodes listenerCfg answers for."""
+        if not self.checkSnapshot(snapshot):
+            return
+        requests, multi = self.parseRequest(msgSplit)
+        payloads = self.getPayloads(snapshot, requests, multi, listenerCfg)
+        sender = self.getTransportSender(transport)
+        pacer = Pacer.spread(len(payloads), window, self._config.send_rate)
+        for batch in sender.batches_of(payloads, pacer):
+            # let other requests interleave with large responses
+            await asyncio.sleep(pacer.delay(len(batch)))
+            await sender.send_batch_async(batch, sourceAddress)
+        if self._config.verbose:
+            sender.log_stats()
 
     def merge_node(self, responseStruct):
         """This method merges the node information of all APs to their corresponding node_id."""
@@ -460,6 +837,7 @@ class ResponddClient:
         )
 
         merged = self.merge_node(responseStruct)
+        payloads = []
         for infos in merged.values():
             node = {}
             for key, info in infos.items():
@@ -468,10 +846,7 @@ class ResponddClient:
             logger.info(str(responseData))
 
             if withCompression:
-                encoder = zlib.compressobj(
-                    zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15
-                )
-                responseData = encoder.compress(responseData)
-                responseData += encoder.flush()
+                responseData = compress(responseData)
 
-            self._sock.sendto(responseData, destAddress)
+            payloads.append(responseData)
+        self._sender.send(payloads, destAddress, Pacer(self._config.send_rate))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import time
+from typing import Optional
+
+
+class PushSchedule:
+    """This class schedules the periodic unicast pushes on the monotonic clock.
+
+    Deadlines are whole periods after the start, so the time a push takes does
+    not shift the following ones. Collection is due lead seconds before each
+    deadline. Deadlines that passed while a push was still running are skipped.
+    Attributes:
+        period: Seconds between two pushes.
+        lead: Seconds the collection runs ahead of the push deadline.
+        deadline: The time.monotonic() timestamp of the next push.
+        pushes: The number of pushes done.
+        missed: The number of deadlines skipped.
+        lateness: Seconds the last push started after its deadline.
+        max_lateness: The largest lateness seen."""
+
+    def __init__(self, period: float, lead: float = 0, start: Optional[float] = None):
+        self.period = period
+        self.lead = max(0.0, min(lead, period))
+        self.deadline = (time.monotonic() if start is None else start) + period
+        self.pushes = 0
+        self.missed = 0
+        self.lateness = 0.0
+        self.max_lateness = 0.0
+
+    @property
+    def collect_at(self) -> float:
+        """Returns the time.monotonic() timestamp the next collection is due at."""
+        return self.deadline - self.lead
+
+    @staticmethod
+    def delay(until: float) -> float:
+        """Returns the seconds left until a time.monotonic() timestamp."""
+        return max(0.0, until - time.monotonic())
+
+    def pushed(self, now: Optional[float] = None) -> float:
+        """Records that the push of the current deadline started and moves on
+        to the next deadline.
+        Returns:
+            Seconds the push started after its deadline."""
+        if now is None:
+            now = time.monotonic()
+        lateness = max(0.0, now - self.deadline)
+        self.pushes += 1
+        self.lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.deadline += self.period
+        if self.deadline <= now:
+            missed = int((now - self.deadline) // self.period) + 1
+            self.missed += missed
+            self.deadline += missed * self.period
+        return lateness
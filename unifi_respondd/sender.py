@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import math
+import select
+import socket
+import time
+from collections import OrderedDict
+
+from unifi_respondd import logger, metrics
+
+# sendmmsg() accepts at most UIO_MAXIOV messages per call
+MAX_BATCH_SIZE = 1024
+EAGAIN_RETRIES = 3
+EAGAIN_WAIT = 0.05
+# paced packets are sent in batches of about this many seconds worth
+PACING_TICK = 0.1
+# resolved destinations kept, requests come from arbitrary source addresses
+ADDRESS_CACHE_SIZE = 64
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+
+class _sockaddr_in6(ctypes.Structure):
+    _fields_ = [
+        ("sin6_family", ctypes.c_ushort),
+        ("sin6_port", ctypes.c_uint16),
+        ("sin6_flowinfo", ctypes.c_uint32),
+        ("sin6_addr", ctypes.c_ubyte * 16),
+        ("sin6_scope_id", ctypes.c_uint32),
+    ]
+
+
+def _load_sendmmsg():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError, TypeError):
+        return None
+    sendmmsg.argtypes = [
+        ctypes.c_int,
+        ctypes.c_void_p,
+        ctypes.c_uint,
+        ctypes.c_int,
+    ]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+class Pacer:
+    """This class spaces packets so that at most rate packets per second are sent.
+
+    A rate of 0 disables pacing."""
+
+    def __init__(self, rate):
+        self._rate = rate
+        self._started = None
+        self._sent = 0
+
+    @classmethod
+    def spread(cls, count, window, rate=0):
+        """Returns a Pacer that spreads count packets evenly across window
+        seconds, but sends no faster than rate."""
+        if window > 0 and count > 0:
+            even = count / window
+            rate = min(rate, even) if rate > 0 else even
+        return cls(rate)
+
+    def batch_size(self, limit):
+        """Returns the batch size that keeps paced batches about PACING_TICK apart."""
+        if self._rate <= 0:
+            return limit
+        return max(1, min(limit, math.ceil(self._rate * PACING_TICK)))
+
+    def delay(self, count):
+        """Returns the seconds to wait before the next count packets may be sent."""
+        if self._rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        if self._started is None:
+            self._started = now
+        due = self._started + self._sent / self._rate
+        self._sent += count
+        return max(0.0, due - now)
+
+
+class BatchSender:
+    """This class sends datagrams in batches with sendmmsg(), if libc offers it.
+
+    Otherwise it falls back to one sendto() per datagram, on the asyncio
+    transport if one is given. A non-blocking socket that is not writable
+    (EAGAIN) is waited for briefly, packets that still cannot be sent are
+    dropped. send_batch() waits with select(), send_batch_async() sleeps on
+    the event loop instead, so other requests are answered meanwhile.
+    Attributes:
+        sent: The number of datagrams sent.
+        batches: The number of send calls.
+        eagain: The number of times the socket was not writable.
+        dropped: The number of datagrams given up."""
+
+    def __init__(self, sock, batch_size=64, use_sendmmsg=True, transport=None):
+        self._sock = sock
+        self.transport = transport
+        self._sendto = transport.sendto if transport is not None else sock.sendto
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self._sendmmsg = _sendmmsg if use_sendmmsg else None
+        if self._sendmmsg is not None and sock.family != socket.AF_INET6:
+            self._sendmmsg = None
+        self._addresses = OrderedDict()
+        self.sent = 0
+        self.batches = 0
+        self.eagain = 0
+        self.dropped = 0
+
+    @property
+    def batched(self):
+        """Returns True if sendmmsg() is used."""
+        return self._sendmmsg is not None
+
+    def _sockaddr(self, destAddress):
+        sockaddr = self._addresses.get(destAddress)
+        if sockaddr is not None:
+            self._addresses.move_to_end(destAddress)
+        else:
+            host, port, flowinfo, scope_id = socket.getaddrinfo(
+                destAddress[0],
+                destAddress[1],
+                socket.AF_INET6,
+                socket.SOCK_DGRAM,
+            )[0][4]
+            if len(destAddress) == 4:
+                flowinfo, scope_id = destAddress[2], destAddress[3]
+            sockaddr = _sockaddr_in6(
+                sin6_family=socket.AF_INET6,
+                sin6_port=socket.htons(port),
+                sin6_flowinfo=socket.htonl(flowinfo),
+                sin6_scope_id=scope_id,
+            )
+            ctypes.memmove(
+                sockaddr.sin6_addr,
+                socket.inet_pton(socket.AF_INET6, host.split("%")[0]),
+                16,
+            )
+            self._addresses[destAddress] = sockaddr
+            if len(self._addresses) > ADDRESS_CACHE_SIZE:
+                self._addresses.popitem(last=False)
+        return sockaddr
+
+    def _send_batch_mmsg(self, payloads, destAddress):
+        sockaddr = self._sockaddr(destAddress)
+        count = len(payloads)
+        iovecs = (_iovec * count)()
+        msgs = (_mmsghdr * count)()
+        buffers = [ctypes.c_char_p(payload) for payload in payloads]
+        for i, payload in enumerate(payloads):
+            iovecs[i].iov_base = ctypes.cast(buffers[i], ctypes.c_void_p)
+            iovecs[i].iov_len = len(payload)
+            hdr = msgs[i].msg_hdr
+            hdr.msg_name = ctypes.cast(ctypes.pointer(sockaddr), ctypes.c_void_p)
+            hdr.msg_namelen = ctypes.sizeof(sockaddr)
+            hdr.msg_iov = ctypes.pointer(iovecs[i])
+            hdr.msg_iovlen = 1
+        offset = 0
+        retries = 0
+        while offset < count:
+            sent = self._sendmmsg(
+                self._sock.fileno(),
+                ctypes.addressof(msgs) + offset * ctypes.sizeof(_mmsghdr),
+                count - offset,
+                0,
+            )
+            self.batches += 1
+            if sent < 0:
+                err = ctypes.get_errno()
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    self.eagain += 1
+                    if retries < EAGAIN_RETRIES:
+                        retries += 1
+                        yield
+                        continue
+                    self.dropped += count - offset
+                    return offset
+                if err == errno.EINTR:
+                    continue
+                raise OSError(err, "sendmmsg: " + errno.errorcode.get(err, str(err)))
+            offset += sent
+            self.sent += sent
+            retries = 0
+        return offset
+
+    def _send_batch_loop(self, payloads, destAddress):
+        sent = 0
+        for payload in payloads:
+            for attempt in range(EAGAIN_RETRIES + 1):
+                try:
+                    self._sendto(payload, destAddress)
+                except BlockingIOError:
+                    self.eagain += 1
+                    if attempt < EAGAIN_RETRIES:
+                        yield
+                    continue
+                self.batches += 1
+                self.sent += 1
+                sent += 1
+                break
+            else:
+                self.dropped += 1
+        return sent
+
+    def _steps(self, payloads, destAddress):
+        """Returns a generator that sends payloads and yields whenever the
+        socket has to be waited for, its return value is the number sent."""
+        if self._sendmmsg is not None:
+            return self._send_batch_mmsg(payloads, destAddress)
+        return self._send_batch_loop(payloads, destAddress)
+
+    def _count(self, payloads, sent, dropped):
+        metrics.PACKETS.inc(sent, result="sent")
+        metrics.PACKETS.inc(self.dropped - dropped, result="dropped")
+        metrics.SENT_BYTES.inc(sum(len(payload) for payload in payloads[:sent]))
+
+    def send_batch(self, payloads, destAddress):
+        """Sends up to batch_size datagrams to destAddress, blocking while the
+        socket is not writable.
+        Returns:
+            The number of datagrams sent."""
+        dropped = self.dropped
+        with metrics.STAGE_SECONDS.time(stage="send"):
+            steps = self._steps(payloads, destAddress)
+            while True:
+                try:
+                    next(steps)
+                except StopIteration as stop:
+                    sent = stop.value
+                    break
+                select.select([], [self._sock], [], EAGAIN_WAIT)
+        self._count(payloads, sent, dropped)
+        return sent
+
+    async def send_batch_async(self, payloads, destAddress):
+        """Sends up to batch_size datagrams to destAddress like send_batch(),
+        but sleeps on the event loop while the socket is not writable.
+        Returns:
+            The number of datagrams sent."""
+        dropped = self.dropped
+        with metrics.STAGE_SECONDS.time(stage="send"):
+            steps = self._steps(payloads, destAddress)
+            while True:
+                try:
+                    next(steps)
+                except StopIteration as stop:
+                    sent = stop.value
+                    break
+                await asyncio.sleep(EAGAIN_WAIT)
+        self._count(payloads, sent, dropped)
+        return sent
+
+    def batches_of(self, payloads, pacer=None):
+        """Splits payloads into batches of batch_size, or smaller ones if paced."""
+        size = self.batch_size if pacer is None else pacer.batch_size(self.batch_size)
+        for start in range(0, len(payloads), size):
+            end = start + size
+            yield payloads[start:end]
+
+    def send(self, payloads, destAddress, pacer=None):
+        """Sends all payloads to destAddress, paced by pacer.
+        Returns:
+            The number of datagrams sent."""
+        sent = 0
+        for batch in self.batches_of(payloads, pacer):
+            if pacer is not None:
+                delay = pacer.delay(len(batch))
+                if delay:
+                    time.sleep(delay)
+            sent += self.send_batch(batch, destAddress)
+        return sent
+
+    def log_stats(self):
+        """Logs the counters."""
+        logger.debug(
+            "Sent %d packets in %d calls, %d EAGAIN, %d dropped"
+            % (self.sent, self.batches, self.eagain, self.dropped)
+        )
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import json
+
+from unifi_respondd import logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def frequency_from_channel(channel):
+    """This function returns the center frequency of a WiFi channel in MHz."""
+    if channel >= 36:
+        return 5000 + (channel) * 5
+    else:
+        if channel == 14:
+            return 2484
+        elif channel < 14:
+            return 2407 + (channel) * 5
+
+
+def nodeinfo_dict(ap):
+    """This function returns the nodeinfo section of an AP, like NodeInfo.to_dict()."""
+    return {
+        "software": {"firmware": {"base": "UniFi", "release": ap.firmware}},
+        "hostname": ap.name,
+        "node_id": ap.mac.replace(":", ""),
+        "location": {"latitude": ap.latitude, "longitude": ap.longitude},
+        "hardware": {"model": ap.model, "nproc": 1},
+        "owner": {"contact": ap.contact},
+        "network": {
+            "mac": ap.mac,
+            "mesh": {"bat0": {"interfaces": {"other": [ap.mac]}}},
+        },
+        "system": {"domain_code": ap.domain_code},
+    }
+
+
+def statistics_dict(ap):
+    """This function returns the statistics section of an AP, like StatisticsInfo.to_dict()."""
+    wireless = []
+    if ap.channel5:
+        wireless.append(
+            {
+                "frequency": frequency_from_channel(ap.channel5),
+                "rx": ap.rx_bytes5,
+                "tx": ap.tx_bytes5,
+            }
+        )
+    if ap.channel24:
+        # ResponddClient.buildStatistics reports the 5 GHz counters here as well.
+        wireless.append(
+            {
+                "frequency": frequency_from_channel(ap.channel24),
+                "rx": ap.rx_bytes5,
+                "tx": ap.tx_bytes5,
+            }
+        )
+    return {
+        "clients": {
+            "total": ap.client_count,
+            "wifi": ap.client_count,
+            "wifi24": ap.client_count24,
+            "wifi5": ap.client_count5,
+        },
+        "uptime": ap.uptime,
+        "node_id": ap.mac.replace(":", ""),
+        "loadavg": ap.load_avg,
+        "memory": {
+            "total": int(ap.mem_total / 1024),
+            "free": int((ap.mem_total - ap.mem_used) / 1024),
+            "buffers": int(ap.mem_buffer / 1024),
+        },
+        "traffic": {
+            "tx": {"bytes": int(ap.tx_bytes)},
+            "rx": {"bytes": int(ap.rx_bytes)},
+        },
+        "gateway": ap.gateway,
+        "gateway6": ap.gateway6,
+        "gateway_nexthop": ap.gateway_nexthop,
+        "wireless": wireless,
+    }
+
+
+def neighbours_dict(ap):
+    """This function returns the neighbours section of an AP, like NeighboursInfo.to_dict()."""
+    neighbours = {}
+    for neighbour_mac in ap.neighbour_macs:
+        if neighbour_mac is not None:
+            neighbours[neighbour_mac] = {"tq": 255, "lastseen": 0.45}
+    return {
+        "node_id": ap.mac.replace(":", ""),
+        "batadv": {ap.mac: {"neighbours": neighbours}},
+    }
+
+
+SECTIONS = {
+    "nodeinfo": nodeinfo_dict,
+    "statistics": statistics_dict,
+    "neighbours": neighbours_dict,
+}
+
+
+def dumps(obj):
+    """This function encodes a section dict exactly like json.dumps()."""
+    return bytes(json.dumps(obj), "UTF-8")
+
+
+def get_dumps(use_orjson):
+    """This function returns the JSON encoder to use.
+
+    orjson is considerably faster but produces compact JSON, so it is only used
+    when requested and installed."""
+    if not use_orjson:
+        return dumps
+    if orjson is None:
+        logger.warning("orjson is not installed, falling back to json")
+        return dumps
+    return orjson.dumps
+
+
+def separators(dumps):
+    """This function returns the item and the key separator of a JSON encoder."""
+    sample = dumps({"a": 0, "b": 0})
+    item_separator = sample.split(b"0")[1].split(b'"b"')[0]
+    key_separator = sample.split(b'"a"')[1].split(b"0")[0]
+    return item_separator, key_separator
+
+
+def join_sections(parts, item_separator=b", ", key_separator=b": "):
+    """This function returns the JSON of a node from its already encoded sections.
+
+    It produces the same bytes as encoding a dict of the decoded sections with
+    the encoder the separators were taken from.
+    Arguments:
+        parts: A list of the section names and their encoded JSON."""
+    return (
+        b"{"
+        + item_separator.join(
+            b'"' + name.encode() + b'"' + key_separator + payload
+            for name, payload in parts
+        )
+        + b"}"
+    )
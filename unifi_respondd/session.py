@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+import warnings
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InsecureRequestWarning
+
+from unifi_respondd import logger, metrics
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# bytes read from a response at a time, the deadline is checked in between
+READ_SIZE = 64 * 1024
+
+
+class APIError(Exception):
+    """The controller rejected a request."""
+
+
+class _DeadlineReader:
+    """This class reads a response body, but raises a timeout once the
+    deadline passed, the timeout of requests only bounds a single read."""
+
+    def __init__(self, raw, deadline: Optional[float]):
+        self._raw = raw
+        self._deadline = deadline
+
+    def read(self, size: int = -1) -> bytes:
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise requests.Timeout("Response not complete within the timeout")
+        return self._raw.read(size)
+
+
+class ControllerSession:
+    """This class keeps one authenticated session to a UniFi controller.
+
+    It speaks the same API as pyunifi, but logs in only once and keeps the
+    keep-alive connections of one requests session across refresh cycles.
+    Sites are addressed per request instead of by switching the session, so
+    one session can serve many sites concurrently. The session logs in again
+    only when the controller answers with 401."""
+
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        port: int = 8443,
+        version: str = "v5",
+        ssl_verify: bool = True,
+        pool_size: int = 10,
+        timeout: Optional[float] = None,
+    ):
+        self.version = version
+        self._username = username
+        self._password = password
+        self._timeout = timeout
+        base = host if "://" in host else "https://" + host
+        if version == "unifiOS":
+            self.url = base + "/proxy/network/"
+            self.auth_url = self.url + "api/login"
+        elif version == "UDMP-unifiOS":
+            self.url = base + "/proxy/network/"
+            self.auth_url = base + "/api/auth/login"
+        elif version[:1] == "v" and float(version[1:]) >= 4:
+            self.url = base + ":" + str(port) + "/"
+            self.auth_url = self.url + "api/login"
+        else:
+            raise APIError("%s controllers no longer supported" % version)
+
+        if ssl_verify is False:
+            warnings.simplefilter("default", category=InsecureRequestWarning)
+        self.session = requests.Session()
+        self.session.verify = ssl_verify
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.logins = 0
+        self._headers: Dict[str, str] = {}
+        self._login_lock = threading.Lock()
+        self._login_generation = 0
+
+    def _update_headers(self, response: requests.Response):
+        token = response.headers.get("X-CSRF-Token")
+        if token:
+            self._headers = {"X-CSRF-Token": token}
+
+    def login(self):
+        """Authenticates the session.
+        Raises:
+            APIError: If the controller rejected the credentials."""
+        logger.debug("Logging in to %s as %s" % (self.url, self._username))
+        with metrics.STAGE_SECONDS.time(stage="login"):
+            response = self.session.post(
+                self.auth_url,
+                json={"username": self._username, "password": self._password},
+                headers=self._headers,
+                timeout=self._timeout,
+            )
+        self._update_headers(response)
+        if response.status_code != 200:
+            raise APIError("Login failed - status code: %i" % response.status_code)
+        self.logins += 1
+        self._login_generation += 1
+
+    def _relogin(self, generation: int):
+        """Logs in again, unless another thread did so since generation."""
+        with self._login_lock:
+            if self._login_generation == generation:
+                self.login()
+
+    def request(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs):
+        """Sends a GET request, logging in first or again if required.
+        Returns:
+            The requests response."""
+        generation = self._login_generation
+        if generation == 0:
+            self._relogin(generation)
+            generation = self._login_generation
+        response = self.session.get(
+            url, params=params, headers=self._headers, timeout=self._timeout, **kwargs
+        )
+        if response.status_code == 401:
+            response.close()
+            self._relogin(generation)
+            response = self.session.get(
+                url,
+                params=params,
+                headers=self._headers,
+                timeout=self._timeout,
+                **kwargs,
+            )
+        self._update_headers(response)
+        if response.status_code != 200:
+            raise APIError("%s failed - status code: %i" % (url, response.status_code))
+        return response
+
+    @staticmethod
+    def _jsondec(data):
+        obj = json.loads(data)
+        if "meta" in obj:
+            if obj["meta"]["rc"] != "ok":
+                raise APIError(obj["meta"]["msg"])
+        if "data" in obj:
+            return obj["data"]
+        return obj
+
+    def _deadline(self) -> Optional[float]:
+        """Returns the time a request started now has to be read by."""
+        if self._timeout is None:
+            return None
+        return time.monotonic() + self._timeout
+
+    def _read(self, url: str, params: Optional[Dict[str, Any]] = None):
+        """Returns the decoded response, the whole request may take at most
+        the timeout of the session."""
+        deadline = self._deadline()
+        response = self.request(url, params, stream=True)
+        try:
+            response.raw.decode_content = True
+            raw = _DeadlineReader(response.raw, deadline)
+            data = b"".join(iter(lambda: raw.read(READ_SIZE), b""))
+        finally:
+            response.close()
+        return self._jsondec(data)
+
+    @staticmethod
+    def _stream_items(
+        response,
+        reduce: Callable[[Dict[str, Any]], Any],
+        deadline: Optional[float] = None,
+    ):
+        """Parses the data array of a response incrementally with ijson and
+        reduces every document as soon as it is complete. Reading the
+        response fails with requests.Timeout after deadline."""
+        response.raw.decode_content = True
+        meta = {}
+        items = []
+        builder = None
+        raw = _DeadlineReader(response.raw, deadline)
+        for prefix, event, value in ijson.parse(raw, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == "data.item" and event == "end_map":
+                    items.append(reduce(builder.value))
+                    builder = None
+            elif prefix == "data.item" and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif prefix in ("meta.rc", "meta.msg"):
+                meta[prefix] = value
+        if meta.get("meta.rc", "ok") != "ok":
+            raise APIError(meta.get("meta.msg"))
+        return items
+
+    def _read_items(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        reduce: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ):
+        """Returns the data array of a response, each document passed through reduce.
+
+        With ijson installed the response is parsed while it is streamed, so
+        only the reduced documents are kept in memory. Otherwise it is parsed
+        as a whole. Either way the whole request may take at most the timeout
+        of the session."""
+        if reduce is None:
+            return self._read(url, params)
+        if ijson is None:
+            return [reduce(item) for item in self._read(url, params)]
+        deadline = self._deadline()
+        response = self.request(url, params, stream=True)
+        try:
+            return self._stream_items(response, reduce, deadline)
+        finally:
+            response.close()
+
+    def api_url(self, site_id: str) -> str:
+        """Returns the API base URL of a site."""
+        return self.url + "api/s/" + site_id + "/"
+
+    def get_sites(self) -> List[Dict[str, Any]]:
+        """Returns a list of all sites."""
+        return self._read(self.url + "api/self/sites")
+
+    def get_aps(self, site_id: str, reduce=None) -> List[Dict[str, Any]]:
+        """Returns a list of all devices of a site, passed through reduce."""
+        return self._read_items(
+            self.api_url(site_id) + "stat/device", {"_depth": 2, "test": 0}, reduce
+        )
+
+    def get_clients(self, site_id: str, reduce=None) -> List[Dict[str, Any]]:
+        """Returns a list of all active clients of a site, passed through reduce."""
+        return self._read_items(self.api_url(site_id) + "stat/sta", reduce=reduce)
+
+    def site(self, site_id: str) -> "SiteSession":
+        """Returns a view of the session bound to one site."""
+        return SiteSession(self, site_id)
+
+    def close(self):
+        """Closes all pooled connections."""
+        self.session.close()
+
+
+class SiteSession:
+    """This class binds a ControllerSession to one site, it offers the
+    pyunifi get_aps() and get_clients() methods."""
+
+    def __init__(self, controller: ControllerSession, site_id: str):
+        self.controller = controller
+        self.site_id = site_id
+
+    def get_aps(self, reduce=None) -> List[Dict[str, Any]]:
+        return self.controller.get_aps(self.site_id, reduce)
+
+    def get_clients(self, reduce=None) -> List[Dict[str, Any]]:
+        return self.controller.get_clients(self.site_id, reduce)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import multiprocessing
+import time
+from typing import Dict, List, Optional, Tuple
+
+from unifi_respondd import logger, metrics
+
+SECTIONS = ("nodeinfo", "statistics", "neighbours")
+# the payloads serialized by the workers: every single request and the multi
+# request for all sections, which is what collectors usually send
+PRECOMPUTED = [((section,), False) for section in SECTIONS] + [(SECTIONS, True)]
+
+# the ResponseCache and the snapshot number of a worker process
+cache = None
+version = 0
+
+
+@dataclasses.dataclass(slots=True)
+class NodeRecord:
+    """This class contains the serialized payloads of an AP, as a worker produced them.
+    Attributes:
+        mac: The MAC address of the AP.
+        domain_code: The domain of the AP, for the filters of the listeners.
+        site: The site of the AP, for the filters of the listeners.
+        payloads: The payload per requested sections and multi flag, see PRECOMPUTED."""
+
+    mac: str
+    domain_code: str
+    site: str
+    payloads: Dict[Tuple[Tuple[str, ...], bool], bytes]
+
+
+@dataclasses.dataclass(slots=True)
+class NodeRecords:
+    """This class contains the NodeRecords of all APs.
+
+    It has the shape of unifi_client.Accesspoints, so it is kept in snapshots
+    and filtered by listeners the same way.
+    Attributes:
+        accesspoints: A list of NodeRecord objects."""
+
+    accesspoints: List[NodeRecord]
+
+
+def encode(aps, dumps) -> List[NodeRecord]:
+    """This function returns the NodeRecords of the APs of a collection.
+
+    The payloads are produced by a ResponseCache that is kept across
+    collections, so APs that did not change are not serialized again."""
+    global cache, version
+    from unifi_respondd.refresher import Snapshot
+    from unifi_respondd.respondd_client import ResponseCache
+
+    if cache is None:
+        cache = ResponseCache(dumps=dumps)
+    version += 1
+    snapshot = Snapshot(accesspoints=aps, version=version, created=time.monotonic())
+    columns = [
+        cache.payloads(snapshot, sections, multi) for sections, multi in PRECOMPUTED
+    ]
+    return [
+        NodeRecord(
+            mac=ap.mac,
+            domain_code=ap.domain_code,
+            site=ap.site,
+            payloads=dict(zip(PRECOMPUTED, payloads)),
+        )
+        for ap, *payloads in zip(aps.accesspoints, *columns)
+    ]
+
+
+def collect_shard(index, count):
+    """This function collects the sites of a shard, it runs in the worker process.
+    Returns:
+        The NodeRecords of the APs of the shard, or None if the collection failed."""
+    from unifi_respondd import config_manager, serializer, unifi_client
+
+    aps = unifi_client.get_infos(shard=(index, count))
+    if aps is None:
+        return None
+    return encode(aps, serializer.get_dumps(config_manager.get_config().use_orjson))
+
+
+def run_worker(conn, index, count, collect):
+    """This function answers the collection requests of a ShardPool until it is closed."""
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        try:
+            result = collect(index, count)
+        except Exception as ex:
+            logger.error("Error: %s" % (ex))
+            result = None
+        conn.send(result)
+
+
+class ShardPool:
+    """This class collects the sites in worker processes.
+
+    Every worker collects its share of the sites of all controllers, see
+    unifi_client.in_shard(), and returns the serialized payloads of its APs,
+    so decoding the controller documents, building the APs and serializing
+    them runs in parallel instead of on one interpreter. The workers are
+    started on the first collection and kept, so their sessions and caches
+    are reused. A worker that fails, dies or does not answer within timeout
+    seconds keeps the APs of its previous collection and is restarted.
+    Attributes:
+        count: The number of worker processes.
+        timeout: Seconds a collection of a worker may take.
+        restarts: The number of workers stopped because they died or did not answer."""
+
+    def __init__(self, count, timeout, collect=collect_shard):
+        self.count = count
+        self.timeout = timeout
+        self.restarts = 0
+        self._collect = collect
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = [None] * count
+        self._records = [None] * count
+
+    def _start(self, index):
+        conn, child = self._context.Pipe()
+        process = self._context.Process(
+            target=run_worker,
+            args=(child, index, self.count, self._collect),
+            name="shard-%d" % index,
+            daemon=True,
+        )
+        process.start()
+        child.close()
+        self._workers[index] = (process, conn)
+
+    def _stop(self, index):
+        process, conn = self._workers[index]
+        self._workers[index] = None
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+        conn.close()
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    def _request(self, index):
+        worker = self._workers[index]
+        if worker is not None and not worker[0].is_alive():
+            logger.error("Shard %d exited with %s" % (index, worker[0].exitcode))
+            self._stop(index)
+            self.restarts += 1
+        if self._workers[index] is None:
+            self._start(index)
+        self._workers[index][1].send(True)
+
+    def _receive(self, index, deadline):
+        _, conn = self._workers[index]
+        if not conn.poll(max(0.0, deadline - time.monotonic())):
+            raise TimeoutError("no answer within %.0fs" % self.timeout)
+        return conn.recv()
+
+    def collect(self) -> Optional[NodeRecords]:
+        """Collects all shards in parallel and merges their NodeRecords.
+        Returns:
+            The NodeRecords of all APs, an AP reported by more than one shard is
+            taken from the first. None if no shard could be collected."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        failed = set()
+        for index in range(self.count):
+            try:
+                self._request(index)
+            except OSError as ex:
+                logger.error("Error collecting shard %d: %s" % (index, ex))
+                failed.add(index)
+        results = []
+        for index in range(self.count):
+            result = None
+            if index not in failed:
+                try:
+                    result = self._receive(index, deadline)
+                except (EOFError, OSError) as ex:
+                    logger.error("Error collecting shard %d: %s" % (index, ex))
+                    self._stop(index)
+                    self.restarts += 1
+                else:
+                    metrics.SHARD_SECONDS.observe(
+                        time.monotonic() - started, shard=str(index)
+                    )
+            metrics.SHARD_COLLECTIONS.inc(
+                shard=str(index), result="failed" if result is None else "ok"
+            )
+            if result is not None:
+                self._records[index] = result
+            elif self._records[index] is not None:
+                logger.warning("Keeping previous data of shard %d" % index)
+            results.append(result)
+        if all(result is None for result in results):
+            return None
+        records = []
+        seen = set()
+        for shard_records in self._records:
+            for record in shard_records or []:
+                if record.mac not in seen:
+                    seen.add(record.mac)
+                    records.append(record)
+        return NodeRecords(accesspoints=records)
+
+    def close(self):
+        """Stops the worker processes."""
+        for index in range(self.count):
+            if self._workers[index] is not None:
+                self._stop(index)
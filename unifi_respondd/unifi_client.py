@@ -2,22 +2,72 @@
 
 import dataclasses
 import re
+import sys
 import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List
 
 from geopy.geocoders import Nominatim
 from geopy.point import Point
-from pyunifi.controller import Controller
 from requests import get as rget
 
-from unifi_respondd import config, logger
+from unifi_respondd import config, config_manager, logger, metrics
+from unifi_respondd.geocache import GeoCache
+from unifi_respondd.nodelist import Nodelist
+from unifi_respondd.session import ControllerSession
 
-ffnodes = None
+# the fields of the controller documents that are read, nested dicts select
+# the fields of nested objects or of the objects in nested lists
+AP_FIELDS = {
+    "name": None,
+    "mac": None,
+    "state": None,
+    "type": None,
+    "model": None,
+    "version": None,
+    "uptime": None,
+    "snmp_location": None,
+    "snmp_contact": None,
+    "uplink": {"ap_mac": None},
+    "lldp_table": {"is_wired": None, "chassis_id": None},
+    "sys_stats": {
+        "loadavg_1": None,
+        "mem_used": None,
+        "mem_buffer": None,
+        "mem_total": None,
+    },
+    "vap_table": {
+        "essid": None,
+        "channel": None,
+        "rx_bytes": None,
+        "tx_bytes": None,
+        "num_sta": None,
+    },
+}
+CLIENT_FIELDS = {"essid": None, "ap_mac": None, "channel": None}
+# returned by geocode_address() if the geocoder could not be reached, unlike
+# None for an unknown address this is not cached
+GEOCODE_FAILED = object()
 
+nodelist = None
+matcher = None
+geocache = None
+geolocator = None
+# set once a lookup failed, the geocoder is not asked again until the next collection
+geocoder_failed = False
+site_accesspoints = {}
+site_inventory = {}
+controller_sites = {}
+controller_sessions = {}
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class Accesspoint:
     """This class contains the information of an AP.
+
+    It uses __slots__ instead of a per-instance __dict__, since two snapshots
+    of the whole fleet are alive while a new one is collected.
     Attributes:
         name: The name of the AP (alias in the unifi controller).
         mac: The MAC address of the AP.
@@ -36,7 +86,8 @@ class Accesspoint:
         mem_total: The total memory of the AP.
         mem_buffer: The buffer memory of the AP.
         tx_bytes: The transmitted bytes of the AP.
-        rx_bytes: The received bytes of the AP."""
+        rx_bytes: The received bytes of the AP.
+        site: The site of the AP (its description in the unifi controller)."""
 
     name: str
     mac: str
@@ -67,9 +118,10 @@ class Accesspoint:
     gateway_nexthop: str
     neighbour_macs: List[str]
     domain_code: str
+    site: str = ""
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Accesspoints:
     """This class contains the information of all APs.
     Attributes:
@@ -78,22 +130,103 @@ class Accesspoints:
     accesspoints: List[Accesspoint]
 
 
+class SsidMatcher:
+    """This class matches SSIDs against the configured regex.
+
+    The regex is compiled once and the result is memoized per distinct SSID,
+    since a site usually only broadcasts a handful of them."""
+
+    def __init__(self, ssid_regex):
+        self.ssid_regex = ssid_regex
+        self._pattern = re.compile(ssid_regex, re.IGNORECASE)
+        self._matches = {}
+
+    def __call__(self, essid):
+        match = self._matches.get(essid)
+        if match is None:
+            match = self._pattern.search(essid) is not None
+            self._matches[essid] = match
+        return match
+
+
+def intern_string(value):
+    """This function interns a string, so that a value shared by many APs is only stored once."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def project(doc, fields):
+    """This function returns a copy of a JSON document with only the given fields."""
+    if isinstance(doc, list):
+        return [project(item, fields) for item in doc]
+    if not isinstance(doc, dict):
+        return doc
+    result = {}
+    for key, nested in fields.items():
+        if key in doc:
+            value = doc[key]
+            result[key] = value if nested is None else project(value, nested)
+    return result
+
+
+def reduce_ap(ap):
+    """This function reduces a device document to the fields an Accesspoint is built from."""
+    return project(ap, AP_FIELDS)
+
+
+def reduce_client(client):
+    """This function reduces a client document to the fields clients are counted by."""
+    return project(client, CLIENT_FIELDS)
+
+
+def get_client_counts_by_ap(clients, matcher):
+    """This function walks the client list once and returns a dict from AP MAC to the number of total clients, 2,4Ghz clients and 5Ghz clients."""
+    bands = {}
+    for client in clients:
+        if matcher(client.get("essid", "")):
+            ap_bands = bands.setdefault(client.get("ap_mac", "No mac"), [0, 0])
+            if client.get("channel", 0) > 14:
+                ap_bands[1] += 1
+            else:
+                ap_bands[0] += 1
+    return {
+        ap_mac: (count24 + count5, count24, count5)
+        for ap_mac, (count24, count5) in bands.items()
+    }
+
+
+def get_client_counts_from_vap_table(ssids, matcher):
+    """This function returns the number of total clients, 2,4Ghz clients and 5Ghz clients of an AP from the num_sta of its vap_table."""
+    count24 = 0
+    count5 = 0
+    for ssid in ssids:
+        if matcher(ssid.get("essid", "")):
+            if ssid.get("channel", 0) > 14:
+                count5 += ssid.get("num_sta", 0)
+            else:
+                count24 += ssid.get("num_sta", 0)
+    return count24 + count5, count24, count5
+
+
+def get_matcher(cfg):
+    """This function returns the SsidMatcher of ssid_regex, it is kept until the regex changes."""
+    global matcher
+    if matcher is None or matcher.ssid_regex != cfg.ssid_regex:
+        matcher = SsidMatcher(cfg.ssid_regex)
+    return matcher
+
+
 def get_client_count_for_ap(ap_mac, clients, cfg):
     """This function returns the number total clients, 2,4Ghz clients and 5Ghz clients connected to an AP."""
-    client5_count = 0
-    client24_count = 0
-    for client in clients:
-        if re.search(cfg.ssid_regex, client.get("essid", ""), re.IGNORECASE):
-            if client.get("ap_mac", "No mac") == ap_mac:
-                if client.get("channel", 0) > 14:
-                    client5_count += 1
-                else:
-                    client24_count += 1
-    return client24_count + client5_count, client24_count, client5_count
+    counts = get_client_counts_by_ap(clients, SsidMatcher(cfg.ssid_regex))
+    return counts.get(ap_mac, (0, 0, 0))
 
 
-def get_ap_channel_usage(ssids, cfg):
+def get_ap_channel_usage(ssids, cfg, matcher=None):
     """This function returns the channels used for the Freifunk SSIDs"""
+    if matcher is None:
+        matcher = SsidMatcher(cfg.ssid_regex)
     channel5 = None
     rx_bytes5 = None
     tx_bytes5 = None
@@ -101,7 +234,7 @@ def get_ap_channel_usage(ssids, cfg):
     rx_bytes24 = None
     tx_bytes24 = None
     for ssid in ssids:
-        if re.search(cfg.ssid_regex, ssid.get("essid", ""), re.IGNORECASE):
+        if matcher(ssid.get("essid", "")):
             channel = ssid.get("channel", 0)
             rx_bytes = ssid.get("rx_bytes", 0)
             tx_bytes = ssid.get("tx_bytes", 0)
@@ -117,18 +250,94 @@ def get_ap_channel_usage(ssids, cfg):
     return channel5, rx_bytes5, tx_bytes5, channel24, rx_bytes24, tx_bytes24
 
 
-def get_location_by_address(address, app):
-    """This function returns latitude and longitude of a given address."""
+def parse_location(address):
+    """This function returns latitude and longitude if the address is a coordinate pair, otherwise None."""
     try:
         point = Point().from_string(address)
         return point.latitude, point.longitude
     except Exception:
+        return None
+
+
+def geocode_address(address, app, retries=3):
+    """This function resolves an address with the geocoder.
+
+    Nominatim allows one request per second, failed requests are retried with
+    an exponential backoff. Returns None if the geocoder knows no such address
+    and GEOCODE_FAILED if it could not be asked within retries attempts."""
+    for attempt in range(retries):
+        time.sleep(2**attempt)
         try:
-            time.sleep(1)
             geocode = app.geocode(address)
-            return geocode.raw["lat"], geocode.raw["lon"]
-        except Exception:
-            return get_location_by_address(address, app)
+        except Exception as ex:
+            logger.warning("Geocoding %s failed: %s" % (address, ex))
+            continue
+        if geocode is None:
+            return None
+        return geocode.raw["lat"], geocode.raw["lon"]
+    return GEOCODE_FAILED
+
+
+def get_location_by_address(address, app, retries=3):
+    """This function returns latitude and longitude of a given address."""
+    location = parse_location(address)
+    if location is None:
+        location = geocode_address(address, app, retries)
+    if location is GEOCODE_FAILED:
+        return None
+    return location
+
+
+def get_geocache(cfg):
+    """This function returns the geocoding cache, it is opened on first use
+    and reopened if geocache_file changed."""
+    global geocache
+    path = cfg.geocache_file or config.default_geocache_file()
+    if geocache is None or geocache.path != path:
+        if geocache is not None:
+            geocache.close()
+        geocache = GeoCache(
+            path,
+            ttl=cfg.geocache_ttl,
+            negative_ttl=cfg.geocache_negative_ttl,
+            max_entries=cfg.geocache_max_entries,
+        )
+    return geocache
+
+
+def get_geolocator():
+    """This function returns the geocoder, it is created on first use since that sets up a TLS context."""
+    global geolocator
+    if geolocator is None:
+        geolocator = Nominatim(user_agent="ffmuc_respondd")
+    return geolocator
+
+
+def get_location_cached(address, app, cfg):
+    """This function returns latitude and longitude of a given address, geocoding results are cached on disk.
+
+    Once a lookup failed, the geocoder is considered unreachable for the rest
+    of the collection, so addresses that are not cached resolve to None
+    instead of waiting for the retries of every AP again."""
+    global geocoder_failed
+    location = parse_location(address)
+    if location is not None:
+        return location
+    cache = get_geocache(cfg)
+    hit, location = cache.get(address)
+    if not hit:
+        if geocoder_failed:
+            return None
+        with metrics.STAGE_SECONDS.time(stage="geocode"), cache.throttle():
+            location = geocode_address(address, app, cfg.geocode_retries)
+        if location is GEOCODE_FAILED:
+            # not cached, the address is looked up again on the next collection
+            geocoder_failed = True
+            return None
+        if location is not None:
+            location = float(location[0]), float(location[1])
+        cache.put(address, location)
+    return location
 
 
 def scrape(url):
@@ -139,146 +348,444 @@ def scrape(url):
         logger.error("Error: %s" % (ex))
 
 
-def get_infos():
-    """This function gathers all the information and returns a list of Accesspoint objects."""
-    cfg = config.Config.from_dict(config.load_config())
-    ffnodes = scrape(cfg.nodelist)
-    try:
-        c = Controller(
-            host=cfg.controller_url,
-            username=cfg.username,
-            password=cfg.password,
-            port=cfg.controller_port,
-            version=cfg.version,
-            ssl_verify=cfg.ssl_verify,
+def get_nodelist(cfg):
+    """This function returns the cached nodelist, it is refreshed once it is older than nodelist_max_age."""
+    global nodelist
+    if nodelist is None or nodelist.url != cfg.nodelist:
+        nodelist = Nodelist(cfg.nodelist, cfg.nodelist_max_age)
+    nodelist.refresh()
+    return nodelist
+
+
+def get_offloader(site_desc, cfg, nodes):
+    """This function returns the offloader MAC, the offloader node id and the offloader node of a site."""
+    offloader_mac = cfg.offloader_mac.get(site_desc, None)
+    offloader = nodes.get(offloader_mac)
+    if offloader is None:
+        return offloader_mac, None, {}
+    return offloader_mac, offloader_mac.replace(":", ""), offloader
+
+
+def session_key(cfg, controller):
+    """This function returns what a session of a controller is created from."""
+    return (
+        controller.controller_url,
+        controller.controller_port,
+        controller.username,
+        controller.password,
+        controller.version,
+        controller.ssl_verify,
+        cfg.site_workers,
+        cfg.site_timeout,
+    )
+
+
+def get_controller_session(cfg, controller):
+    """This function returns the session of a controller, sessions are kept across refresh cycles."""
+    key = session_key(cfg, controller)
+    session = controller_sessions.get(key)
+    if session is None:
+        session = ControllerSession(
+            host=controller.controller_url,
+            username=controller.username,
+            password=controller.password,
+            port=controller.controller_port,
+            version=controller.version,
+            ssl_verify=controller.ssl_verify,
+            pool_size=2 * cfg.site_workers + 1,
+            timeout=cfg.site_timeout,
         )
-    except Exception as ex:
-        logger.error("Error: %s" % (ex))
-        return
-    geolookup = Nominatim(user_agent="ffmuc_respondd")
-    aps = Accesspoints(accesspoints=[])
-    for site in c.get_sites():
-        if cfg.version == "UDMP-unifiOS":
-            c = Controller(
-                host=cfg.controller_url,
-                username=cfg.username,
-                password=cfg.password,
-                port=cfg.controller_port,
-                version=cfg.version,
-                site_id=site["name"],
-                ssl_verify=cfg.ssl_verify,
-            )
-        else:
+        controller_sessions[key] = session
+    return session
+
+
+def fetch_sites(c, sites, cfg):
+    """This function fetches the devices and clients of all sites.
+
+    Up to site_workers sites are fetched concurrently, the device and client
+    endpoints of a site are requested in parallel. Every document is reduced
+    to the fields that are read while it is parsed. The clients are only
+    fetched if client_count_source is "clients", otherwise they are None.
+    Returns a dict from site name to the devices and clients of the site,
+    sites that failed or took longer than site_timeout are missing."""
+    fetch_clients = cfg.client_count_source == "clients"
+    results = {}
+    started = {}
+    endpoints = ThreadPoolExecutor(
+        max_workers=2 * cfg.site_workers, thread_name_prefix="endpoint"
+    )
+
+    def get_aps(site_c):
+        with metrics.STAGE_SECONDS.time(stage="aps"):
+            return site_c.get_aps(reduce_ap)
+
+    def get_clients(site_c):
+        with metrics.STAGE_SECONDS.time(stage="clients"):
+            return site_c.get_clients(reduce_client)
+
+    def fetch(site):
+        started[site["name"]] = time.monotonic()
+        site_c = c.site(site["name"])
+        if not fetch_clients:
+            return get_aps(site_c), None
+        aps = endpoints.submit(get_aps, site_c)
+        clients = endpoints.submit(get_clients, site_c)
+        return aps.result(), clients.result()
+
+    pool = ThreadPoolExecutor(max_workers=cfg.site_workers, thread_name_prefix="site")
+    futures = {pool.submit(fetch, site): site for site in sites}
+    pending = set(futures)
+    try:
+        while pending:
+            deadlines = [
+                started[futures[future]["name"]] + cfg.site_timeout
+                for future in pending
+                if futures[future]["name"] in started
+            ]
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else 1.0
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                site = futures[future]
+                try:
+                    results[site["name"]] = future.result()
+                except Exception as ex:
+                    logger.error("Error collecting site %s: %s" % (site["desc"], ex))
+            now = time.monotonic()
+            for future in list(pending):
+                site = futures[future]
+                if now - started.get(site["name"], now) > cfg.site_timeout:
+                    logger.error("Timeout collecting site %s" % site["desc"])
+                    pending.discard(future)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        endpoints.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def is_served_ap(ap, matcher):
+    """This function returns True if a device is an online AP broadcasting a matching SSID."""
+    if (
+        ap.get("name", None) is None
+        or ap.get("state", 0) == 0
+        or ap.get("type", "na") != "uap"
+    ):
+        return False
+    ssids = ap.get("vap_table", None)
+    if ssids is None:
+        return False
+    return any(matcher(ssid.get("essid", "")) for ssid in ssids)
+
+
+def get_ap_stats(ap, client_counts, cfg, matcher):
+    """This function returns the fields of an Accesspoint that change from poll to poll.
+
+    Clients are counted from client_counts, or from the vap_table of the AP
+    if client_counts is None."""
+    ssids = ap.get("vap_table", None)
+    tx = 0
+    rx = 0
+    for ssid in ssids:
+        if matcher(ssid.get("essid", "")):
+            tx = tx + ssid.get("tx_bytes", 0)
+            rx = rx + ssid.get("rx_bytes", 0)
+    if client_counts is None:
+        (
+            client_count,
+            client_count24,
+            client_count5,
+        ) = get_client_counts_from_vap_table(ssids, matcher)
+    else:
+        (
+            client_count,
+            client_count24,
+            client_count5,
+        ) = client_counts.get(ap.get("mac", None), (0, 0, 0))
+
+    (
+        channel5,
+        rx_bytes5,
+        tx_bytes5,
+        channel24,
+        rx_bytes24,
+        tx_bytes24,
+    ) = get_ap_channel_usage(ssids, cfg, matcher)
+
+    sys_stats = ap.get("sys_stats", {})
+    return dict(
+        client_count=client_count,
+        client_count24=client_count24,
+        client_count5=client_count5,
+        channel5=channel5,
+        rx_bytes5=rx_bytes5,
+        tx_bytes5=tx_bytes5,
+        channel24=channel24,
+        rx_bytes24=rx_bytes24,
+        tx_bytes24=tx_bytes24,
+        uptime=ap.get("uptime", None),
+        load_avg=float(sys_stats.get("loadavg_1", 0.0)),
+        mem_used=sys_stats.get("mem_used", 0),
+        mem_buffer=sys_stats.get("mem_buffer", 0),
+        mem_total=sys_stats.get("mem_total", 0),
+        tx_bytes=tx,
+        rx_bytes=rx,
+    )
+
+
+def get_site_accesspoints(site, aps_for_site, clients, cfg, matcher, nodes, geolookup):
+    """This function returns the Accesspoint objects of a site.
+
+    This is the full refresh: besides the stats it resolves the location,
+    the offloader and the neighbours of every AP. Clients are counted from
+    the client list, or from the vap_table of each AP if clients is None."""
+    client_counts = None
+    if clients is not None:
+        client_counts = get_client_counts_by_ap(clients, matcher)
+    offloader_mac, offloader_id, offloader = get_offloader(site["desc"], cfg, nodes)
+    offloader_mac = intern_string(offloader_mac)
+    offloader_id = intern_string(offloader_id)
+    gateway = intern_string(offloader.get("gateway", None))
+    gateway6 = intern_string(offloader.get("gateway6", None))
+    domain_code = intern_string(offloader.get("domain", cfg.fallback_domain))
+    site_aps = []
+    for ap in aps_for_site:
+        if not is_served_ap(ap, matcher):
+            continue
+        lat, lon = 0, 0
+        neighbour_macs = []
+        if ap.get("snmp_location", None) is not None:
             try:
-                c.switch_site(site["desc"])
+                location = get_location_cached(ap["snmp_location"], geolookup, cfg)
+                if location is not None:
+                    lat, lon = location
             except Exception as ex:
                 logger.error("Error: %s" % (ex))
-                continue
+        neighbour_macs.append(offloader_mac)
+        uplink = ap.get("uplink", None)
+        if uplink is not None and uplink.get("ap_mac", None) is not None:
+            neighbour_macs.append(intern_string(uplink.get("ap_mac")))
+        lldp_table = ap.get("lldp_table", None)
+        if lldp_table is not None:
+            for lldp_entry in lldp_table:
+                if not lldp_entry.get("is_wired", True):
+                    neighbour_macs.append(intern_string(lldp_entry.get("chassis_id")))
+        site_aps.append(
+            Accesspoint(
+                name=ap.get("name", None),
+                mac=ap.get("mac", None),
+                snmp_location=intern_string(ap.get("snmp_location", None)),
+                latitude=float(lat),
+                longitude=float(lon),
+                model=intern_string(ap.get("model", None)),
+                firmware=intern_string(ap.get("version", None)),
+                contact=intern_string(ap.get("snmp_contact", None)),
+                gateway=gateway,
+                gateway6=gateway6,
+                gateway_nexthop=offloader_id,
+                neighbour_macs=neighbour_macs,
+                domain_code=domain_code,
+                site=intern_string(site["desc"]),
+                **get_ap_stats(ap, client_counts, cfg, matcher),
+            )
+        )
+    return site_aps
+
+
+def update_site_accesspoints(previous, aps_for_site, clients, cfg, matcher):
+    """This function updates the stats of the Accesspoint objects of a site,
+    and keeps the fields of the last full refresh.
+
+    Returns None if APs appeared or disappeared, the site then needs a full
+    refresh."""
+    client_counts = None
+    if clients is not None:
+        client_counts = get_client_counts_by_ap(clients, matcher)
+    devices = {
+        ap.get("mac", None): ap for ap in aps_for_site if is_served_ap(ap, matcher)
+    }
+    if len(devices) != len(previous) or any(ap.mac not in devices for ap in previous):
+        return None
+    return [
+        dataclasses.replace(
+            ap, **get_ap_stats(devices[ap.mac], client_counts, cfg, matcher)
+        )
+        for ap in previous
+    ]
+
+
+def is_inventory_due(site_name, cfg):
+    """This function returns True if a site needs a full refresh."""
+    if site_name not in site_accesspoints or cfg.inventory_interval <= 0:
+        return True
+    refreshed = site_inventory.get(site_name)
+    return refreshed is None or time.monotonic() - refreshed >= cfg.inventory_interval
 
-        aps_for_site = c.get_aps()
-        clients = c.get_clients()
-        for ap in aps_for_site:
-            if (
-                ap.get("name", None) is not None
-                and ap.get("state", 0) != 0
-                and ap.get("type", "na") == "uap"
-            ):
-                ssids = ap.get("vap_table", None)
-                containsSSID = False
-                tx = 0
-                rx = 0
-                if ssids is not None:
-                    for ssid in ssids:
-                        if re.search(
-                            cfg.ssid_regex, ssid.get("essid", ""), re.IGNORECASE
-                        ):
-                            containsSSID = True
-                            tx = tx + ssid.get("tx_bytes", 0)
-                            rx = rx + ssid.get("rx_bytes", 0)
-                if containsSSID:
-                    (
-                        client_count,
-                        client_count24,
-                        client_count5,
-                    ) = get_client_count_for_ap(ap.get("mac", None), clients, cfg)
-
-                    (
-                        channel5,
-                        rx_bytes5,
-                        tx_bytes5,
-                        channel24,
-                        rx_bytes24,
-                        tx_bytes24,
-                    ) = get_ap_channel_usage(ssids, cfg)
-
-                    lat, lon = 0, 0
-                    neighbour_macs = []
-                    if ap.get("snmp_location", None) is not None:
-                        try:
-                            lat, lon = get_location_by_address(
-                                ap["snmp_location"], geolookup
-                            )
-                        except Exception:
-                            pass
-                    try:
-                        neighbour_macs.append(cfg.offloader_mac.get(site["desc"], None))
-                        offloader_id = cfg.offloader_mac.get(site["desc"], "").replace(
-                            ":", ""
-                        )
-                        offloader = list(
-                            filter(
-                                lambda x: x["mac"]
-                                == cfg.offloader_mac.get(site["desc"], ""),
-                                ffnodes["nodes"],
-                            )
-                        )[0]
-                    except Exception:
-                        offloader_id = None
-                        offloader = {}
-                        pass
-                    uplink = ap.get("uplink", None)
-                    if uplink is not None and uplink.get("ap_mac", None) is not None:
-                        neighbour_macs.append(uplink.get("ap_mac"))
-                    lldp_table = ap.get("lldp_table", None)
-                    if lldp_table is not None:
-                        for lldp_entry in lldp_table:
-                            if not lldp_entry.get("is_wired", True):
-                                neighbour_macs.append(lldp_entry.get("chassis_id"))
-                    aps.accesspoints.append(
-                        Accesspoint(
-                            name=ap.get("name", None),
-                            mac=ap.get("mac", None),
-                            snmp_location=ap.get("snmp_location", None),
-                            client_count=client_count,
-                            client_count24=client_count24,
-                            client_count5=client_count5,
-                            channel5=channel5,
-                            rx_bytes5=rx_bytes5,
-                            tx_bytes5=tx_bytes5,
-                            channel24=channel24,
-                            rx_bytes24=rx_bytes24,
-                            tx_bytes24=tx_bytes24,
-                            latitude=float(lat),
-                            longitude=float(lon),
-                            model=ap.get("model", None),
-                            firmware=ap.get("version", None),
-                            uptime=ap.get("uptime", None),
-                            contact=ap.get("snmp_contact", None),
-                            load_avg=float(
-                                ap.get("sys_stats", {}).get("loadavg_1", 0.0)
-                            ),
-                            mem_used=ap.get("sys_stats", {}).get("mem_used", 0),
-                            mem_buffer=ap.get("sys_stats", {}).get("mem_buffer", 0),
-                            mem_total=ap.get("sys_stats", {}).get("mem_total", 0),
-                            tx_bytes=tx,
-                            rx_bytes=rx,
-                            gateway=offloader.get("gateway", None),
-                            gateway6=offloader.get("gateway6", None),
-                            gateway_nexthop=offloader_id,
-                            neighbour_macs=neighbour_macs,
-                            domain_code=offloader.get("domain", cfg.fallback_domain),
-                        )
+
+def in_shard(site, shard):
+    """This function returns True if a site belongs to a shard.
+
+    Sites are assigned by a hash of their description, so a site is always
+    collected by the same worker, also if it exists on more than one controller.
+    Arguments:
+        site: The site document.
+        shard: The index of the shard and the number of shards, or None for all sites.
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(site["desc"].encode()) % count == index
+
+
+def fetch_controller(controller, cfg, shard=None):
+    """This function fetches the sites of a controller and their devices and clients.
+
+    Returns the collected sites and the result of fetch_sites(), or None if the
+    controller could not be reached."""
+    with metrics.CONTROLLER_SECONDS.time(controller=controller.name, stage="fetch"):
+        try:
+            c = get_controller_session(cfg, controller)
+            with metrics.STAGE_SECONDS.time(stage="sites"):
+                sites = [
+                    site
+                    for site in c.get_sites()
+                    if controller.collects(site) and in_shard(site, shard)
+                ]
+        except Exception as ex:
+            logger.error("Error collecting controller %s: %s" % (controller.name, ex))
+            metrics.CONTROLLER_COLLECTIONS.inc(
+                controller=controller.name, result="failed"
+            )
+            return None
+        with metrics.STAGE_SECONDS.time(stage="fetch"):
+            fetched = fetch_sites(c, sites, cfg)
+    metrics.CONTROLLER_COLLECTIONS.inc(controller=controller.name, result="ok")
+    return sites, fetched
+
+
+def fetch_controllers(controllers, cfg, shard=None):
+    """This function fetches all controllers concurrently.
+    Returns the result of fetch_controller() per controller."""
+    if len(controllers) == 1:
+        return [fetch_controller(controllers[0], cfg, shard)]
+    with ThreadPoolExecutor(
+        max_workers=len(controllers), thread_name_prefix="controller"
+    ) as pool:
+        return list(
+            pool.map(
+                lambda controller: fetch_controller(controller, cfg, shard), controllers
+            )
+        )
+
+
+def get_controller_accesspoints(
+    controller, sites, fetched, cfg, matcher, nodes, geolookup
+):
+    """This function returns the Accesspoint objects of the sites of a controller,
+    sites that were not fetched keep their previous APs."""
+    controller_aps = []
+    for site in sites:
+        key = (controller.name, site["name"])
+        if site["name"] in fetched:
+            aps_for_site, clients = fetched.pop(site["name"])
+            site_aps = None
+            if not is_inventory_due(key, cfg):
+                with metrics.STAGE_SECONDS.time(stage="stats"):
+                    site_aps = update_site_accesspoints(
+                        site_accesspoints[key],
+                        aps_for_site,
+                        clients,
+                        cfg,
+                        matcher,
+                    )
+            if site_aps is None:
+                with metrics.STAGE_SECONDS.time(stage="inventory"):
+                    site_aps = get_site_accesspoints(
+                        site, aps_for_site, clients, cfg, matcher, nodes, geolookup
                     )
+                site_inventory[key] = time.monotonic()
+            site_accesspoints[key] = site_aps
+        elif key in site_accesspoints:
+            logger.warning("Keeping previous data of site %s" % site["desc"])
+        controller_aps.extend(site_accesspoints.get(key, []))
+    return controller_aps
+
+
+def prune_sessions(controllers, cfg):
+    """This function closes the sessions that no configured controller uses
+    anymore, e.g. after its credentials were changed in the config file."""
+    keys = {session_key(cfg, controller) for controller in controllers}
+    for key in list(controller_sessions):
+        if key not in keys:
+            controller_sessions.pop(key).close()
+
+
+def prune_sites(controllers):
+    """This function forgets the APs of sites and controllers that are no
+    longer collected, so they are neither answered for nor kept in memory."""
+    names = {controller.name for controller in controllers}
+    for name in list(controller_sites):
+        if name not in names:
+            del controller_sites[name]
+    current = {
+        (name, site["name"])
+        for name, sites in controller_sites.items()
+        for site in sites
+    }
+    for cache in (site_accesspoints, site_inventory):
+        for key in list(cache):
+            if key not in current:
+                del cache[key]
+
+
+def get_infos(shard=None):
+    """This function gathers all the information and returns a list of Accesspoint objects.
+
+    The controllers are fetched concurrently and merged in the configured
+    order, an AP reported by more than one controller is taken from the first.
+    A controller that cannot be reached keeps the APs of its previous
+    collection, None is returned if no controller could be reached. With a
+    shard, an (index, count) pair, only the sites of the shard are collected."""
+    global geocoder_failed
+    geocoder_failed = False
+    with metrics.STAGE_SECONDS.time(stage="config"):
+        cfg = config_manager.get_config()
+    with metrics.STAGE_SECONDS.time(stage="nodelist"):
+        nodes = get_nodelist(cfg)
+    controllers = cfg.get_controllers()
+    results = fetch_controllers(controllers, cfg, shard)
+    prune_sessions(controllers, cfg)
+    if all(result is None for result in results):
+        return
+    geolookup = get_geolocator()
+    matcher = get_matcher(cfg)
+    aps = Accesspoints(accesspoints=[])
+    seen = set()
+    for controller, result in zip(controllers, results):
+        if result is not None:
+            sites, fetched = result
+            controller_sites[controller.name] = sites
+        elif controller.name in controller_sites:
+            sites, fetched = controller_sites[controller.name], {}
+        else:
+            continue
+        with metrics.CONTROLLER_SECONDS.time(controller=controller.name, stage="build"):
+            controller_aps = get_controller_accesspoints(
+                controller, sites, fetched, cfg, matcher, nodes, geolookup
+            )
+        metrics.CONTROLLER_ACCESSPOINTS.set(
+            len(controller_aps), controller=controller.name
+        )
+        for ap in controller_aps:
+            if ap.mac in seen:
+                logger.debug(
+                    "Skipping AP %s of controller %s, it was already collected"
+                    % (ap.mac, controller.name)
+                )
+                continue
+            seen.add(ap.mac)
+            aps.accesspoints.append(ap)
+    prune_sites(controllers)
+    if geocache is not None:
+        geocache.flush()
     return aps
 
 